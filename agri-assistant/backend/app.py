@@ -7,15 +7,23 @@ import pymongo
 import time
 import random
 import re
+import base64
+import gzip
+import threading
+import statistics
+import glob
 from PIL import Image
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
 from dotenv import load_dotenv
 from urllib.parse import urlencode
 import google.generativeai as genai
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, timedelta, timezone
-from flask import Flask, request, jsonify, send_from_directory
+from zoneinfo import ZoneInfo
+from flask import Flask, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_caching import Cache
 from google.oauth2 import id_token
@@ -30,21 +38,79 @@ from itsdangerous import URLSafeTimedSerializer
 try:
     from local_data import (
         find_local_answer,
-        CROP_SUMMARY_DB,
         get_seasonal_advice,
         get_local_crop_recommendation,
         get_demo_pest_response,
         MOCK_MARKET_DATA,
+        MANDI_COORDINATES,
+        get_agro_climatic_zone,
+        AGRO_CLIMATIC_ZONES,
     )
     print("✅ Local knowledge base loaded successfully.")
 except ImportError as e:
     print(f"⚠️ local_data.py not found: {e} — local fallbacks disabled.")
     find_local_answer = lambda q: None
-    CROP_SUMMARY_DB = {}
     get_seasonal_advice = lambda loc="India": {"advice": "No advice available.", "news": "No news available.", "is_local": True}
     get_local_crop_recommendation = lambda s, se, st: None
     get_demo_pest_response = lambda c: {"identification": "AI model unavailable.", "treatment": "Please configure AI API key.", "suggested_products": []}
     MOCK_MARKET_DATA = []
+    MANDI_COORDINATES = {}
+    get_agro_climatic_zone = lambda state: None
+    AGRO_CLIMATIC_ZONES = {}
+
+# ============================================================
+# 🔎 TREATMENT KEYWORD MATCHER (Aho-Corasick, compiled once)
+# ============================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+try:
+    from keyword_matcher import KeywordMatcher
+    treatment_matcher = KeywordMatcher.from_file(os.path.join(BASE_DIR, "data", "agri_keywords.json"))
+    print(f"✅ Treatment keyword matcher compiled ({len(treatment_matcher.term_tags)} terms).")
+except (ImportError, OSError, ValueError) as e:
+    print(f"⚠️ Keyword matcher unavailable: {e} — product suggestions disabled.")
+    treatment_matcher = None
+
+try:
+    from market_table import MarketTable
+except ImportError as e:
+    print(f"⚠️ market_table unavailable: {e} — /market-prices will use the live API only.")
+    MarketTable = None
+
+from fertility_engine import (analyze_fertility, get_fertilizer_recommendation, fertility_batch,
+                              fertility_level_names, fertilizer_batch, fertilizer_plan_columns, parse_samples)
+
+# Crop doses, fertilizer contents, summaries and aliases for every agronomy
+# route; re-read by a background task when data/crops.json changes.
+from crop_registry import ReloadingRegistry, fertilizer_dose, normalize as normalize_crop_name
+crop_registry = ReloadingRegistry(os.path.join(BASE_DIR, "data", "crops.json"))
+print(f"✅ Crop registry v{crop_registry.current.version} loaded ({len(crop_registry.current)} crops).")
+CROP_REGISTRY_RELOAD_INTERVAL = 30  # seconds between mtime checks
+
+# Crop suitability ranking for /detailed-recommendation, compiled from the
+# registry's growing requirements and rebuilt when a new snapshot loads.
+from crop_scoring import CropScorer
+from weather_forecast import aggregate_forecast
+_crop_scorer = (None, None)  # (registry snapshot, scorer)
+_crop_scorer_lock = threading.Lock()
+
+
+def current_crop_scorer():
+    global _crop_scorer
+    registry, scorer = _crop_scorer
+    if registry is crop_registry.current:
+        return scorer
+    with _crop_scorer_lock:
+        registry = crop_registry.current
+        if _crop_scorer[0] is not registry:
+            _crop_scorer = (registry, CropScorer(registry, AGRO_CLIMATIC_ZONES))
+        return _crop_scorer[1]
+
+from market_cleaning import MarketCleaner, parse_price, parse_date
+try:
+    market_cleaner = MarketCleaner.from_file(os.path.join(BASE_DIR, "data", "market_aliases.json"))
+except (OSError, ValueError) as e:
+    print(f"⚠️ Market cleaning unavailable: {e} — Agmarknet records will be stored as received.")
+    market_cleaner = None
 
 # ==========================================================
 # 🔐 Load config first (before using JWT_SECRET)
@@ -74,12 +140,122 @@ DATA_GOV_API_KEY = os.getenv("DATA_GOV_API_KEY")
 app = Flask(__name__)
 
 # Enable CORS for all origins in production to allow frontend access
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "X-Total-Count"])
 
 # Cache configuration
-app.config["CACHE_TYPE"] = "SimpleCache"
+# SimpleCache is per-process; set CACHE_TYPE=RedisCache + CACHE_REDIS_URL to
+# share caches (and single-flight locks) across gunicorn workers.
+app.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "SimpleCache")
 app.config["CACHE_DEFAULT_TIMEOUT"] = 900
+if os.getenv("CACHE_REDIS_URL"):
+    app.config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL")
 cache = Cache(app)
+SHARED_CACHE = app.config["CACHE_TYPE"] not in ("SimpleCache", "NullCache", "simple", "null")
+
+# ---------------- Response Compression ----------------
+# JSON/text bodies above COMPRESS_MIN_SIZE are compressed with the best
+# encoding the client accepts: brotli (Brotli is in requirements.txt), or gzip
+# if that package is missing. Routes wrapped in @cached_compressed keep each
+# encoding already compressed in the cache, so a repeat hit skips the view,
+# JSON serialization and compression entirely.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = ("application/json", "text/html", "text/plain", "text/csv")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5           # ~gzip speed, noticeably smaller output
+CACHED_PASSTHROUGH_HEADERS = ("X-Total-Count", "X-Next-Cursor")
+
+
+def negotiate_encoding():
+    """'br', 'gzip' or None, from the request's Accept-Encoding."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    """Compresses uncached responses; streamed, passthrough and already-encoded bodies are left alone."""
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding:
+        response.set_data(compress_body(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def content_version(name):
+    """Change counter kept in db.meta (bumped on writes); used to tag cache keys."""
+    if db is None:
+        return 0
+    doc = db.meta.find_one({"_id": name}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+
+def cached_compressed(timeout, version=None):
+    """
+    Caches a GET view's 200 response per (path, query string, version()) and
+    stores each negotiated encoding precompressed alongside the raw body.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tag = version() if version else ""
+            key = f"resp:{request.path}?{urlencode(sorted(request.args.items(multi=True)))}#{tag}"
+            entry = cache.get(key)
+            dirty = entry is None
+            if entry is None:
+                cache_stats[f"{fn.__name__}.miss"] += 1
+                response = app.make_response(fn(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+                    return response
+                entry = {
+                    "mimetype": response.mimetype,
+                    "headers": [(h, response.headers[h]) for h in CACHED_PASSTHROUGH_HEADERS if h in response.headers],
+                    "identity": response.get_data(),
+                    "expires": time.time() + timeout,
+                }
+            else:
+                cache_stats[f"{fn.__name__}.hit"] += 1
+
+            large = len(entry["identity"]) >= COMPRESS_MIN_SIZE
+            encoding = negotiate_encoding() if large else None
+            body = entry.get(encoding or "identity")
+            if body is None:
+                body = entry[encoding] = compress_body(entry["identity"], encoding)
+                dirty = True
+            if dirty:
+                cache.set(key, entry, timeout=max(1, int(entry["expires"] - time.time())))
+
+            response = app.response_class(body, mimetype=entry["mimetype"])
+            for header, value in entry["headers"]:
+                response.headers[header] = value
+            if large:
+                response.vary.add("Accept-Encoding")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            return response
+        return wrapper
+    return decorator
 
 @app.route("/google-login", methods=["POST"])
 def google_login():
@@ -223,6 +399,8 @@ if db is not None:
     try:
         # User indexes
         db.users.create_index("username", unique=True)
+        db.users.create_index("last_active")
+        db.users.create_index([("default_geo", pymongo.GEOSPHERE)])
         print("✅ Username index ensured.")
         
         # Post indexes
@@ -234,9 +412,23 @@ if db is not None:
         db.products.create_index([("name", "text"), ("description", "text")])
         db.products.create_index("tags") 
         db.products.create_index("category")
+        db.products.create_index("updatedAt")
+        db.product_facets.create_index([("kind", pymongo.ASCENDING), ("count", pymongo.DESCENDING)])
+        db.reservations.create_index([("status", pymongo.ASCENDING), ("expiresAt", pymongo.ASCENDING)])
+        db.reservations.create_index([("buyer_id", pymongo.ASCENDING), ("createdAt", pymongo.DESCENDING)])
+        db.reservations.create_index("purgeAt", expireAfterSeconds=0)  # TTL cleanup of released holds
         print("✅ Product marketplace indexes ensured.")
         # --- End Tier 1 ---
 
+        db.soil_jobs.create_index([("user_id", pymongo.ASCENDING), ("createdAt", pymongo.DESCENDING)])
+        db.soil_jobs.create_index([("status", pymongo.ASCENDING), ("heartbeat", pymongo.ASCENDING)])
+        print("✅ Soil job indexes ensured.")
+
+        db.crop_summaries.create_index("key", unique=True)
+        db.crop_summaries.create_index("aliases")
+        db.task_leases.create_index("until", expireAfterSeconds=0)  # expired leases (e.g. per-crop ones) are purged
+        print("✅ Crop summary indexes ensured.")
+
     except Exception as e:
         print(f"⚠️ Error creating indexes: {e}")
 
@@ -276,7 +468,23 @@ def login():
         return jsonify({"token": token})
     return jsonify({"error": "Invalid credentials"}), 401
 
-# --- Auth Helper (Unchanged) ---
+# --- Auth Helper ---
+LAST_ACTIVE_RESOLUTION = timedelta(minutes=10)  # at most one activity write per user per 10 min
+
+
+def touch_last_active(user):
+    """Records that the user is active (used by the weather pre-warmer)."""
+    now = datetime.now(timezone.utc)
+    last = user.get("last_active")
+    if last is not None and last.tzinfo is None:
+        last = last.replace(tzinfo=timezone.utc)
+    if last is None or now - last > LAST_ACTIVE_RESOLUTION:
+        try:
+            db.users.update_one({"_id": user["_id"]}, {"$set": {"last_active": now}})
+        except Exception as e:
+            print(f"⚠️ Could not record activity: {e}")
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -296,6 +504,7 @@ def token_required(f):
             current_user = db.users.find_one({"_id": user_id})
             if not current_user:
                 return jsonify({'error': 'User not found.'}), 404
+            touch_last_active(current_user)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired!'}), 401
         except jwt.InvalidTokenError:
@@ -379,6 +588,9 @@ def update_profile(current_user):
         update_fields = {}
         if new_location:
             update_fields["default_location"] = new_location
+            place = resolve_location(new_location)
+            if place and place.get("lat") is not None:
+                update_fields["default_geo"] = geo_point(place["lat"], place["lon"])
         if new_name:
             update_fields["full_name"] = new_name
         db.users.update_one(
@@ -394,27 +606,243 @@ def update_profile(current_user):
         print(f"Profile update error: {e}")
         return jsonify({"error": "Database error."}), 500
 
+# ---------------- Location Normalization ----------------
+# Free-text locations ("Delhi", "delhi ", "New Delhi, India") are resolved once
+# through a cached geocode lookup to a canonical id. Weather caches are keyed on
+# that id, so every spelling of a place shares one cache entry.
+#   geo:<lat>,<lon>  -> 0.1° grid cell (~11 km) from the geocoder
+#   q:<text>         -> fallback when geocoding is unavailable
+GEOCODE_CACHE_TIMEOUT = 7 * 24 * 3600
+LOCATION_GRID = 0.1
+LOCATION_ALIASES = {
+    "new delhi": "delhi", "ncr": "delhi", "bombay": "mumbai", "calcutta": "kolkata",
+    "madras": "chennai", "bangalore": "bengaluru", "gurgaon": "gurugram",
+    "mysore": "mysuru", "poona": "pune", "baroda": "vadodara", "trivandrum": "thiruvananthapuram",
+    "cochin": "kochi", "calicut": "kozhikode", "benares": "varanasi", "banaras": "varanasi",
+}
+
+
+def normalize_location_text(text):
+    """'  New Delhi , India ' -> 'delhi' (lowercase, trimmed, country dropped, aliases applied)."""
+    parts = [" ".join(p.split()) for p in str(text or "").lower().split(",")]
+    parts = [p for p in parts if p and p != "india"]
+    if not parts:
+        return ""
+    parts[0] = LOCATION_ALIASES.get(parts[0], parts[0])
+    return ", ".join(parts)
+
+
+def location_id_for(lat, lon):
+    step = LOCATION_GRID
+    return f"geo:{round(round(lat / step) * step, 1)},{round(round(lon / step) * step, 1)}"
+
+
+def weather_query(location_id):
+    """OpenWeatherMap query-string fragment for a canonical location id."""
+    if location_id.startswith("geo:"):
+        lat, lon = location_id[4:].split(",")
+        return f"lat={lat}&lon={lon}"
+    return urlencode({"q": location_id[2:] if location_id.startswith("q:") else location_id})
+
+
+# Only real geocode hits are cached; fallbacks are retried on the next request.
+@cache.memoize(timeout=GEOCODE_CACHE_TIMEOUT, response_filter=lambda loc: loc["id"].startswith("geo:"))
+def geocode_location(normalized):
+    """Resolves normalized location text to a canonical location. Persisted in Mongo so it is resolved once cluster-wide."""
+    fallback = {"id": f"q:{normalized.split(',')[0]}", "name": normalized.split(",")[0].title(),
+                "state": None, "lat": None, "lon": None}
+    if not WEATHER_API_KEY:
+        return fallback
+
+    if db is not None:
+        stored = db.geocodes.find_one({"_id": normalized})
+        if stored:
+            return stored["location"]
+
+    try:
+        city = normalized.split(",")[0]
+        url = (f"http://api.openweathermap.org/geo/1.0/direct?"
+               f"{urlencode({'q': f'{city},IN', 'limit': 1, 'appid': WEATHER_API_KEY})}")
+        results = requests.get(url, timeout=5).json()
+        if not isinstance(results, list) or not results:
+            return fallback
+        hit = results[0]
+        location = {
+            "id": location_id_for(hit["lat"], hit["lon"]),
+            "name": hit.get("name") or city.title(),
+            "state": hit.get("state"),
+            "lat": hit["lat"],
+            "lon": hit["lon"],
+        }
+        if db is not None:
+            db.geocodes.update_one(
+                {"_id": normalized},
+                {"$set": {"location": location, "createdAt": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        return location
+    except Exception as e:
+        print(f"⚠️ Geocode error for '{normalized}': {e}")
+        return fallback
+
+
+def resolve_location(text):
+    """Free text -> canonical location dict ({id, name, state, lat, lon}), or None if empty."""
+    normalized = normalize_location_text(text)
+    if not normalized:
+        return None
+    return geocode_location(normalized)
+
+
+# ---------------- Stale-While-Revalidate Cache ----------------
+# Weather entries stay "fresh" for `fresh_for` seconds and are then served
+# stale for up to `stale_for` more while ONE background refresh runs.
+# Concurrent misses for the same key coalesce onto a single upstream fetch:
+# threads via an in-process flight table, workers via a cache.add() lock
+# (atomic on Redis/Memcached backends).
+SWR_LOCK_TIMEOUT = 30      # max seconds a fetch may hold the cross-worker lock
+SWR_WAIT_TIMEOUT = 6       # max seconds a follower waits for the leader's result
+SWR_ERROR_TIMEOUT = 60     # error results are cached briefly and never replace good data
+cache_stats = Counter()    # "<fn>.<hit|stale|miss|upstream>" -> count (per worker)
+_swr_inflight = {}
+_swr_inflight_lock = threading.Lock()
+_swr_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+
+
+def is_error_result(value):
+    return isinstance(value, dict) and "error" in value
+
+
+def swr_cached(fresh_for, stale_for):
+    def decorator(fn):
+        name = fn.__name__
+
+        def key_for(args):
+            return f"swr:{name}:" + ":".join(str(a) for a in args)
+
+        def store(value, *args):
+            if is_error_result(value):
+                fresh, timeout = SWR_ERROR_TIMEOUT, SWR_ERROR_TIMEOUT
+            else:
+                fresh, timeout = fresh_for, fresh_for + stale_for
+            cache.set(key_for(args), {"value": value, "fresh_until": time.time() + fresh}, timeout=timeout)
+
+        def fetch_and_store(key, args):
+            cache_stats[f"{name}.upstream"] += 1
+            value = fn(*args)
+            if is_error_result(value):
+                existing = cache.get(key)
+                if existing and not is_error_result(existing["value"]):
+                    # Keep serving the last good value, but only retry upstream after SWR_ERROR_TIMEOUT
+                    cache.set(key, {"value": existing["value"], "fresh_until": time.time() + SWR_ERROR_TIMEOUT},
+                              timeout=SWR_ERROR_TIMEOUT + stale_for)
+                    return existing["value"]
+            store(value, *args)
+            return value
+
+        def single_flight(key, args, background):
+            with _swr_inflight_lock:
+                event = _swr_inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = _swr_inflight[key] = threading.Event()
+            if not leader:
+                if background:
+                    return None
+                event.wait(SWR_WAIT_TIMEOUT)
+                entry = cache.get(key)
+                return entry["value"] if entry else fetch_and_store(key, args)
+
+            lock_key = f"{key}:lock"
+            try:
+                if cache.add(lock_key, os.getpid(), timeout=SWR_LOCK_TIMEOUT):
+                    try:
+                        # Another worker may have stored a fresh value and released the lock since our miss
+                        entry = cache.get(key)
+                        if entry and time.time() < entry["fresh_until"]:
+                            return entry["value"]
+                        return fetch_and_store(key, args)
+                    finally:
+                        cache.delete(lock_key)
+                if background:
+                    return None  # another worker is already refreshing
+                deadline = time.monotonic() + SWR_WAIT_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    entry = cache.get(key)
+                    if entry:
+                        return entry["value"]
+                return fetch_and_store(key, args)
+            finally:
+                with _swr_inflight_lock:
+                    _swr_inflight.pop(key, None)
+                event.set()
+
+        @wraps(fn)
+        def wrapper(*args):
+            key = key_for(args)
+            entry = cache.get(key)
+            if entry is not None:
+                if time.time() < entry["fresh_until"]:
+                    cache_stats[f"{name}.hit"] += 1
+                else:
+                    cache_stats[f"{name}.stale"] += 1
+                    _swr_executor.submit(single_flight, key, args, True)
+                return entry["value"]
+            cache_stats[f"{name}.miss"] += 1
+            return single_flight(key, args, False)
+
+        wrapper.uncached = fn
+        wrapper.store = store
+        wrapper.refresh = lambda *args: fetch_and_store(key_for(args), args)
+        return wrapper
+    return decorator
+
+
 # ---------------- Caching Helpers (UPDATED) ----------------
-@cache.memoize(timeout=900) # Cache for 15 minutes
-def get_weather(city):
-    """ Fetches current weather. Results are cached. """
+def parse_current_weather(data):
+    """OpenWeatherMap current-weather payload -> the shape the frontend expects."""
+    return {
+        "temperature": data["main"]["temp"],
+        "condition": data["weather"][0]["description"].title(),
+        "humidity": data["main"]["humidity"],
+        "wind_speed": data["wind"]["speed"] * 3.6, # km/h
+        "city_name": data["name"],
+        "icon": data["weather"][0]["icon"]
+    }
+
+
+# OpenWeatherMap city ids per canonical location, learned from weather
+# responses; lets the pre-warmer batch refreshes through the /group endpoint.
+_owm_city_ids = {}
+
+
+def remember_owm_city_id(location_id, owm_id):
+    if not owm_id or _owm_city_ids.get(location_id) == owm_id:
+        return
+    _owm_city_ids[location_id] = owm_id
+    if db is not None:
+        try:
+            db.weather_locations.update_one({"_id": location_id}, {"$set": {"owm_id": owm_id}}, upsert=True)
+        except Exception as e:
+            print(f"⚠️ Could not store OWM city id: {e}")
+
+
+@swr_cached(fresh_for=900, stale_for=3600)  # Fresh 15 min, served stale up to 1 h while refreshing
+def get_weather(location_id):
+    """ Fetches current weather for a canonical location id. Results are cached. """
     if not WEATHER_API_KEY: return {"error": "Weather API key not set"}
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric"
+        url = f"http://api.openweathermap.org/data/2.5/weather?{weather_query(location_id)}&appid={WEATHER_API_KEY}&units=metric"
         
         # --- FIX: Added timeout=5 to prevent hanging ---
         data = requests.get(url, timeout=5).json() 
         
         if data["cod"] != 200:
             return {"error": data.get("message", "City not found")}
-        return {
-            "temperature": data["main"]["temp"],
-            "condition": data["weather"][0]["description"].title(),
-            "humidity": data["main"]["humidity"],
-            "wind_speed": data["wind"]["speed"] * 3.6, # km/h
-            "city_name": data["name"],
-            "icon": data["weather"][0]["icon"]
-        }
+        remember_owm_city_id(location_id, data.get("id"))
+        record_weather_observation(location_id, data)
+        return parse_current_weather(data)
     except requests.exceptions.Timeout:
         print("❌ Weather API timed out.")
         return {"error": "Weather service is not responding. Please try again later."}
@@ -422,12 +850,13 @@ def get_weather(city):
         print(f"Weather API error: {e}")
         return {"error": "Weather API error"}
 
-@cache.memoize(timeout=900) # Cache for 15 minutes
-def get_5_day_forecast(city):
-    """ Fetches 5-day forecast. Results are cached. """
+
+@swr_cached(fresh_for=900, stale_for=3600)  # Fresh 15 min, served stale up to 1 h while refreshing
+def get_5_day_forecast(location_id):
+    """ Fetches 5-day forecast for a canonical location id. Results are cached. """
     if not WEATHER_API_KEY: return {"error": "Weather API key not set"}
     try:
-        url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={WEATHER_API_KEY}&units=metric"
+        url = f"http://api.openweathermap.org/data/2.5/forecast?{weather_query(location_id)}&appid={WEATHER_API_KEY}&units=metric"
         
         # --- FIX: Added timeout=5 to prevent hanging ---
         data = requests.get(url, timeout=5).json()
@@ -435,32 +864,9 @@ def get_5_day_forecast(city):
         if data["cod"] != "200":
             return {"error": data.get("message", "Forecast not found")}
         
-        daily_forecasts = {}
-        for entry in data["list"]:
-            date_str = datetime.fromtimestamp(entry["dt"]).strftime('%Y-%m-%d')
-            if date_str not in daily_forecasts:
-                daily_forecasts[date_str] = {
-                    "day_name": datetime.fromtimestamp(entry["dt"]).strftime('%A'),
-                    "min_temp": entry["main"]["temp_min"], "max_temp": entry["main"]["temp_max"],
-                    "conditions": [entry["weather"][0]["description"]], "icon": entry["weather"][0]["icon"]
-                }
-            else:
-                # Update min/max temps for the day
-                daily_forecasts[date_str]["min_temp"] = min(daily_forecasts[date_str]["min_temp"], entry["main"]["temp_min"])
-                daily_forecasts[date_str]["max_temp"] = max(daily_forecasts[date_str]["max_temp"], entry["main"]["temp_max"])
-                daily_forecasts[date_str]["conditions"].append(entry["weather"][0]["description"])
-        
-        final_forecast = []
-        for date_key in sorted(daily_forecasts.keys())[:5]: # Get up to 5 days
-            day_data = daily_forecasts[date_key]
-            # Find the most common condition for the day
-            most_common_condition = max(set(day_data["conditions"]), key=day_data["conditions"].count)
-            final_forecast.append({
-                "day": day_data["day_name"], "date": date_key,
-                "min_temp": round(day_data["min_temp"]), "max_temp": round(day_data["max_temp"]),
-                "condition": most_common_condition.title(), "icon": day_data["icon"]
-            })
-        return final_forecast
+        forecast = aggregate_forecast(data)
+        record_forecast_snapshot(location_id, forecast)
+        return forecast
     except requests.exceptions.Timeout:
         print("❌ Forecast API timed out.")
         return {"error": "Forecast service is not responding. Please try again later."}
@@ -468,25 +874,343 @@ def get_5_day_forecast(city):
         print(f"Forecast API error: {e}")
         return {"error": "Forecast API error"}
 
+# ---------------- Weather Cache Pre-Warmer ----------------
+# Refreshes current weather + forecast for locations of recently active users
+# before their 15-minute cache entries expire, so dashboards hit a warm cache.
+WEATHER_WARM_INTERVAL = 600               # seconds; shorter than the 900s weather TTL
+WEATHER_ACTIVE_WINDOW = timedelta(days=3)
+WEATHER_WARM_MAX_LOCATIONS = 200
+OWM_GROUP_BATCH = 20                      # /group accepts at most 20 city ids
+
+
+def active_location_ids():
+    """Canonical ids of the most common default locations among recently active users."""
+    cutoff = datetime.now(timezone.utc) - WEATHER_ACTIVE_WINDOW
+    rows = db.users.aggregate([
+        {"$match": {"last_active": {"$gte": cutoff}}},
+        {"$group": {"_id": "$default_location", "users": {"$sum": 1}}},
+        {"$sort": {"users": -1}},
+        {"$limit": WEATHER_WARM_MAX_LOCATIONS},
+    ])
+    location_ids = []
+    for row in rows:
+        place = resolve_location(row["_id"] or "Delhi")  # dashboard default
+        if place and place["id"] not in location_ids:
+            location_ids.append(place["id"])
+    return location_ids
+
+
+def refresh_current_weather_group(location_ids):
+    """Refreshes current weather for up to 20 locations with one /group call; returns ids refreshed."""
+    by_owm_id = {_owm_city_ids[loc]: loc for loc in location_ids}
+    url = (f"http://api.openweathermap.org/data/2.5/group?"
+           f"id={','.join(str(i) for i in by_owm_id)}&appid={WEATHER_API_KEY}&units=metric")
+    data = requests.get(url, timeout=5).json()
+    refreshed = []
+    for entry in data.get("list", []):
+        location_id = by_owm_id.get(entry.get("id"))
+        if location_id:
+            record_weather_observation(location_id, entry)
+            get_weather.store(parse_current_weather(entry), location_id)
+            refreshed.append(location_id)
+    return refreshed
+
+
+def warm_weather_caches():
+    if db is None or not WEATHER_API_KEY:
+        return
+    started = time.perf_counter()
+    location_ids = active_location_ids()
+    unknown = [loc for loc in location_ids if loc not in _owm_city_ids]
+    if unknown:
+        for doc in db.weather_locations.find({"_id": {"$in": unknown}}):
+            _owm_city_ids.setdefault(doc["_id"], doc["owm_id"])
+
+    grouped = [loc for loc in location_ids if loc in _owm_city_ids]
+    refreshed = set()
+    for i in range(0, len(grouped), OWM_GROUP_BATCH):
+        try:
+            refreshed.update(refresh_current_weather_group(grouped[i:i + OWM_GROUP_BATCH]))
+        except Exception as e:
+            print(f"⚠️ Weather group refresh failed: {e}")
+
+    for location_id in location_ids:
+        if location_id not in refreshed:
+            get_weather.refresh(location_id)
+        get_5_day_forecast.refresh(location_id)
+
+    print(f"🌤 Warmed weather for {len(location_ids)} locations "
+          f"({len(refreshed)} via /group) in {time.perf_counter() - started:.1f}s")
+
+
+# ---------------- Weather Observation Store ----------------
+# Every upstream weather/forecast fetch is persisted so trends (rain in the
+# last 7 days, heat-stress days) can be answered without new API calls.
+#   weather_observations: MongoDB time-series collection (bucketed by
+#       location + kind), raw samples kept WEATHER_RAW_RETENTION_DAYS
+#   weather_daily: per location/day rollup (downsampled), kept much longer
+WEATHER_RAW_RETENTION_DAYS = 30
+WEATHER_DAILY_RETENTION_DAYS = 730
+WEATHER_ROLLUP_INTERVAL = 3600
+HEAT_STRESS_TEMP = 35          # °C daily max counted as a heat-stress day
+WEATHER_TZ = "Asia/Kolkata"    # day boundaries for daily rollups
+WEATHER_ZONE = ZoneInfo(WEATHER_TZ)
+
+
+def weather_day_start(days_back=0):
+    """UTC instant of local (WEATHER_TZ) midnight `days_back` days before today."""
+    midnight = datetime.now(WEATHER_ZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - timedelta(days=days_back)).astimezone(timezone.utc)
+
+
+def ensure_weather_store():
+    """Creates the time-series collection (falls back to a TTL-indexed collection on old MongoDB)."""
+    if "weather_observations" not in db.list_collection_names():
+        try:
+            db.create_collection(
+                "weather_observations",
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=WEATHER_RAW_RETENTION_DAYS * 86400,
+            )
+        except Exception as e:
+            print(f"⚠️ Time-series collections unavailable ({e}); using a plain collection.")
+            db.weather_observations.create_index("ts", expireAfterSeconds=WEATHER_RAW_RETENTION_DAYS * 86400)
+    db.weather_observations.create_index([("meta.location", pymongo.ASCENDING), ("meta.kind", pymongo.ASCENDING), ("ts", pymongo.ASCENDING)])
+    db.weather_daily.create_index([("location", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+    db.weather_daily.create_index("expireAt", expireAfterSeconds=0)
+
+
+if db is not None:
+    try:
+        ensure_weather_store()
+        print("✅ Weather observation store ready.")
+    except Exception as e:
+        print(f"⚠️ Error preparing weather store: {e}")
+
+
+def record_weather_observation(location_id, data):
+    """Persists one current-weather sample (raw OpenWeatherMap payload)."""
+    if db is None:
+        return
+    try:
+        db.weather_observations.insert_one({
+            "ts": datetime.fromtimestamp(data.get("dt") or time.time(), timezone.utc),
+            "meta": {"location": location_id, "kind": "current"},
+            "temperature": data["main"]["temp"],
+            "humidity": data["main"]["humidity"],
+            "wind_speed": round(data["wind"]["speed"] * 3.6, 1),
+            "rain_1h": (data.get("rain") or {}).get("1h", 0),
+            "condition": data["weather"][0]["description"].title(),
+        })
+    except Exception as e:
+        print(f"⚠️ Could not record weather observation: {e}")
+
+
+def record_forecast_snapshot(location_id, forecast):
+    """Persists the aggregated forecast days as fetched (for forecast-vs-actual trends)."""
+    if db is None or not forecast:
+        return
+    fetched_at = datetime.now(timezone.utc)
+    try:
+        db.weather_observations.insert_many([{
+            "ts": fetched_at,
+            "meta": {"location": location_id, "kind": "forecast"},
+            "date": day["date"],
+            "min_temp": day["min_temp"],
+            "max_temp": day["max_temp"],
+            "rain_mm": day.get("rain_mm", 0),
+            "condition": day["condition"],
+        } for day in forecast])
+    except Exception as e:
+        print(f"⚠️ Could not record forecast snapshot: {e}")
+
+
+def rollup_weather_daily(days=2):
+    """Downsamples recent raw observations into weather_daily (idempotent upserts)."""
+    if db is None:
+        return
+    # Whole local days only: a window starting mid-day would overwrite that day's rollup with a partial one
+    since = weather_day_start(days)
+    pipeline = [
+        {"$match": {"meta.kind": "current", "ts": {"$gte": since}}},
+        # Hourly first so overlapping 1h rain readings aren't double counted
+        {"$group": {
+            "_id": {"location": "$meta.location",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts", "timezone": WEATHER_TZ}},
+                    "hour": {"$hour": {"date": "$ts", "timezone": WEATHER_TZ}}},
+            "temp_min": {"$min": "$temperature"}, "temp_max": {"$max": "$temperature"},
+            "temp_sum": {"$sum": "$temperature"}, "humidity_sum": {"$sum": "$humidity"},
+            "rain": {"$max": "$rain_1h"}, "samples": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"location": "$_id.location", "date": "$_id.date"},
+            "temp_min": {"$min": "$temp_min"}, "temp_max": {"$max": "$temp_max"},
+            "temp_sum": {"$sum": "$temp_sum"}, "humidity_sum": {"$sum": "$humidity_sum"},
+            "rain_mm": {"$sum": "$rain"}, "samples": {"$sum": "$samples"},
+        }},
+    ]
+    expire_at = datetime.now(timezone.utc) + timedelta(days=WEATHER_DAILY_RETENTION_DAYS)
+    ops = [pymongo.UpdateOne(
+        {"_id": f"{row['_id']['location']}|{row['_id']['date']}"},
+        {"$set": {
+            "location": row["_id"]["location"], "date": row["_id"]["date"],
+            "temp_min": row["temp_min"], "temp_max": row["temp_max"],
+            "temp_avg": round(row["temp_sum"] / row["samples"], 1),
+            "humidity_avg": round(row["humidity_sum"] / row["samples"]),
+            "rain_mm": round(row["rain_mm"], 1), "samples": row["samples"], "expireAt": expire_at,
+        }},
+        upsert=True
+    ) for row in db.weather_observations.aggregate(pipeline)]
+    if ops:
+        db.weather_daily.bulk_write(ops, ordered=False)
+    print(f"✅ Weather daily rollup updated ({len(ops)} location-days).")
+
+
+def history_window():
+    """Parses ?days= (default 7), clamped to the rollup retention."""
+    try:
+        return min(max(int(request.args.get("days", 7)), 1), WEATHER_DAILY_RETENTION_DAYS)
+    except ValueError:
+        return 7
+
+
+@app.route("/weather/history", methods=["GET"])
+def weather_history_route():
+    """Raw recorded observations for a location: /weather/history?city=Pune&days=7"""
+    place = resolve_location(request.args.get("city"))
+    if not place:
+        return jsonify({"error": "City parameter is required."}), 400
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    days = min(history_window(), WEATHER_RAW_RETENTION_DAYS)
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    try:
+        rows = db.weather_observations.find(
+            {"meta.location": place["id"], "meta.kind": "current", "ts": {"$gte": since}},
+            {"_id": 0, "meta": 0}
+        ).sort("ts", 1)
+        observations = [{**row, "ts": row["ts"].isoformat()} for row in rows]
+        return jsonify({"location": place["name"], "days": days, "observations": observations})
+    except Exception as e:
+        print(f"Weather history error: {e}")
+        return jsonify({"error": "Could not load weather history."}), 500
+
+
+@app.route("/weather/summary", methods=["GET"])
+def weather_summary_route():
+    """Daily aggregates + trend totals from the rollup store: /weather/summary?city=Pune&days=7"""
+    place = resolve_location(request.args.get("city"))
+    if not place:
+        return jsonify({"error": "City parameter is required."}), 400
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    days = history_window()
+    since = (datetime.now(WEATHER_ZONE) - timedelta(days=days)).strftime("%Y-%m-%d")  # dates are keyed in WEATHER_TZ
+    try:
+        daily = list(db.weather_daily.find(
+            {"location": place["id"], "date": {"$gte": since}},
+            {"_id": 0, "location": 0, "expireAt": 0}
+        ).sort("date", 1))
+        return jsonify({
+            "location": place["name"],
+            "days": days,
+            "rain_total_mm": round(sum(d["rain_mm"] for d in daily), 1),
+            "heat_stress_days": sum(1 for d in daily if d["temp_max"] >= HEAT_STRESS_TEMP),
+            "temp_max": max((d["temp_max"] for d in daily), default=None),
+            "temp_min": min((d["temp_min"] for d in daily), default=None),
+            "daily": daily,
+        })
+    except Exception as e:
+        print(f"Weather summary error: {e}")
+        return jsonify({"error": "Could not load weather summary."}), 500
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats_route():
+    """Per-worker cache counters with derived hit rates (for verifying cache effectiveness)."""
+    stats = dict(cache_stats)
+    rates = {}
+    for name in {key.split(".")[0] for key in stats}:
+        hits = stats.get(f"{name}.hit", 0) + stats.get(f"{name}.stale", 0)
+        lookups = hits + stats.get(f"{name}.miss", 0)
+        if name == "get_agri_advice":
+            lookups = stats.get(f"{name}.calls", 0)
+            hits = lookups - stats.get(f"{name}.miss", 0)
+        if lookups:
+            rates[name] = round(hits / lookups, 3)
+    return jsonify({"worker_pid": os.getpid(), "counters": stats, "hit_rates": rates})
+
+
+# ---------------- AI Advice (keyed on a quantized weather profile) ----------------
+# Raw floats (31.47°C, 11.16 km/h) change on every refresh, so advice is keyed
+# on banded features instead. Gemini output is then reused across refreshes
+# and across cities in the same agro-climatic zone with similar weather.
+TEMP_BAND = 5        # °C
+HUMIDITY_BAND = 20   # %
+RAIN_DAY_MM = 1.0    # forecast days with at least this much rain count as rain days
+CONDITION_GROUPS = [
+    ("thunderstorm", "Thunderstorm"), ("storm", "Thunderstorm"), ("rain", "Rain"),
+    ("drizzle", "Rain"), ("shower", "Rain"), ("snow", "Snow"), ("fog", "Fog/Haze"),
+    ("mist", "Fog/Haze"), ("haze", "Fog/Haze"), ("smoke", "Fog/Haze"), ("dust", "Dust"),
+    ("cloud", "Cloudy"), ("overcast", "Cloudy"), ("clear", "Clear"), ("sun", "Clear"),
+]
+
+
+def condition_group(condition):
+    condition = (condition or "").lower()
+    for keyword, group in CONDITION_GROUPS:
+        if keyword in condition:
+            return group
+    return "Other"
+
+
+def band(value, width):
+    low = int(value // width * width)
+    return f"{low}-{low + width}"
+
+
+def weather_profile(current_weather, forecast, place):
+    """Quantized, hashable weather features used as the advice cache key."""
+    forecast = forecast or []
+    dominant = Counter(condition_group(d["condition"]) for d in forecast).most_common(1)
+    rain_days = sum(1 for d in forecast
+                    if d.get("rain_mm", 0) >= RAIN_DAY_MM or condition_group(d["condition"]) in ("Rain", "Thunderstorm"))
+    zone = get_agro_climatic_zone(place.get("state")) or place["name"]
+    return (
+        ("zone", zone),
+        ("temp_band", band(current_weather["temperature"], TEMP_BAND)),
+        ("humidity_band", band(current_weather["humidity"], HUMIDITY_BAND)),
+        ("current_condition", condition_group(current_weather["condition"])),
+        ("forecast_condition", dominant[0][0] if dominant else "Unknown"),
+        ("forecast_max_band", band(max(d["max_temp"] for d in forecast), TEMP_BAND) if forecast else "n/a"),
+        ("rain_days", rain_days),
+        ("forecast_days", len(forecast)),
+    )
+
+
+def advice_for_weather(current_weather, forecast, place):
+    """Returns cached (or freshly generated) advice for the quantized weather profile."""
+    cache_stats["get_agri_advice.calls"] += 1
+    return get_agri_advice(weather_profile(current_weather, forecast, place))
+
+
 # --- UPDATED CACHE TIMEOUT ---
 @cache.memoize(timeout=21600)  # Cache for 6 hours
-def get_agri_advice(current_weather_tuple, forecast_tuple, city):
-    """Generates AI-based agricultural advice using weather data."""
-    current_weather = dict(current_weather_tuple)
-    forecast = [dict(day) for day in forecast_tuple]
+def get_agri_advice(profile):
+    """Generates AI-based agricultural advice for a quantized weather profile."""
+    cache_stats["get_agri_advice.miss"] += 1
+    p = dict(profile)
 
     if not model:
         return "Error: AI model not configured."
 
     try:
         prompt = (
-            f"You are an expert agricultural advisor for India. A farmer in {city} needs advice.\n"
-            f"Current weather: {current_weather['condition']}, {current_weather['temperature']}°C, {current_weather['humidity']}% humidity.\n"
-            f"5-day forecast:\n"
-        )
-        for day in forecast:
-            prompt += f"- {day['day']}: Max {day['max_temp']}°C, Min {day['min_temp']}°C, {day['condition']}\n"
-        prompt += (
+            f"You are an expert agricultural advisor for India. A farmer in the {p['zone']} "
+            f"agro-climatic region needs advice.\n"
+            f"Current weather: {p['current_condition']}, {p['temp_band']}°C, {p['humidity_band']}% humidity.\n"
+            f"Next {p['forecast_days']} days: mostly {p['forecast_condition']}, "
+            f"max temperatures around {p['forecast_max_band']}°C, {p['rain_days']} rainy day(s).\n"
             "\nBased ONLY on this weather, provide 3-5 concise bullet points of agricultural advice "
             "(cover irrigation, pest protection, and livestock care)."
         )
@@ -536,6 +1260,56 @@ def get_ai_news(location):
         return "Could not load news."
 
 
+# --- Dashboard helpers (shared by the split routes and the streaming /dashboard) ---
+DEFAULT_DASHBOARD_WEATHER = {
+    "temperature": 30, "condition": "Sunny",
+    "humidity": 60, "wind_speed": 8, "icon": "01d"
+}
+
+
+def dashboard_user(current_user, location):
+    return {
+        "full_name": current_user.get("full_name"),
+        "username": current_user.get("username"),
+        "location": location
+    }
+
+
+def dashboard_current_weather(place):
+    """Current weather for the dashboard; (display_weather, real_weather_or_None)."""
+    current_weather = get_weather(place["id"])
+    if isinstance(current_weather, dict) and "error" in current_weather:
+        return DEFAULT_DASHBOARD_WEATHER, None
+    current_weather = {**current_weather, "city_name": place["name"]}
+    return current_weather, current_weather
+
+
+def dashboard_forecast(place):
+    forecast = get_5_day_forecast(place["id"])
+    if isinstance(forecast, dict) and "error" in forecast:
+        return []
+    return forecast
+
+
+def dashboard_advice(location, place, current_weather, forecast):
+    """Gemini advice for real weather; local seasonal advice if AI or weather is unavailable."""
+    if not model or current_weather is None:
+        return get_seasonal_advice(location)["advice"]
+    advice = advice_for_weather(current_weather, forecast, place)
+    if not advice or "error" in str(advice).lower():
+        advice = get_seasonal_advice(location)["advice"]
+    return advice
+
+
+def dashboard_news(location):
+    if not model:
+        return get_seasonal_advice(location)["news"]
+    news = get_ai_news(location)
+    if not news or "error" in str(news).lower():
+        news = get_seasonal_advice(location)["news"]
+    return news
+
+
 # --- FAST DASHBOARD: Weather + User ---
 @app.route("/dashboard-data", methods=["GET"])
 @token_required
@@ -545,25 +1319,12 @@ def get_dashboard_data(current_user):
     AI content (advice/news) is loaded separately.
     """
     location = current_user.get("default_location") or "Delhi"
-
-    user_data = {
-        "full_name": current_user.get("full_name"),
-        "username": current_user.get("username"),
-        "location": location
-    }
+    user_data = dashboard_user(current_user, location)
 
     try:
-        current_weather = get_weather(location)
-        forecast = get_5_day_forecast(location)
-
-        # fallback for weather/forecast
-        if isinstance(current_weather, dict) and "error" in current_weather:
-            current_weather = {
-                "temperature": 30, "condition": "Sunny",
-                "humidity": 60, "wind_speed": 8, "icon": "01d"
-            }
-        if isinstance(forecast, dict) and "error" in forecast:
-            forecast = []
+        place = resolve_location(location)
+        current_weather, _ = dashboard_current_weather(place)
+        forecast = dashboard_forecast(place)
 
         weather_data = {"current": current_weather, "forecast": forecast}
 
@@ -600,28 +1361,16 @@ def get_dashboard_ai_content(current_user):
 
     # 🌐 SLOW PATH: Gemini-powered advice
     try:
-        current_weather = get_weather(location)
-        forecast = get_5_day_forecast(location)
+        place = resolve_location(location)
+        _, current_weather = dashboard_current_weather(place)
 
         # Fall back to local if weather data unavailable
-        if isinstance(current_weather, dict) and "error" in current_weather:
+        if current_weather is None:
             local = get_seasonal_advice(location)
             return jsonify({"advice": local["advice"], "news": local["news"]}), 200
-        if isinstance(forecast, dict) and "error" in forecast:
-            forecast = []
-
-        # Convert dicts to tuples for caching
-        current_weather_tuple = tuple(sorted(current_weather.items()))
-        forecast_tuple = tuple(tuple(sorted(day.items())) for day in forecast)
 
-        advice = get_agri_advice(current_weather_tuple, forecast_tuple, location)
-        news = get_ai_news(location)
-
-        # If Gemini returned an error, use local fallback
-        if not advice or "error" in str(advice).lower():
-            advice = get_seasonal_advice(location)["advice"]
-        if not news or "error" in str(news).lower():
-            news = get_seasonal_advice(location)["news"]
+        advice = dashboard_advice(location, place, current_weather, dashboard_forecast(place))
+        news = dashboard_news(location)
 
         return jsonify({
             "advice": advice,
@@ -635,6 +1384,63 @@ def get_dashboard_ai_content(current_user):
 # --- END OF NEW ROUTE ---
 
 
+# --- PROGRESSIVE DASHBOARD: one request, sections streamed as they are ready ---
+_dashboard_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashboard")
+
+
+def format_stream_section(name, data, sse):
+    payload = json.dumps({"section": name, "data": data}, default=str)
+    if sse:
+        return f"event: {name}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+@app.route("/dashboard", methods=["GET"])
+@token_required
+def dashboard_stream(current_user):
+    """
+    Single authenticated dashboard request. Streams NDJSON lines
+    {"section": ..., "data": ...} for user, weather, forecast, advice and news
+    as each becomes ready (SSE framing if the client accepts text/event-stream),
+    finishing with a "done" section.
+    """
+    location = current_user.get("default_location") or "Delhi"
+    user_data = dashboard_user(current_user, location)
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+
+    def generate():
+        yield format_stream_section("user", user_data, sse)
+        try:
+            place = resolve_location(location)
+            weather_job = _dashboard_executor.submit(dashboard_current_weather, place)
+            forecast_job = _dashboard_executor.submit(dashboard_forecast, place)
+            news_job = _dashboard_executor.submit(dashboard_news, location)
+
+            # Weather and forecast in whichever order they arrive
+            pending = {weather_job: "weather", forecast_job: "forecast"}
+            for job in as_completed(pending):
+                if pending[job] == "weather":
+                    yield format_stream_section("weather", job.result()[0], sse)
+                else:
+                    yield format_stream_section("forecast", job.result(), sse)
+
+            advice_job = _dashboard_executor.submit(
+                dashboard_advice, location, place, weather_job.result()[1], forecast_job.result())
+            for job in as_completed([advice_job, news_job]):
+                name = "advice" if job is advice_job else "news"
+                yield format_stream_section(name, job.result(), sse)
+        except Exception as e:
+            print(f"Dashboard stream error: {e}")
+            yield format_stream_section("error", "Unable to load some dashboard sections.", sse)
+        yield format_stream_section("done", None, sse)
+
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ---------------- Forum Routes (Unchanged) ----------------
 @app.route("/api/create-post", methods=["POST"])
 @token_required
@@ -654,6 +1460,7 @@ def create_post(current_user):
     
     try:
         result = db.posts.insert_one(new_post)
+        bump_posts_version()
         response_post = {
             "id": str(result.inserted_id), "title": new_post["title"], "content": new_post["content"],
             "author_id": str(new_post["author_id"]), "username": new_post["author_username"],
@@ -664,7 +1471,18 @@ def create_post(current_user):
         print(f"Post creation error: {e}")
         return jsonify({"error": "Could not create post."}), 500
 
+def bump_posts_version():
+    """Invalidates cached forum listings after any post or reply write."""
+    if db is None:
+        return
+    try:
+        db.meta.update_one({"_id": "posts"}, {"$inc": {"version": 1}}, upsert=True)
+    except Exception as e:
+        print(f"⚠️ Could not bump posts version: {e}")
+
+
 @app.route("/api/posts", methods=["GET"])
+@cached_compressed(timeout=600, version=lambda: content_version("posts"))
 def get_all_posts():
     if db is None: return jsonify({"error": "Database not connected"}), 500
     posts = []
@@ -742,6 +1560,7 @@ def add_reply(current_user, post_id):
         )
         if result.matched_count == 0:
             return jsonify({"error": "Post not found."}), 404
+        bump_posts_version()
         
         formatted_reply = {
             "id": str(new_reply["_id"]), "content": new_reply["content"],
@@ -800,6 +1619,7 @@ def edit_post(current_user, post_id):
         )
         if result.matched_count == 0:
             return jsonify({"error": "Post not found or you are not the author."}), 404
+        bump_posts_version()
         return jsonify({"message": "Post updated successfully!"}), 200
     except InvalidId:
         return jsonify({"error": "Invalid post ID."}), 400
@@ -817,6 +1637,7 @@ def delete_post(current_user, post_id):
         )
         if result.deleted_count == 0:
             return jsonify({"error": "Post not found or you are not the author."}), 404
+        bump_posts_version()
         return jsonify({"message": "Post deleted successfully!"}), 200
     except InvalidId:
         return jsonify({"error": "Invalid post ID."}), 400
@@ -878,6 +1699,7 @@ def contact():
 
 from werkzeug.utils import secure_filename
 import json
+import csv
 
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -908,8 +1730,64 @@ def format_product(product):
     }
 
 
+def normalize_tags(raw_tags):
+    """Accepts a list, a JSON list string or a comma-separated string; returns clean lowercase tags."""
+    if isinstance(raw_tags, str):
+        try:
+            raw_tags = json.loads(raw_tags)
+        except Exception:
+            raw_tags = raw_tags.split(",")
+    if not isinstance(raw_tags, (list, tuple)):
+        return []
+    tags = []
+    for tag in raw_tags:
+        tag = str(tag).strip().lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def build_product_doc(data, current_user, image_url=None):
+    """
+    Validates a product payload and builds the MongoDB document.
+    Raises ValueError with a user-facing message if the payload is invalid.
+    """
+    for field in ["name", "price", "category"]:
+        if not data.get(field):
+            raise ValueError(f"Missing required field: {field}")
+
+    try:
+        price = float(data["price"])
+    except (TypeError, ValueError):
+        raise ValueError("Price must be a number.")
+    if price < 0:
+        raise ValueError("Price cannot be negative.")
+
+    try:
+        stock = int(data.get("stock") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Stock must be a whole number.")
+
+    now = datetime.now(timezone.utc)
+    return {
+        "name": str(data["name"]).strip(),
+        "brand": str(data.get("brand") or "").strip(),
+        "description": str(data.get("description") or "").strip(),
+        "price": price,
+        "category": str(data["category"]).strip(),
+        "tags": normalize_tags(data.get("tags")),
+        "image_url": image_url if image_url is not None else (data.get("image_url") or None),
+        "stock": stock,
+        "createdAt": now,
+        "updatedAt": now,
+        "seller_id": current_user["_id"],           # Added seller info
+        "seller_username": current_user["username"]  # Added seller info
+    }
+
+
 # --- FETCH ALL PRODUCTS ---
 @app.route("/api/products", methods=["GET"])
+@cached_compressed(timeout=600, version=lambda: content_version("products"))
 def get_all_products():
     """Fetches all products, e.g., for the main marketplace page."""
     if db is None:
@@ -992,39 +1870,16 @@ def add_new_product(current_user):
             data = request.get_json() or {}
             image_url = data.get("image_url")
 
-        # --- Validate Required Fields ---
-        required_fields = ["name", "price", "category"]
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-
-        # --- Process tags ---
-        raw_tags = data.get("tags")
-        if isinstance(raw_tags, str):
-            try:
-                tags = json.loads(raw_tags)
-            except Exception:
-                tags = [t.strip().lower() for t in raw_tags.split(",") if t.strip()]
-        else:
-            tags = raw_tags or []
-
-        # --- Insert into DB (UPDATED) ---
-        new_product = {
-            "name": data["name"].strip(),
-            "brand": data.get("brand", "").strip(),
-            "description": data.get("description", "").strip(),
-            "price": float(data["price"]),
-            "category": data["category"],
-            "tags": tags,
-            "image_url": image_url,
-            "stock": int(data.get("stock", 0)),
-            "createdAt": datetime.now(timezone.utc),
-            "seller_id": current_user["_id"],           # Added seller info
-            "seller_username": current_user["username"]  # Added seller info
-        }
+        # --- Validate + build document (shared with bulk import) ---
+        try:
+            new_product = build_product_doc(data, current_user, image_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         result = db.products.insert_one(new_product)
         new_product["_id"] = result.inserted_id
+        bump_catalog_version()
+        update_product_facets([new_product])
         return jsonify(format_product(new_product)), 201
 
     except Exception as e:
@@ -1032,82 +1887,689 @@ def add_new_product(current_user):
         return jsonify({"error": "Could not add product"}), 500
 
 
-# --- SERVE UPLOADED FILES ---
-@app.route("/uploads/<filename>")
-def serve_uploaded_file(filename):
-    """Serve uploaded images from local uploads folder."""
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+# --- BULK PRODUCT IMPORT (CSV / JSONL) ---
+BULK_IMPORT_BATCH_SIZE = 1000
+BULK_IMPORT_MAX_BYTES = 50 * 1024 * 1024  # 50MB, bulk uploads only
+BULK_IMPORT_MAX_ERRORS = 500  # cap the per-row error report
 
 
+def iter_bulk_rows(stream, fmt):
+    """Yields (row_number, row_dict_or_error) from a CSV or JSONL byte stream without loading it all."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, {k.strip().lower(): v for k, v in row.items() if k}
+        return
 
-@app.route("/calculate-fertilizer", methods=["POST"])
-def calculate_fertilizer():
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield row_number, ValueError("Invalid JSON line.")
+            continue
+        if not isinstance(row, dict):
+            yield row_number, ValueError("Each line must be a JSON object.")
+            continue
+        yield row_number, row
+
+
+@app.route("/api/products/bulk", methods=["POST"])
+@token_required
+def bulk_import_products(current_user):
     """
-    UPGRADED: Now recommends products from the marketplace.
+    Imports many products in one request.
+    Accepts a CSV or JSONL file (multipart field 'file') or a raw text/csv or
+    application/x-ndjson body. Rows are validated like /api/products and written
+    with unordered insert_many batches; returns a per-row error report.
     """
-    data = request.get_json()
-    try:
-        n = float(data.get("n"))
-        p = float(data.get("p"))
-        k = float(data.get("k"))
-        crop = data.get("crop")
-        if not all([data.get("n"), data.get("p"), data.get("k"), crop]):
-            return jsonify({"error": "Missing N, P, K, or crop."}), 400
-        
-        # 1. Get fertilizer calculation
-        result = get_fertilizer_recommendation(n, p, k, crop)
-        if "error" in result:
-            return jsonify(result), 404
-        
-        # --- TIER 1 INTEGRATION ---
-        suggested_products = []
-        tags_to_search = []
-        if result.get("urea_kg", 0) > 0: tags_to_search.append("urea")
-        if result.get("dap_kg", 0) > 0: tags_to_search.append("dap")
-        if result.get("mop_kg", 0) > 0: tags_to_search.append("mop")
-        
-        if db is not None and tags_to_search:
-            # Find products where the 'tags' array contains any of our needed fertilizers
-            product_cursor = db.products.find({
-                "tags": {"$in": tags_to_search},
-                "category": "fertilizer"
-            })
-            suggested_products = [format_product(p) for p in product_cursor]
-        
-        # Add the suggested products to our response
-        result["suggested_products"] = suggested_products
-        # --- End Tier 1 ---
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
 
-        return jsonify(result)
-        
+    request.max_content_length = BULK_IMPORT_MAX_BYTES
+
+    upload = request.files.get("file")
+    if upload:
+        stream = upload.stream
+        fmt = "csv" if upload.filename.lower().endswith(".csv") else "jsonl"
+    elif request.content_type and ("ndjson" in request.content_type or "jsonl" in request.content_type):
+        stream, fmt = request.stream, "jsonl"
+    elif request.content_type and "csv" in request.content_type:
+        stream, fmt = request.stream, "csv"
+    else:
+        return jsonify({"error": "Upload a .csv or .jsonl file in the 'file' field."}), 400
+
+    started = time.perf_counter()
+    inserted, failed, total = 0, 0, 0
+    errors = []
+
+    def record_error(row_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_IMPORT_MAX_ERRORS:
+            errors.append({"row": row_number, "error": message})
+
+    def flush(batch, batch_rows):
+        nonlocal inserted
+        failed_indexes = set()
+        try:
+            db.products.insert_many(batch, ordered=False)
+        except pymongo.errors.BulkWriteError as bwe:
+            for err in bwe.details.get("writeErrors", []):
+                failed_indexes.add(err["index"])
+                record_error(batch_rows[err["index"]], err.get("errmsg", "Write failed."))
+        written = [doc for i, doc in enumerate(batch) if i not in failed_indexes]
+        inserted += len(written)
+        update_product_facets(written)
+
+    batch, batch_rows = [], []
+    try:
+        for row_number, row in iter_bulk_rows(stream, fmt):
+            total += 1
+            if isinstance(row, Exception):
+                record_error(row_number, str(row))
+                continue
+            try:
+                batch.append(build_product_doc(row, current_user))
+                batch_rows.append(row_number)
+            except ValueError as e:
+                record_error(row_number, str(e))
+                continue
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                flush(batch, batch_rows)
+                batch, batch_rows = [], []
+        if batch:
+            flush(batch, batch_rows)
+    except UnicodeDecodeError:
+        return jsonify({"error": "File must be UTF-8 encoded."}), 400
     except Exception as e:
-        print(f"Error in /calculate-fertilizer: {e}")
-        return jsonify({"error": "An internal server error occurred."}), 500
+        print(f"❌ Bulk import error: {e}")
+        return jsonify({"error": "Could not import products", "inserted": inserted}), 500
 
-@app.route("/weather", methods=["GET"])
-def weather_route():
-    # This route is unchanged
-    city = request.args.get('city')
-    if not city:
-        return jsonify({"error": "City parameter is required."}), 400
-    current_weather = get_weather(city)
-    if "error" in current_weather:
-        return jsonify(current_weather), 404
-    forecast = get_5_day_forecast(city)
-    if "error" in forecast:
-        return jsonify(forecast), 500
-    
-    # Convert dicts to tuples for caching
-    current_weather_tuple = tuple(sorted(current_weather.items()))
-    forecast_tuple = tuple(tuple(sorted(day.items())) for day in forecast)
-    
-    advice = get_agri_advice(current_weather_tuple, forecast_tuple, city)
-    
+    if total == 0:
+        return jsonify({"error": "No rows found in upload."}), 400
+    if inserted:
+        bump_catalog_version()
+
+    elapsed = time.perf_counter() - started
+    print(f"📦 Bulk import by {current_user['username']}: {inserted}/{total} rows in {elapsed:.2f}s")
     return jsonify({
-        "current": current_weather,
-        "forecast": forecast,
-        "advice": advice
-    })
+        "total_rows": total,
+        "inserted": inserted,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "rows_per_sec": round(total / elapsed, 1) if elapsed > 0 else None,
+    }), 201 if inserted else 400
+
+
+# --- MARKETPLACE FACETS (materialized) ---
+# product_facets holds one doc per category and per tag with count and price
+# range. Inserts update it incrementally; a periodic aggregation rebuilds it
+# so it self-heals after edits or deletes. Facet reads never scan products.
+FACET_REBUILD_INTERVAL = 6 * 3600
+MAX_TAG_FACETS = 50
+
+
+def update_product_facets(products):
+    """Incrementally folds newly inserted products into the facet summary."""
+    if db is None or not products:
+        return
+    increments = {}
+    for product in products:
+        keys = [("category", product.get("category"))] + [("tag", t) for t in product.get("tags") or []]
+        price = product.get("price")
+        for kind, value in keys:
+            if not value:
+                continue
+            agg = increments.setdefault((kind, value), {"count": 0, "min": price, "max": price})
+            agg["count"] += 1
+            if price is not None:
+                agg["min"] = price if agg["min"] is None else min(agg["min"], price)
+                agg["max"] = price if agg["max"] is None else max(agg["max"], price)
+
+    ops, now = [], datetime.now(timezone.utc)
+    for (kind, value), agg in increments.items():
+        # updatedAt tells a concurrent rebuild this row changed after its snapshot
+        update = {"$inc": {"count": agg["count"]}, "$set": {"kind": kind, "value": value, "updatedAt": now}}
+        if agg["min"] is not None:
+            update["$min"] = {"min_price": agg["min"]}
+            update["$max"] = {"max_price": agg["max"]}
+        ops.append(pymongo.UpdateOne({"_id": f"{kind}:{value}"}, update, upsert=True))
+    try:
+        db.product_facets.bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"⚠️ Facet update error: {e}")
+
+
+def rebuild_product_facets():
+    """
+    Recomputes all facets with one aggregation over products. Rows updated
+    incrementally after the aggregation started are newer than its snapshot,
+    so they are neither replaced nor deleted.
+    """
+    if db is None:
+        return
+    started = datetime.now(timezone.utc)
+    untouched = {"$or": [{"updatedAt": {"$lt": started}}, {"updatedAt": {"$exists": False}}]}
+    group = {"count": {"$sum": 1}, "min_price": {"$min": "$price"}, "max_price": {"$max": "$price"}}
+    pipeline = [{"$facet": {
+        "category": [{"$group": {"_id": "$category", **group}}],
+        "tag": [{"$unwind": "$tags"}, {"$group": {"_id": "$tags", **group}}],
+    }}]
+    result = next(db.products.aggregate(pipeline), {"category": [], "tag": []})
+
+    ops, ids = [], []
+    for kind in ("category", "tag"):
+        for row in result[kind]:
+            if not row["_id"]:
+                continue
+            ids.append(f"{kind}:{row['_id']}")
+            ops.append(pymongo.ReplaceOne(
+                {"_id": ids[-1], **untouched},
+                {"kind": kind, "value": row["_id"], "count": row["count"],
+                 "min_price": row["min_price"], "max_price": row["max_price"],
+                 "rebuiltAt": started, "updatedAt": started},
+                upsert=True
+            ))
+    if ops:
+        try:
+            db.product_facets.bulk_write(ops, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # A guarded upsert on a row updated since `started` collides with it; keep the newer row
+            if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                raise
+    db.product_facets.delete_many({"_id": {"$nin": ids}, **untouched})
+    print(f"✅ Product facets rebuilt ({len(ops)} entries).")
+
+
+def format_facet(doc):
+    return {
+        "value": doc["value"],
+        "count": doc["count"],
+        "min_price": doc.get("min_price"),
+        "max_price": doc.get("max_price"),
+    }
+
+
+@app.route("/api/products/facets", methods=["GET"])
+def get_product_facets():
+    """Per-category and per-tag product counts and price ranges for marketplace filters."""
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    try:
+        categories = [format_facet(d) for d in db.product_facets.find({"kind": "category"}).sort("count", -1)]
+        tags = [format_facet(d) for d in db.product_facets.find({"kind": "tag"}).sort("count", -1).limit(MAX_TAG_FACETS)]
+        prices = [c for c in categories if c["min_price"] is not None]
+        return jsonify({
+            "total": sum(c["count"] for c in categories),
+            "price_range": {
+                "min": min((c["min_price"] for c in prices), default=None),
+                "max": max((c["max_price"] for c in prices), default=None),
+            },
+            "categories": categories,
+            "tags": tags,
+        })
+    except Exception as e:
+        print(f"Error fetching facets: {e}")
+        return jsonify({"error": "Could not fetch product facets"}), 500
+
+
+# --- ORDERS: ATOMIC STOCK RESERVATION ---
+# Stock is decremented with a single conditional update (stock >= qty), so two
+# buyers can never both take the last unit. A reservation holds stock for
+# RESERVATION_TTL_MINUTES; unconfirmed holds are released back to stock.
+RESERVATION_TTL_MINUTES = 15
+RESERVATION_PURGE_DAYS = 7          # expired/cancelled holds are TTL-deleted after this
+RESERVATION_SWEEP_INTERVAL = 30     # seconds between expiry sweeps (background task; lazy per worker on orders)
+_last_reservation_sweep = 0.0
+
+
+def format_reservation(reservation):
+    """Helper function to convert a reservation doc to JSON-friendly format."""
+    status = reservation["status"]
+    expires_at = reservation["expiresAt"]
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if status == "reserved" and expires_at <= datetime.now(timezone.utc):
+        status = "expired"  # the sweep has not released it yet, but it can no longer be confirmed
+    return {
+        "id": str(reservation["_id"]),
+        "product_id": str(reservation["product_id"]),
+        "product_name": reservation.get("product_name"),
+        "quantity": reservation["quantity"],
+        "unit_price": reservation.get("unit_price"),
+        "total_price": reservation.get("total_price"),
+        "status": status,
+        "created_at": reservation["createdAt"].isoformat(),
+        "expires_at": reservation["expiresAt"].isoformat(),
+    }
+
+
+def release_reservation(reservation_filter, new_status):
+    """
+    Atomically moves one 'reserved' hold to `new_status` and returns its stock.
+    The status flip is the claim, so a hold is never released twice.
+    """
+    now = datetime.now(timezone.utc)
+    released = db.reservations.find_one_and_update(
+        {**reservation_filter, "status": "reserved"},
+        {"$set": {"status": new_status, "releasedAt": now,
+                  "purgeAt": now + timedelta(days=RESERVATION_PURGE_DAYS)}},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if released:
+        db.products.update_one(
+            {"_id": released["product_id"]},
+            {"$inc": {"stock": released["quantity"]}, "$set": {"updatedAt": now}}
+        )
+    return released
+
+
+def release_expired_reservations(limit=200, throttle=True):
+    """Returns stock held by expired reservations. Safe to run from any number of workers."""
+    global _last_reservation_sweep
+    if db is None or throttle and time.monotonic() - _last_reservation_sweep < RESERVATION_SWEEP_INTERVAL:
+        return 0
+    _last_reservation_sweep = time.monotonic()
+    released = 0
+    try:
+        now = datetime.now(timezone.utc)
+        for _ in range(limit):
+            if not release_reservation({"expiresAt": {"$lte": now}}, "expired"):
+                break
+            released += 1
+        if released:
+            bump_catalog_version()
+            print(f"♻️ Released {released} expired reservations.")
+    except Exception as e:
+        print(f"⚠️ Reservation sweep error: {e}")
+    return released
+
+
+@app.route("/api/orders", methods=["POST"])
+@token_required
+def create_order(current_user):
+    """Reserves stock for a product: { product_id, quantity }."""
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+
+    data = request.get_json() or {}
+    if not data.get("product_id"):
+        return jsonify({"error": "product_id is required."}), 400
+    try:
+        product_id = ObjectId(data["product_id"])
+    except (InvalidId, TypeError):
+        return jsonify({"error": "Invalid product ID."}), 400
+    quantity = data.get("quantity", 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool):  # no silent 1.9 -> 1 or true -> 1
+        return jsonify({"error": "Quantity must be a whole number."}), 400
+    if quantity <= 0:
+        return jsonify({"error": "Quantity must be at least 1."}), 400
+
+    release_expired_reservations()
+
+    try:
+        now = datetime.now(timezone.utc)
+        product = db.products.find_one_and_update(
+            {"_id": product_id, "stock": {"$gte": quantity}},
+            {"$inc": {"stock": -quantity}, "$set": {"updatedAt": now}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if not product:
+            if db.products.count_documents({"_id": product_id}, limit=1) == 0:
+                return jsonify({"error": "Product not found."}), 404
+            return jsonify({"error": "Not enough stock available."}), 409
+
+        reservation = {
+            "product_id": product_id,
+            "product_name": product.get("name"),
+            "seller_id": product.get("seller_id"),
+            "buyer_id": current_user["_id"],
+            "buyer_username": current_user["username"],
+            "quantity": quantity,
+            "unit_price": product.get("price"),
+            "total_price": round((product.get("price") or 0) * quantity, 2),
+            "status": "reserved",
+            "createdAt": now,
+            "expiresAt": now + timedelta(minutes=RESERVATION_TTL_MINUTES),
+        }
+        try:
+            reservation["_id"] = db.reservations.insert_one(reservation).inserted_id
+        except Exception:
+            # Give the stock back if the hold could not be recorded
+            db.products.update_one({"_id": product_id}, {"$inc": {"stock": quantity}})
+            raise
+
+        bump_catalog_version()
+        return jsonify(format_reservation(reservation)), 201
+    except Exception as e:
+        print(f"❌ Order reservation error: {e}")
+        return jsonify({"error": "Could not reserve stock."}), 500
+
+
+@app.route("/api/orders/<order_id>/confirm", methods=["POST"])
+@token_required
+def confirm_order(current_user, order_id):
+    """Confirms a reservation that has not yet expired."""
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    try:
+        now = datetime.now(timezone.utc)
+        order = db.reservations.find_one_and_update(
+            {"_id": ObjectId(order_id), "buyer_id": current_user["_id"],
+             "status": "reserved", "expiresAt": {"$gt": now}},
+            {"$set": {"status": "confirmed", "confirmedAt": now}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if not order:
+            return jsonify({"error": "Reservation not found or already expired."}), 409
+        return jsonify(format_reservation(order)), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid order ID."}), 400
+    except Exception as e:
+        print(f"Confirm order error: {e}")
+        return jsonify({"error": "Could not confirm order."}), 500
+
+
+@app.route("/api/orders/<order_id>/cancel", methods=["POST"])
+@token_required
+def cancel_order(current_user, order_id):
+    """Cancels a pending reservation and returns its stock."""
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    try:
+        order = release_reservation({"_id": ObjectId(order_id), "buyer_id": current_user["_id"]}, "cancelled")
+        if not order:
+            return jsonify({"error": "Reservation not found or no longer pending."}), 409
+        bump_catalog_version()
+        return jsonify(format_reservation(order)), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid order ID."}), 400
+    except Exception as e:
+        print(f"Cancel order error: {e}")
+        return jsonify({"error": "Could not cancel order."}), 500
+
+
+@app.route("/api/my-orders", methods=["GET"])
+@token_required
+def get_my_orders(current_user):
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+    try:
+        orders = db.reservations.find({"buyer_id": current_user["_id"]}).sort("createdAt", -1).limit(100)
+        return jsonify([format_reservation(o) for o in orders])
+    except Exception as e:
+        print(f"Get my orders error: {e}")
+        return jsonify({"error": "Could not fetch your orders."}), 500
+
+
+# --- SERVE UPLOADED FILES ---
+@app.route("/uploads/<filename>")
+def serve_uploaded_file(filename):
+    """Serve uploaded images from local uploads folder."""
+    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+
+
+
+# ---------------- Product Suggestion Index ----------------
+# Fertilizer/pest routes suggest products on every request, but the catalogue
+# changes rarely. Each worker keeps a (category, tag) -> ranked products index
+# and only re-reads Mongo when the shared catalogue version moves.
+PRODUCT_INDEX_CHECK_INTERVAL = 30    # seconds between version checks
+PRODUCT_INDEX_FULL_REBUILD = 3600    # full reload every hour (catches deletes)
+PRODUCT_INDEX_OVERLAP = timedelta(seconds=60)  # updatedAt is stamped before commit; re-read this far back
+MAX_SUGGESTED_PRODUCTS = 6
+
+
+def bump_catalog_version():
+    """Marks the product catalogue as changed so every worker refreshes its index."""
+    if db is None:
+        return
+    try:
+        db.meta.update_one(
+            {"_id": "products"},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"⚠️ Could not bump catalogue version: {e}")
+
+
+def product_rank_key(product):
+    """In-stock first, then cheapest, then best stocked."""
+    stock = product.get("stock") or 0
+    price = product.get("price")
+    return (stock <= 0, price if price is not None else float("inf"), -stock)
+
+
+class ProductIndex:
+    """Per-worker in-memory index of formatted products by (category, tag)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products = {}       # id -> formatted product
+        self._by_key = {}         # (category, tag) -> [formatted products], ranked
+        self._version = None
+        self._watermark = None    # newest updatedAt seen
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    def _current_version(self):
+        return content_version("products")
+
+    def _load(self, query):
+        newest = self._watermark
+        loaded = {}
+        for doc in db.products.find(query):
+            product = format_product(doc)
+            loaded[product["id"]] = product
+            stamp = doc.get("updatedAt") or doc.get("createdAt")
+            if stamp and (newest is None or stamp > newest):
+                newest = stamp
+        return loaded, newest
+
+    def _rebuild_keys(self, products):
+        by_key = {}
+        for product in products.values():
+            category = (product.get("category") or "").lower()
+            for tag in product.get("tags") or []:
+                by_key.setdefault((category, tag), []).append(product)
+        for ranked in by_key.values():
+            ranked.sort(key=product_rank_key)
+        return by_key
+
+    def refresh(self, force=False):
+        """Re-syncs with Mongo if the catalogue version changed (or on a full-rebuild tick)."""
+        if db is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < PRODUCT_INDEX_CHECK_INTERVAL:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is refreshing; serve the current snapshot
+        try:
+            self._checked_at = now
+            version = self._current_version()
+            full = force or self._version is None or now - self._built_at > PRODUCT_INDEX_FULL_REBUILD
+            if not full and version == self._version:
+                return
+
+            if full:
+                self._watermark = None
+                products, watermark = self._load({})
+                self._built_at = now
+            else:
+                # Incremental: products written since the last sync, re-reading an overlap window because a
+                # write stamped before the watermark can commit after it was read (merging is idempotent)
+                since = self._watermark - PRODUCT_INDEX_OVERLAP if self._watermark else None
+                changed, watermark = self._load({"updatedAt": {"$gte": since}} if since else {})
+                products = {**self._products, **changed}
+
+            self._products = products
+            self._by_key = self._rebuild_keys(products)
+            self._watermark = watermark
+            self._version = version
+        except Exception as e:
+            print(f"⚠️ Product index refresh failed: {e}")
+        finally:
+            self._lock.release()
+
+    def suggest(self, category, tags, limit=MAX_SUGGESTED_PRODUCTS):
+        """
+        Top `limit` products in `category` carrying any of `tags`.
+        `tags` may be a plain iterable or a {tag: weight} mapping (e.g. keyword match
+        counts); products matching heavier tags rank first, ties by product_rank_key.
+        """
+        self.refresh()
+        by_key = self._by_key
+        category = (category or "").lower()
+        weights = tags if isinstance(tags, dict) else {tag: 1 for tag in tags}
+        scores, candidates = {}, {}
+        for tag, weight in weights.items():
+            for product in by_key.get((category, tag.lower()), []):
+                scores[product["id"]] = scores.get(product["id"], 0) + weight
+                candidates[product["id"]] = product
+        ranked = sorted(candidates.values(), key=lambda p: (-scores[p["id"]], product_rank_key(p)))
+        return ranked[:limit]
+
+
+product_index = ProductIndex()
+
+
+# ---------------- Batch Soil Samples ----------------
+# /calculate-fertilizer and /analyze-fertility also accept {"samples": [...]}
+# (e.g. a Soil Health Card drive) and answer with one result per sample,
+# computed column-wise by fertility_engine and identical to the single path.
+# With "format": "columns" the per-sample advice text is skipped and the
+# numbers come back as one list per field, in sample order.
+FERTILITY_BATCH_MAX_SAMPLES = 100_000
+FERTILITY_BATCH_MAX_BYTES = 20 * 1024 * 1024  # 20MB, batch bodies only
+
+
+def soil_samples_arg(data):
+    """(samples, error response) for a batch body; samples is None when the body is a single sample."""
+    if not isinstance(data, dict) or "samples" not in data:
+        return None, None
+    samples = data["samples"]
+    if not isinstance(samples, list) or not samples:
+        return None, (jsonify({"error": "samples must be a non-empty list."}), 400)
+    if len(samples) > FERTILITY_BATCH_MAX_SAMPLES:
+        return None, (jsonify({"error": f"At most {FERTILITY_BATCH_MAX_SAMPLES} samples per request."}), 413)
+    return samples, None
+
+
+def soil_batch_response(results, started, columns=None, rows=None, **extra):
+    """
+    Per-sample `results`, or with `columns` ({field: values for `rows`}) the columnar form: each
+    field scattered back to sample order and the failed samples listed under "errors".
+    """
+    failed = sum(1 for r in results if r and "error" in r)
+    print(f"🧪 Soil batch: {len(results)} samples ({failed} failed) in {time.perf_counter() - started:.2f}s")
+    if columns is None:
+        return jsonify({**extra, "count": len(results), "failed": failed, "results": results})
+
+    scattered = {}
+    for name, values in columns.items():
+        column = [None] * len(results)
+        for i, value in zip(rows, values):
+            column[i] = value
+        scattered[name] = column
+    errors = {str(i): r["error"] for i, r in enumerate(results) if r and "error" in r}
+    return jsonify({**extra, "count": len(results), "failed": failed, "columns": scattered, "errors": errors})
+
+
+def unknown_crop_errors(rows, crops, known, results):
+    for i, crop, ok in zip(rows, crops, known):
+        if not ok:
+            results[i] = {"error": f"Crop '{crop}' not found in database."}
+
+
+@app.route("/calculate-fertilizer", methods=["POST"])
+def calculate_fertilizer():
+    """
+    UPGRADED: Now recommends products from the marketplace.
+    Batch bodies ({"samples": [{n, p, k, crop}, ...]}) get the plans only, without product suggestions.
+    """
+    request.max_content_length = FERTILITY_BATCH_MAX_BYTES
+    data = request.get_json()
+    samples, error = soil_samples_arg(data)
+    if error:
+        return error
+    if samples is not None:
+        started = time.perf_counter()
+        rows, values, crops, results = parse_samples(samples, ("n", "p", "k"))
+        n, p, k = values.T
+        registry = crop_registry.current
+        if data.get("format") == "columns":
+            plan = fertilizer_plan_columns(n, p, k, crops, registry)
+            unknown_crop_errors(rows, crops, plan.pop("known"), results)
+            return soil_batch_response(results, started, columns=plan, rows=rows)
+        for i, result in zip(rows, fertilizer_batch(n, p, k, crops, registry)):
+            results[i] = result
+        return soil_batch_response(results, started)
+
+    try:
+        n = float(data.get("n"))
+        p = float(data.get("p"))
+        k = float(data.get("k"))
+        crop = data.get("crop")
+        if not all([data.get("n"), data.get("p"), data.get("k"), crop]):
+            return jsonify({"error": "Missing N, P, K, or crop."}), 400
+        
+        # 1. Get fertilizer calculation
+        result = get_fertilizer_recommendation(n, p, k, crop, crop_registry.current)
+        if "error" in result:
+            return jsonify(result), 404
+        
+        # --- TIER 1 INTEGRATION ---
+        # Same keyword matcher as /identify-pest, run over the advice text;
+        # fertilizers the plan doesn't actually need are dropped.
+        suggested_products = []
+        not_needed = {tag for tag in ("urea", "dap", "mop") if not result.get(f"{tag}_kg", 0) > 0}
+        tags_to_search = {}
+        if treatment_matcher:
+            matched = treatment_matcher.tag_counts(" ".join(result["recommendations"]))
+            tags_to_search = {tag: hits for tag, hits in matched.items() if tag not in not_needed}
+
+        if tags_to_search:
+            # Served from the in-memory product index (no Mongo query per request)
+            suggested_products = product_index.suggest("fertilizer", tags_to_search)
+        
+        # Add the suggested products to our response
+        result["suggested_products"] = suggested_products
+        # --- End Tier 1 ---
+
+        return jsonify(result)
+        
+    except Exception as e:
+        print(f"Error in /calculate-fertilizer: {e}")
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+@app.route("/weather", methods=["GET"])
+def weather_route():
+    place = resolve_location(request.args.get('city'))
+    if not place:
+        return jsonify({"error": "City parameter is required."}), 400
+    current_weather = get_weather(place["id"])
+    if "error" in current_weather:
+        return jsonify(current_weather), 404
+    current_weather = {**current_weather, "city_name": place["name"]}
+    forecast = get_5_day_forecast(place["id"])
+    if "error" in forecast:
+        return jsonify(forecast), 500
+    
+    advice = advice_for_weather(current_weather, forecast, place)
+    
+    return jsonify({
+        "current": current_weather,
+        "forecast": forecast,
+        "advice": advice
+    })
 
 @app.route("/identify-pest", methods=["POST"])
 def identify_pest():
@@ -1165,49 +2627,954 @@ def identify_pest():
             identification = demo_result["identification"]
             treatment = demo_result["treatment"]
 
-        # --- TIER 1 INTEGRATION: Suggest marketplace products ---
-        suggested_products = []
-        if db is not None:
-            search_terms = {
-                "neem": ["neem oil", "neem-based"],
-                "fungicide": ["fungicide", "mancozeb", "copper oxychloride"],
-                "insecticide": ["insecticide", "aphids", "whiteflies", "thrips"],
-                "organic": ["organic", "panchagavya", "jeevamrutha"]
-            }
-            tags_to_search = set()
-            treatment_lower = treatment.lower()
-            for tag, keywords in search_terms.items():
-                for keyword in keywords:
-                    if keyword in treatment_lower:
-                        tags_to_search.add(tag)
-                        break
-            if tags_to_search:
-                product_cursor = db.products.find({
-                    "tags": {"$in": list(tags_to_search)},
-                    "category": "pesticide"
-                })
-                suggested_products = [format_product(p) for p in product_cursor]
-        # --- End Tier 1 ---
+        # --- TIER 1 INTEGRATION: Suggest marketplace products ---
+        # One Aho-Corasick pass extracts ingredients/brands/pests -> product tags,
+        # weighted by how often the treatment mentions them.
+        suggested_products = []
+        if treatment_matcher:
+            tags_to_search = treatment_matcher.tag_counts(treatment)
+            if tags_to_search:
+                suggested_products = product_index.suggest("pesticide", dict(tags_to_search))
+        # --- End Tier 1 ---
+
+        return jsonify({
+            "identification": identification,
+            "treatment": treatment,
+            "suggested_products": suggested_products
+        })
+    except Exception as e:
+        print(f"Gemini AI error in /identify-pest: {e} — using local fallback")
+        demo_result = get_demo_pest_response(crop)
+        return jsonify({
+            "identification": demo_result["identification"],
+            "treatment": demo_result["treatment"],
+            "suggested_products": []
+        })
+
+# ---------------- Local Market Store (mandis + prices) ----------------
+# Agmarknet records are kept in `market_prices`; every market seen is registered
+# in `mandis` with a GeoJSON point under a 2dsphere index, so "prices near me"
+# is one indexed $geoNear plus a latest-price lookup instead of a client-side scan.
+NEARBY_DEFAULT_RADIUS_KM = 100
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_DEFAULT_MARKETS = 10
+NEARBY_MAX_MARKETS = 50
+MANDI_LOCATE_BATCH = 50
+MANDI_LOCATE_RETRY = timedelta(days=1)
+
+
+def geo_point(lat, lon):
+    return {"type": "Point", "coordinates": [float(lon), float(lat)]}
+
+
+def market_id_for(state, district, market):
+    return "|".join(" ".join(str(part or "").lower().split()) for part in (state, district, market))
+
+
+def market_name(column, value):
+    """A commodity / state / district / market name as the store spells it (alias table applied)."""
+    text = " ".join(str(value or "").split())
+    if market_cleaner is None or not text:
+        return text
+    return market_cleaner.canonical_name(column, text)
+
+
+def market_name_key(column, value):
+    """Lowercase lookup key for user input: "Paddy(Dhan)(Common)" -> "rice", "NCT of Delhi" -> "delhi"."""
+    return market_name(column, value).lower()
+
+
+def parse_arrival_date(value):
+    """Agmarknet 'dd/mm/yyyy' (or ISO 'yyyy-mm-dd') -> UTC datetime, or None."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    day = parse_date(value)
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) if day else None
+
+
+def store_market_records(records):
+    """Cleans, then upserts Agmarknet-format records into market_prices and registers their mandis; returns rows stored."""
+    if market_cleaner is not None:
+        records, report = market_cleaner.clean(records)
+        if report["invalid"] or report["duplicates"] or report["outliers"]:
+            print(f"🧹 Market batch cleaned: {report}")
+    now = datetime.now(timezone.utc)
+    price_ops, mandis = [], {}
+    for r in records:
+        arrival = parse_arrival_date(r.get("arrival_date"))
+        modal = parse_price(r.get("modal_price"))
+        if not r.get("market") or not r.get("commodity") or arrival is None or modal is None:
+            continue
+        market_id = market_id_for(r.get("state"), r.get("district"), r["market"])
+        commodity_key = r["commodity"].strip().lower()
+        price_ops.append(pymongo.UpdateOne(
+            {"market_id": market_id, "commodity_key": commodity_key,
+             "variety": r.get("variety") or "Other", "arrival_date": arrival},
+            {"$set": {
+                "commodity": r["commodity"].strip(),
+                "state": r.get("state"),
+                "district": r.get("district"),
+                "market": r["market"],
+                "modal_price": modal,
+                "min_price": parse_price(r.get("min_price")),
+                "max_price": parse_price(r.get("max_price")),
+                "outlier": bool(r.get("outlier")),
+                "updatedAt": now,
+            }},
+            upsert=True
+        ))
+        mandi = mandis.setdefault(market_id, {
+            "name": r["market"], "district": r.get("district"), "state": r.get("state"), "commodities": set()
+        })
+        mandi["commodities"].add(commodity_key)
+
+    if price_ops:
+        db.market_prices.bulk_write(price_ops, ordered=False)
+    if mandis:
+        db.mandis.bulk_write([pymongo.UpdateOne(
+            {"_id": market_id},
+            {"$set": {"name": m["name"], "name_key": " ".join(m["name"].lower().split()),
+                      "district": m["district"], "state": m["state"]},
+             "$addToSet": {"commodities": {"$each": sorted(m["commodities"])}}},
+            upsert=True
+        ) for market_id, m in mandis.items()], ordered=False)
+    return len(price_ops)
+
+
+def locate_mandis(limit=MANDI_LOCATE_BATCH):
+    """Attaches a GeoJSON point to mandis without one: known coordinates first, then the district geocode."""
+    now = datetime.now(timezone.utc)
+    located = 0
+    pending = db.mandis.find({
+        "location": {"$exists": False},
+        "$or": [{"locateAttemptedAt": {"$exists": False}},
+                {"locateAttemptedAt": {"$lt": now - MANDI_LOCATE_RETRY}}],
+    }, limit=limit)
+    for mandi in pending:
+        coords = MANDI_COORDINATES.get(" ".join(mandi["name"].lower().split()))
+        if coords is None:
+            place = resolve_location(", ".join(p for p in (mandi.get("district"), mandi.get("state")) if p))
+            if place and place.get("lat") is not None:
+                coords = (place["lat"], place["lon"])
+        if coords:
+            db.mandis.update_one({"_id": mandi["_id"]}, {"$set": {"location": geo_point(*coords)},
+                                                         "$unset": {"locateAttemptedAt": ""}})
+            located += 1
+        else:
+            db.mandis.update_one({"_id": mandi["_id"]}, {"$set": {"locateAttemptedAt": now}})
+    return located
+
+
+def sync_market_store(records):
+    """Write-behind for live API results: persist prices, refresh their rollups, then locate any new mandis."""
+    try:
+        sync_started = datetime.now(timezone.utc)
+        stored = store_market_records(records)
+        rollup_market_prices(updated_since=sync_started)
+        evaluate_price_alerts(updated_since=sync_started)
+        located = locate_mandis()
+        bump_market_version()
+        print(f"✅ Market store: {stored} price rows upserted, {located} mandis located.")
+    except Exception as e:
+        print(f"⚠️ Market store sync failed: {e}")
+
+
+# ---------------- Market Price Rollups ----------------
+# Per (market, commodity) day / week (Mon-Sun) / month summaries of the raw
+# price rows, recomputed after each sync for just the series that changed, so
+# trend charts read a handful of small pre-aggregated docs.
+MARKET_ROLLUP_PERIODS = ("day", "week", "month")
+MARKET_TREND_MAX_DAYS = 730
+MARKET_TREND_DEFAULT_DAYS = 90
+
+
+def period_start(day, period):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def period_end(start, period):
+    """Exclusive end of the period beginning at `start`."""
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def summarize_prices(rows):
+    """min / max / median / modal (most frequent modal price; median if none repeats) over raw price rows."""
+    modal_prices = [r["modal_price"] for r in rows]
+    median = statistics.median(modal_prices)
+    value, hits = Counter(modal_prices).most_common(1)[0]
+    return {
+        "min_price": min(min(r.get("min_price") or r["modal_price"], r["modal_price"]) for r in rows),
+        "max_price": max(max(r.get("max_price") or r["modal_price"], r["modal_price"]) for r in rows),
+        "median_price": median,
+        "modal_price": value if hits > 1 else median,
+        "samples": len(rows),
+    }
+
+
+def rollup_market_prices(updated_since=None):
+    """Recomputes rollups for the (market, commodity) series with rows updated since `updated_since` (all if None)."""
+    if db is None:
+        return 0
+    started = time.perf_counter()
+    match = {"updatedAt": {"$gte": updated_since}} if updated_since else {}
+    touched = db.market_prices.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"market_id": "$market_id", "commodity_key": "$commodity_key"},
+                    "first": {"$min": "$arrival_date"}, "last": {"$max": "$arrival_date"}}},
+    ])
+    written, ops = 0, []
+    for series in touched:
+        key = series["_id"]
+        # Widen to whole months and whole weeks so every period written is complete
+        start = period_start(period_start(series["first"], "month"), "week")
+        last_month_end = period_end(period_start(series["last"], "month"), "month")
+        end = period_end(period_start(last_month_end - timedelta(days=1), "week"), "week")
+        rows = db.market_prices.find(
+            {**key, "arrival_date": {"$gte": start, "$lt": end}, "outlier": {"$ne": True}},
+            {"_id": 0, "commodity": 1, "state": 1, "district": 1, "market": 1,
+             "arrival_date": 1, "modal_price": 1, "min_price": 1, "max_price": 1}
+        )
+        groups = {}
+        for row in rows:
+            for period in MARKET_ROLLUP_PERIODS:
+                groups.setdefault((period, period_start(row["arrival_date"], period)), []).append(row)
+
+        for (period, p_start), group in groups.items():
+            if p_start < start or period_end(p_start, period) > end:
+                continue  # month straddling the widened window; its own series rollup owns it
+            sample = group[-1]
+            ops.append(pymongo.UpdateOne(
+                {"_id": f"{period}:{key['market_id']}:{key['commodity_key']}:{p_start:%Y-%m-%d}"},
+                {"$set": {
+                    "period": period, "start": p_start,
+                    "market_id": key["market_id"], "commodity_key": key["commodity_key"],
+                    "market_key": " ".join(sample["market"].lower().split()),
+                    "state_key": " ".join((sample.get("state") or "").lower().split()),
+                    "commodity": sample["commodity"], "market": sample["market"],
+                    "district": sample.get("district"), "state": sample.get("state"),
+                    **summarize_prices(group),
+                }},
+                upsert=True
+            ))
+        if len(ops) >= 1000:
+            db.market_price_rollups.bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+    if ops:
+        db.market_price_rollups.bulk_write(ops, ordered=False)
+        written += len(ops)
+    print(f"✅ Market rollups: {written} period docs in {time.perf_counter() - started:.2f}s.")
+    return written
+
+
+def bump_market_version():
+    """Marks the market store as changed so every worker rebuilds its price snapshot."""
+    if db is None:
+        return
+    db.meta.update_one(
+        {"_id": "market_prices"},
+        {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+MARKET_NAME_COLUMNS = ("commodity", "state", "district", "market", "variety")
+
+
+def claim_market_rekey():
+    """True for the one worker that should migrate keys to the current alias table (once per alias edit)."""
+    fingerprint = market_cleaner.fingerprint
+    try:
+        db.meta.insert_one({"_id": "market_keys", "aliases": fingerprint})
+        return True
+    except pymongo.errors.DuplicateKeyError:
+        return db.meta.find_one_and_update({"_id": "market_keys", "aliases": {"$ne": fingerprint}},
+                                           {"$set": {"aliases": fingerprint}}) is not None
+
+
+def rekey_market_store():
+    """
+    Re-keys prices, mandis and price alerts stored under raw Agmarknet names
+    ("Paddy(Dhan)(Common)", "NCT of Delhi") to their canonical spelling, then
+    rebuilds the rollups. Where a canonical row already exists for the same
+    day, the newer canonical row wins and the old one is dropped.
+    """
+    if market_cleaner is None or not claim_market_rekey():
+        return
+    try:
+        started, moved, mandi_ids = time.perf_counter(), 0, {}
+        groups = db.market_prices.aggregate([{"$group": {"_id": {
+            "commodity": "$commodity", "state": "$state", "district": "$district",
+            "market": "$market", "variety": "$variety",
+        }}}])
+        for group in groups:
+            old = {column: group["_id"].get(column) for column in MARKET_NAME_COLUMNS}
+            new = {column: market_name(column, old[column]) or None for column in MARKET_NAME_COLUMNS}
+            new["variety"] = new["variety"] or "Other"
+            if new == old:
+                continue
+            new_id = market_id_for(new["state"], new["district"], new["market"])
+            fields = {**new, "market_id": new_id, "commodity_key": new["commodity"].lower()}
+            for doc in db.market_prices.find(old, {"_id": 1, "market_id": 1}):
+                mandi_ids[doc["market_id"]] = new_id
+                try:
+                    db.market_prices.update_one({"_id": doc["_id"]}, {"$set": fields})
+                except pymongo.errors.DuplicateKeyError:
+                    db.market_prices.delete_one({"_id": doc["_id"]})
+                moved += 1
+
+        for mandi in db.mandis.find():
+            new_id = mandi_ids.get(mandi["_id"], mandi["_id"])
+            commodities = sorted({market_name_key("commodity", c) for c in mandi.get("commodities", [])})
+            name = market_name("market", mandi["name"])  # acronym casing can change without a re-key
+            if new_id == mandi["_id"] and commodities == sorted(mandi.get("commodities", [])) and name == mandi["name"]:
+                continue
+            fields = {k: v for k, v in mandi.items() if k not in ("_id", "commodities")}
+            fields["name"] = name
+            sample = db.market_prices.find_one({"market_id": new_id}, {"market": 1, "district": 1, "state": 1})
+            if sample:
+                fields.update(name=sample["market"], district=sample.get("district"), state=sample.get("state"))
+            fields["name_key"] = " ".join(fields["name"].lower().split())
+            if new_id == mandi["_id"]:
+                db.mandis.update_one({"_id": new_id}, {"$set": {**fields, "commodities": commodities}})
+                continue
+            db.mandis.update_one({"_id": new_id},
+                                 {"$setOnInsert": fields, "$addToSet": {"commodities": {"$each": commodities}}},
+                                 upsert=True)
+            db.mandis.delete_one({"_id": mandi["_id"]})
+
+        for alert in db.price_alerts.find({}, {"commodity": 1, "commodity_key": 1, "market_id": 1, "market": 1}):
+            commodity = market_name("commodity", alert["commodity"])
+            market_id = mandi_ids.get(alert["market_id"], alert["market_id"])
+            recased = commodity != alert["commodity"] or (
+                alert.get("market") and market_name("market", alert["market"]) != alert["market"])
+            if commodity.lower() != alert["commodity_key"] or market_id != alert["market_id"] or recased:
+                mandi = db.mandis.find_one({"_id": market_id}, {"name": 1, "state": 1}) or {}
+                db.price_alerts.update_one({"_id": alert["_id"]}, {"$set": {
+                    "commodity": commodity, "commodity_key": commodity.lower(), "market_id": market_id,
+                    **({"market": mandi["name"], "state": mandi.get("state")} if mandi else {}),
+                }})
+
+        if moved:
+            db.market_price_rollups.delete_many({})
+            rollup_market_prices()
+            bump_market_version()
+        print(f"✅ Market keys migrated to alias table {market_cleaner.fingerprint}: "
+              f"{moved} price rows re-keyed in {time.perf_counter() - started:.2f}s.")
+    except Exception:
+        db.meta.update_one({"_id": "market_keys"}, {"$set": {"aliases": None}})  # retry on next start
+        raise
+
+
+def ensure_market_store():
+    db.mandis.create_index([("location", pymongo.GEOSPHERE)])
+    db.mandis.create_index("name_key")
+    # Unique (commodity, market, variety, arrival_date) key; also serves latest-price lookups
+    db.market_prices.create_index([("market_id", pymongo.ASCENDING), ("commodity_key", pymongo.ASCENDING),
+                                   ("arrival_date", pymongo.DESCENDING), ("variety", pymongo.ASCENDING)],
+                                  unique=True)
+    db.market_prices.create_index("updatedAt")
+    db.market_prices.create_index("arrival_date")
+    # Crossing lookups: one range scan per changed (commodity, market, direction)
+    db.price_alerts.create_index([("commodity_key", pymongo.ASCENDING), ("market_id", pymongo.ASCENDING),
+                                  ("direction", pymongo.ASCENDING), ("threshold", pymongo.ASCENDING)])
+    db.price_alerts.create_index("user_id")
+    db.notifications.create_index([("user_id", pymongo.ASCENDING), ("createdAt", pymongo.DESCENDING)])
+    for scope in ("market_key", "state_key"):
+        db.market_price_rollups.create_index([("commodity_key", pymongo.ASCENDING), (scope, pymongo.ASCENDING),
+                                              ("period", pymongo.ASCENDING), ("start", pymongo.ASCENDING)])
+    db.market_price_rollups.create_index([("commodity_key", pymongo.ASCENDING), ("period", pymongo.ASCENDING),
+                                          ("start", pymongo.ASCENDING)])
+    rekey_market_store()
+    if MOCK_MARKET_DATA and db.market_prices.estimated_document_count() == 0:
+        store_market_records(MOCK_MARKET_DATA)
+        bump_market_version()
+    if db.market_price_rollups.estimated_document_count() == 0:
+        rollup_market_prices()
+    locate_mandis()
+
+
+if db is not None:
+    try:
+        ensure_market_store()
+        print("✅ Market price store ready.")
+    except Exception as e:
+        print(f"⚠️ Error preparing market store: {e}")
+
+
+# ---------------- Agmarknet Incremental Sync ----------------
+# Pages through the data.gov.in Agmarknet resource one arrival_date at a time,
+# starting from a stored high-water mark, and bulk-upserts into market_prices.
+# Progress (day + offset) is checkpointed after every page in db.meta, so an
+# interrupted run resumes where it stopped; upserts make re-reads harmless.
+AGMARKNET_RESOURCE_URL = "https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070"
+AGMARKNET_PAGE_SIZE = 1000
+AGMARKNET_BACKFILL_DAYS = 7       # first run starts this far back
+AGMARKNET_OVERLAP_DAYS = 1        # re-read the last final day to catch late arrivals
+AGMARKNET_SYNC_INTERVAL = 3 * 3600
+
+
+def fetch_agmarknet_page(day, offset):
+    """One page of arrivals for `day`; returns (records, total reported by the API)."""
+    params = {
+        "api-key": DATA_GOV_API_KEY,
+        "format": "json",
+        "limit": AGMARKNET_PAGE_SIZE,
+        "offset": offset,
+        "filters[arrival_date]": day.strftime("%d/%m/%Y"),
+    }
+    data = requests.get(AGMARKNET_RESOURCE_URL, params=params, timeout=30).json()
+    if "records" not in data:
+        raise ValueError(f"Agmarknet response missing 'records': {str(data)[:200]}")
+    return data["records"], int(data.get("total") or 0)
+
+
+def sync_agmarknet():
+    """Incremental sync from the high-water mark up to today; returns run stats (None if disabled)."""
+    if db is None or not DATA_GOV_API_KEY:
+        return None
+    state = db.meta.find_one({"_id": "agmarknet_sync"}) or {}
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    high_water = state.get("high_water") or today - timedelta(days=AGMARKNET_BACKFILL_DAYS)
+    if state.get("cursor_day"):
+        day, offset = state["cursor_day"], state.get("cursor_offset", 0)
+        print(f"↩️ Resuming Agmarknet sync at {day:%d/%m/%Y} offset {offset}")
+    else:
+        day, offset = min(high_water, today - timedelta(days=AGMARKNET_OVERLAP_DAYS)), 0
+
+    # Rows stored by an interrupted run still need rollups, so keep the earliest start
+    rollup_since = state.get("rollup_since") or datetime.now(timezone.utc)
+    db.meta.update_one({"_id": "agmarknet_sync"}, {"$set": {"rollup_since": rollup_since}}, upsert=True)
+
+    started = time.perf_counter()
+    fetched = stored = pages = 0
+    while day <= today:
+        records, total = fetch_agmarknet_page(day, offset)
+        stored += store_market_records(records)
+        fetched += len(records)
+        pages += 1
+        offset += len(records)
+        if len(records) < AGMARKNET_PAGE_SIZE or (total and offset >= total):
+            if day < today:
+                high_water = max(high_water, day + timedelta(days=1))  # days before today are final
+            day, offset = day + timedelta(days=1), 0
+        db.meta.update_one({"_id": "agmarknet_sync"}, {"$set": {
+            "cursor_day": day, "cursor_offset": offset, "high_water": high_water,
+        }})
+
+    if stored:
+        rollup_market_prices(updated_since=rollup_since)
+        evaluate_price_alerts(updated_since=rollup_since)
+        locate_mandis()
+        bump_market_version()
+    seconds = time.perf_counter() - started
+    stats = {
+        "pages": pages,
+        "records": fetched,
+        "stored": stored,
+        "seconds": round(seconds, 2),
+        "records_per_sec": round(fetched / seconds, 1) if seconds else None,
+        "high_water": high_water.strftime("%Y-%m-%d"),
+        "finishedAt": datetime.now(timezone.utc),
+    }
+    db.meta.update_one({"_id": "agmarknet_sync"}, {
+        "$set": {"last_run": stats},
+        "$unset": {"cursor_day": "", "cursor_offset": "", "rollup_since": ""},
+    })
+    print(f"✅ Agmarknet sync: {fetched} records in {pages} pages, {stats['records_per_sec']} records/s, "
+          f"high-water {stats['high_water']}.")
+    return stats
+
+
+# ---------------- Market Price Snapshot (columnar) ----------------
+# Each worker keeps the last MARKET_SNAPSHOT_DAYS of stored prices as a
+# MarketTable and rebuilds it only when a sync bumps the store version.
+MARKET_SNAPSHOT_DAYS = 30
+MARKET_SNAPSHOT_CHECK_INTERVAL = 30
+_market_snapshot = {"table": None, "version": None, "checked": 0.0}
+_market_snapshot_lock = threading.Lock()
+
+
+def market_snapshot():
+    """MarketTable of recent stored prices, or None if the store is unavailable or empty."""
+    if db is None or MarketTable is None:
+        return None
+    if time.time() - _market_snapshot["checked"] < MARKET_SNAPSHOT_CHECK_INTERVAL:
+        return _market_snapshot["table"]
+    with _market_snapshot_lock:
+        if time.time() - _market_snapshot["checked"] < MARKET_SNAPSHOT_CHECK_INTERVAL:
+            return _market_snapshot["table"]
+        try:
+            meta = db.meta.find_one({"_id": "market_prices"}) or {}
+            version = meta.get("version", 0)
+            if _market_snapshot["table"] is None or version != _market_snapshot["version"]:
+                newest = db.market_prices.find_one({}, {"arrival_date": 1}, sort=[("arrival_date", -1)])
+                table = None
+                if newest:
+                    since = newest["arrival_date"] - timedelta(days=MARKET_SNAPSHOT_DAYS)
+                    rows = list(db.market_prices.find(
+                        {"arrival_date": {"$gte": since}, "outlier": {"$ne": True}},
+                        {"_id": 0, "commodity": 1, "state": 1, "district": 1, "market": 1, "variety": 1,
+                         "modal_price": 1, "min_price": 1, "max_price": 1, "arrival_date": 1}
+                    ))
+                    table = MarketTable.from_records(rows)
+                    print(f"✅ Market snapshot rebuilt: {len(table)} rows (v{version}).")
+                _market_snapshot.update(table=table, version=version)
+        except Exception as e:
+            print(f"⚠️ Market snapshot refresh failed: {e}")
+        _market_snapshot["checked"] = time.time()
+        return _market_snapshot["table"]
+
+
+def market_snapshot_version():
+    """Store version of the snapshot /market-prices would serve right now (tags its cache key)."""
+    market_snapshot()
+    return _market_snapshot["version"]
+
+
+def latest_prices(market_ids, commodity_key=None):
+    """{market_id: [latest row per (commodity, variety)]} from the local store."""
+    match = {"market_id": {"$in": market_ids}}
+    if commodity_key:
+        match["commodity_key"] = commodity_key
+    rows = db.market_prices.aggregate([
+        {"$match": match},
+        {"$sort": {"arrival_date": -1}},
+        {"$group": {"_id": {"market_id": "$market_id", "commodity_key": "$commodity_key", "variety": "$variety"},
+                    "row": {"$first": "$$ROOT"}}},
+    ])
+    by_market = {}
+    for group in rows:
+        row = group["row"]
+        by_market.setdefault(row["market_id"], []).append({
+            "commodity": row["commodity"],
+            "variety": row.get("variety"),
+            "modal_price": row["modal_price"],
+            "min_price": row.get("min_price"),
+            "max_price": row.get("max_price"),
+            "arrival_date": row["arrival_date"].strftime("%Y-%m-%d"),
+        })
+    for prices in by_market.values():
+        prices.sort(key=lambda p: (p["commodity"], p["variety"] or ""))
+    return by_market
+
+
+@app.route("/market-prices/nearby", methods=["GET"])
+def get_nearby_market_prices():
+    """
+    Latest prices at the k nearest mandis.
+    Query: lat & lon (or location=<place>), optional commodity, radius (km), limit.
+    """
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    try:
+        if request.args.get("lat") and request.args.get("lon"):
+            lat, lon = float(request.args["lat"]), float(request.args["lon"])
+        else:
+            place = resolve_location(request.args.get("location"))
+            if not place or place.get("lat") is None:
+                return jsonify({"error": "Provide lat and lon, or a location that can be geocoded."}), 400
+            lat, lon = place["lat"], place["lon"]
+        radius_km = min(float(request.args.get("radius", NEARBY_DEFAULT_RADIUS_KM)), NEARBY_MAX_RADIUS_KM)
+        limit = max(1, min(int(request.args.get("limit", NEARBY_DEFAULT_MARKETS)), NEARBY_MAX_MARKETS))
+    except ValueError:
+        return jsonify({"error": "lat, lon, radius and limit must be numbers."}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or radius_km <= 0:
+        return jsonify({"error": "Coordinates or radius out of range."}), 400
+
+    commodity = (request.args.get("commodity") or "").strip()
+    commodity_key = market_name_key("commodity", commodity) or None
+    try:
+        near = {
+            "near": geo_point(lat, lon),
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+        }
+        if commodity_key:
+            near["query"] = {"commodities": commodity_key}
+        mandis = list(db.mandis.aggregate([{"$geoNear": near}, {"$limit": limit}]))
+        prices = latest_prices([m["_id"] for m in mandis], commodity_key)
+
+        markets = [{
+            "market": m["name"],
+            "district": m.get("district"),
+            "state": m.get("state"),
+            "lat": m["location"]["coordinates"][1],
+            "lon": m["location"]["coordinates"][0],
+            "distance_km": round(m["distance_m"] / 1000, 1),
+            "prices": prices.get(m["_id"], []),
+        } for m in mandis]
+        return jsonify({
+            "origin": {"lat": lat, "lon": lon},
+            "radius_km": radius_km,
+            "commodity": commodity or None,
+            "markets": markets,
+        }), 200
+    except Exception as e:
+        print(f"❌ Nearby market prices error: {e}")
+        return jsonify({"error": "Could not look up nearby markets."}), 500
+
+
+@app.route("/market-prices/trend", methods=["GET"])
+def get_market_price_trend():
+    """
+    Price trend from the rollups only (one indexed range query):
+    /market-prices/trend?commodity=Wheat&market=Karnal Mandi|state=Haryana&period=day|week|month&days=90
+    """
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    commodity = (request.args.get("commodity") or "").strip()
+    if not commodity:
+        return jsonify({"error": "commodity parameter is required."}), 400
+    period = request.args.get("period", "day")
+    if period not in MARKET_ROLLUP_PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(MARKET_ROLLUP_PERIODS)}."}), 400
+    try:
+        days = min(max(int(request.args.get("days", MARKET_TREND_DEFAULT_DAYS)), 1), MARKET_TREND_MAX_DAYS)
+        until = parse_arrival_date(request.args["to"]) if request.args.get("to") else None
+        until = until or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return jsonify({"error": "days must be a number."}), 400
+    since = period_start(until - timedelta(days=days - 1), period)
+
+    query = {"commodity_key": market_name_key("commodity", commodity), "period": period,
+             "start": {"$gte": since, "$lte": until}}
+    if request.args.get("market"):
+        query["market_key"] = market_name_key("market", request.args["market"])
+    elif request.args.get("state"):
+        query["state_key"] = market_name_key("state", request.args["state"])
+    try:
+        series = {}
+        for doc in db.market_price_rollups.find(query, {"_id": 0}).sort("start", 1).limit(10000):
+            entry = series.setdefault(doc["market_id"], {
+                "market": doc["market"], "district": doc.get("district"), "state": doc.get("state"), "points": []
+            })
+            entry["points"].append({
+                "date": doc["start"].strftime("%Y-%m-%d"),
+                "min_price": doc["min_price"],
+                "max_price": doc["max_price"],
+                "median_price": doc["median_price"],
+                "modal_price": doc["modal_price"],
+                "samples": doc["samples"],
+            })
+        return jsonify({
+            "commodity": commodity,
+            "period": period,
+            "from": since.strftime("%Y-%m-%d"),
+            "to": until.strftime("%Y-%m-%d"),
+            "series": list(series.values()),
+        }), 200
+    except Exception as e:
+        print(f"❌ Market trend error: {e}")
+        return jsonify({"error": "Could not load price trend."}), 500
+
+
+# ---------------- Price Alerts ----------------
+# Subscriptions live in price_alerts indexed by (commodity, market, direction,
+# threshold). After a sync only the (market, commodity) series that changed are
+# evaluated: the previous and new price bound a range scan on that index, so
+# exactly the alerts whose threshold was crossed are read, then queued as
+# notifications. Alerts fire on every crossing, not while the price stays put.
+PRICE_ALERT_DIRECTIONS = ("above", "below")
+PRICE_ALERTS_PER_USER = 50
+
+
+def series_price(market_id, commodity_key):
+    """(latest arrival date, median modal price across varieties on that date), or None."""
+    rows = db.market_prices.find(
+        {"market_id": market_id, "commodity_key": commodity_key, "outlier": {"$ne": True}},
+        {"_id": 0, "arrival_date": 1, "modal_price": 1, "market": 1, "commodity": 1}
+    ).sort("arrival_date", -1).limit(20)
+    latest = []
+    for row in rows:
+        if latest and row["arrival_date"] != latest[0]["arrival_date"]:
+            break
+        latest.append(row)
+    if not latest:
+        return None
+    return latest[0], statistics.median(r["modal_price"] for r in latest)
+
+
+def evaluate_price_alerts(updated_since):
+    """Checks alerts on series with rows updated since `updated_since`; returns notifications queued."""
+    if db is None:
+        return 0
+    started = time.perf_counter()
+    touched = db.market_prices.aggregate([
+        {"$match": {"updatedAt": {"$gte": updated_since}}},
+        {"$group": {"_id": {"market_id": "$market_id", "commodity_key": "$commodity_key"}}},
+    ])
+    now = datetime.now(timezone.utc)
+    series_checked, queued = 0, 0
+    for group in touched:
+        key = group["_id"]
+        current = series_price(key["market_id"], key["commodity_key"])
+        if current is None:
+            continue
+        sample, price = current
+        mark_id = f"{key['market_id']}|{key['commodity_key']}"
+        mark = db.price_alert_marks.find_one_and_update(
+            {"_id": mark_id},
+            {"$set": {"price": price, "arrival_date": sample["arrival_date"], "updatedAt": now}},
+            upsert=True
+        )
+        series_checked += 1
+        previous = mark.get("price") if mark else None
+        if previous is None or previous == price:
+            continue  # first observation of this series, or no move
+
+        if price > previous:
+            crossed = {"direction": "above", "threshold": {"$gt": previous, "$lte": price}}
+        else:
+            crossed = {"direction": "below", "threshold": {"$gte": price, "$lt": previous}}
+        notifications = [{
+            "user_id": alert["user_id"],
+            "type": "price_alert",
+            "alert_id": alert["_id"],
+            "title": f"{sample['commodity']} {alert['direction']} ₹{alert['threshold']:g} at {sample['market']}",
+            "commodity": sample["commodity"],
+            "market": sample["market"],
+            "direction": alert["direction"],
+            "threshold": alert["threshold"],
+            "price": price,
+            "previous_price": previous,
+            "arrival_date": sample["arrival_date"],
+            "read": False,
+            "createdAt": now,
+        } for alert in db.price_alerts.find({**key, **crossed}, {"user_id": 1, "direction": 1, "threshold": 1})]
+        if notifications:
+            db.notifications.insert_many(notifications, ordered=False)
+            db.price_alerts.update_many(
+                {"_id": {"$in": [n["alert_id"] for n in notifications]}},
+                {"$set": {"last_triggered": now, "last_price": price}, "$inc": {"times_triggered": 1}}
+            )
+            queued += len(notifications)
+    print(f"✅ Price alerts: {series_checked} series checked, {queued} notifications queued "
+          f"in {time.perf_counter() - started:.2f}s.")
+    return queued
+
+
+def format_price_alert(alert):
+    return {
+        "id": str(alert["_id"]),
+        "commodity": alert["commodity"],
+        "market": alert["market"],
+        "state": alert.get("state"),
+        "direction": alert["direction"],
+        "threshold": alert["threshold"],
+        "last_triggered": alert["last_triggered"].isoformat() if alert.get("last_triggered") else None,
+        "created_at": alert["createdAt"].isoformat(),
+    }
+
+
+@app.route("/api/price-alerts", methods=["POST"])
+@token_required
+def create_price_alert(current_user):
+    """Body: {commodity, market, state (if the market name is ambiguous), direction: above|below, threshold}"""
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    data = request.get_json() or {}
+    commodity = market_name("commodity", data.get("commodity"))
+    market = market_name_key("market", data.get("market"))
+    direction = data.get("direction", "above")
+    try:
+        threshold = float(data.get("threshold"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "threshold must be a number."}), 400
+    if not commodity or not market:
+        return jsonify({"error": "commodity and market are required."}), 400
+    if direction not in PRICE_ALERT_DIRECTIONS or threshold <= 0:
+        return jsonify({"error": "direction must be 'above' or 'below' and threshold positive."}), 400
+
+    try:
+        mandi_query = {"name_key": market}
+        if data.get("state"):
+            mandi_query["state"] = re.compile(f"^{re.escape(market_name('state', data['state']))}$", re.IGNORECASE)
+        mandis = list(db.mandis.find(mandi_query, {"name": 1, "state": 1}).limit(2))
+        if not mandis:
+            return jsonify({"error": "Unknown market."}), 404
+        if len(mandis) > 1:
+            return jsonify({"error": "Several markets share this name; include the state."}), 400
+        if db.price_alerts.count_documents({"user_id": current_user["_id"]}) >= PRICE_ALERTS_PER_USER:
+            return jsonify({"error": f"You can have at most {PRICE_ALERTS_PER_USER} price alerts."}), 400
+
+        mandi = mandis[0]
+        alert = {
+            "user_id": current_user["_id"],
+            "commodity": commodity,
+            "commodity_key": commodity.lower(),  # canonical, as stored prices are keyed
+            "market": mandi["name"],
+            "market_id": mandi["_id"],
+            "state": mandi.get("state"),
+            "direction": direction,
+            "threshold": threshold,
+            "createdAt": datetime.now(timezone.utc),
+        }
+        alert["_id"] = db.price_alerts.insert_one(alert).inserted_id
+        return jsonify(format_price_alert(alert)), 201
+    except Exception as e:
+        print(f"Create price alert error: {e}")
+        return jsonify({"error": "Could not create price alert."}), 500
+
+
+@app.route("/api/price-alerts", methods=["GET"])
+@token_required
+def get_my_price_alerts(current_user):
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    try:
+        alerts = db.price_alerts.find({"user_id": current_user["_id"]}).sort("createdAt", -1)
+        return jsonify([format_price_alert(a) for a in alerts])
+    except Exception as e:
+        print(f"Get price alerts error: {e}")
+        return jsonify({"error": "Could not fetch price alerts."}), 500
+
+
+@app.route("/api/price-alerts/<alert_id>", methods=["DELETE"])
+@token_required
+def delete_price_alert(current_user, alert_id):
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    try:
+        result = db.price_alerts.delete_one({"_id": ObjectId(alert_id), "user_id": current_user["_id"]})
+        if result.deleted_count == 0:
+            return jsonify({"error": "Price alert not found."}), 404
+        return jsonify({"message": "Price alert deleted."}), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid alert ID."}), 400
+    except Exception as e:
+        print(f"Delete price alert error: {e}")
+        return jsonify({"error": "Could not delete price alert."}), 500
+
+
+@app.route("/api/notifications", methods=["GET"])
+@token_required
+def get_my_notifications(current_user):
+    """Newest first; ?unread=1 for unread only."""
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    query = {"user_id": current_user["_id"]}
+    if request.args.get("unread") == "1":
+        query["read"] = False
+    try:
+        rows = db.notifications.find(query).sort("createdAt", -1).limit(100)
+        return jsonify([{
+            "id": str(n["_id"]),
+            "type": n["type"],
+            "title": n["title"],
+            "commodity": n.get("commodity"),
+            "market": n.get("market"),
+            "price": n.get("price"),
+            "previous_price": n.get("previous_price"),
+            "threshold": n.get("threshold"),
+            "direction": n.get("direction"),
+            "read": n["read"],
+            "created_at": n["createdAt"].isoformat(),
+        } for n in rows])
+    except Exception as e:
+        print(f"Get notifications error: {e}")
+        return jsonify({"error": "Could not fetch notifications."}), 500
+
 
-        return jsonify({
-            "identification": identification,
-            "treatment": treatment,
-            "suggested_products": suggested_products
-        })
+@app.route("/api/notifications/read", methods=["POST"])
+@token_required
+def mark_notifications_read(current_user):
+    """Body: {ids: [...]} to mark specific notifications, or {} to mark all as read."""
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    query = {"user_id": current_user["_id"], "read": False}
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    try:
+        if ids:
+            query["_id"] = {"$in": [ObjectId(i) for i in ids]}
+        result = db.notifications.update_many(query, {"$set": {"read": True}})
+        return jsonify({"updated": result.modified_count}), 200
+    except InvalidId:
+        return jsonify({"error": "Invalid notification ID."}), 400
     except Exception as e:
-        print(f"Gemini AI error in /identify-pest: {e} — using local fallback")
-        demo_result = get_demo_pest_response(crop)
-        return jsonify({
-            "identification": demo_result["identification"],
-            "treatment": demo_result["treatment"],
-            "suggested_products": []
-        })
+        print(f"Mark notifications error: {e}")
+        return jsonify({"error": "Could not update notifications."}), 500
+
+
+# --- MARKET PRICE QUERY (filters, projection, sort, cursor paging) ---
+# /market-prices?commodity=&state=&district=&market=&fields=a,b&sort=-date|price&limit=20&cursor=...
+# Filters are case-insensitive exact matches. The body stays a plain list;
+# X-Total-Count and X-Next-Cursor headers carry the paging state.
+MARKET_PRICES_MAX_LIMIT = 5000
+MARKET_FILTERS = ("state", "commodity", "district", "market")
+MARKET_FIELDS = ("commodity", "state", "district", "market", "variety",
+                 "modal_price", "min_price", "max_price", "arrival_date")
+MARKET_SORTS = {"date": "arrival_date", "price": "modal_price",
+                **{f: f for f in MARKET_FIELDS if f != "variety"}}
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"]
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor.")
+    return offset
+
+
+def market_query_args():
+    """Parses the /market-prices query string; raises ValueError with a client-facing message."""
+    args = request.args
+    try:
+        limit = int(args.get("limit", MARKET_PRICES_MAX_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be a number.")
+    sort = args.get("sort", "-date").strip()
+    column = MARKET_SORTS.get(sort.lstrip("-"))
+    if column is None:
+        raise ValueError(f"sort must be one of: {', '.join(MARKET_SORTS)} (prefix '-' for descending).")
+    fields = [f.strip() for f in args.get("fields", "").split(",") if f.strip()] or None
+    unknown = [f for f in fields or [] if f not in MARKET_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return {
+        "filters": {name: market_name(name, args.get(name)) or None for name in MARKET_FILTERS},
+        "sort": column,
+        "descending": sort.startswith("-"),
+        "fields": fields,
+        "limit": max(1, min(limit, MARKET_PRICES_MAX_LIMIT)),
+        "offset": decode_cursor(args["cursor"]) if args.get("cursor") else 0,
+    }
+
+
+def market_prices_page(table, query):
+    """Applies a parsed query to a MarketTable and builds the paged JSON response."""
+    index = table.select(query["sort"], query["descending"], **query["filters"])
+    offset, limit = query["offset"], query["limit"]
+    rows = table.records(index[offset:offset + limit], query["fields"])
+    response = jsonify(rows)
+    response.headers["X-Total-Count"] = str(len(index))
+    if offset + limit < len(index):
+        response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
+    print(f"✅ Returning {len(rows)} of {len(index)} market records.")
+    return response
+
+
+def market_records_response(records, query):
+    if MarketTable is None:
+        return jsonify(records)
+    # Filters arrive canonicalized, so clean the names here too
+    clean = market_cleaner.clean(records)[0] if market_cleaner is not None else records
+    return market_prices_page(MarketTable.from_records(clean), query)
+
 
 # --- MARKET PRICE ROUTE (FINAL + VERIFIED) ---
 @app.route("/market-prices", methods=["GET"])
-@cache.memoize(timeout=1800)  # Cache 30 min
+@cached_compressed(timeout=1800, version=market_snapshot_version)  # Cache 30 min per distinct query
 def get_market_prices():
-    """Fetch live market prices from data.gov.in or return expanded local fallback data."""
+    """Market prices from the synced local store; live data.gov.in fetch or local fallback data on a cold start."""
     print("\n🔍 [Debug] /market-prices called")
 
     # Use expanded local dataset (25 commodities) as fallback
@@ -1216,20 +3583,28 @@ def get_market_prices():
         {"commodity": "Cotton", "state": "Gujarat", "district": "Rajkot", "market": "Rajkot Mandi", "modal_price": "7400", "arrival_date": "2025-12-13"}
     ]
 
+    try:
+        query = market_query_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # The live API is filtered by the names as sent, not their canonical spelling
+    state = request.args.get("state")
+    commodity = request.args.get("commodity")
+
+    # --- Serve from the synced local store when it has data ---
+    table = market_snapshot()
+    if table is not None and len(table):
+        return market_prices_page(table, query)
+
     # --- Check API key ---
     if not DATA_GOV_API_KEY:
         print("⚠ No DATA_GOV_API_KEY — returning mock data.")
-        return jsonify(MOCK_DATA_FALLBACK)
+        return market_records_response(MOCK_DATA_FALLBACK, query)
 
     print("🔑 DATA_GOV_API_KEY loaded:", "Yes" if DATA_GOV_API_KEY else "No")
 
     # --- API setup ---
-    API_RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"  # Agmarknet dataset
-    base_url = f"https://api.data.gov.in/resource/{API_RESOURCE_ID}"
-
-    # Get optional filters
-    state = request.args.get("state")
-    commodity = request.args.get("commodity")
+    base_url = AGMARKNET_RESOURCE_URL
 
     # --- API Params (Fixed) ---
     params = {
@@ -1257,19 +3632,25 @@ def get_market_prices():
 
         if "records" not in data:
             print("❌ API response missing 'records' — got:", data)
-            return jsonify(MOCK_DATA_FALLBACK)
+            return market_records_response(MOCK_DATA_FALLBACK, query)
 
         records = data["records"]
         print(f"📊 Record count from API: {len(records)}")
 
         if len(records) == 0:
             print("⚠️ No records found — returning fallback data.")
-            return jsonify(MOCK_DATA_FALLBACK)
+            return market_records_response(MOCK_DATA_FALLBACK, query)
 
         # --- Sample debug output ---
         sample = records[0]
         print("✅ Sample Record:", {k: sample[k] for k in list(sample.keys())[:6]})
 
+        if db is not None:
+            threading.Thread(target=sync_market_store, args=(records,), daemon=True).start()
+
+        if MarketTable is not None:
+            return market_records_response(records, query)
+
         # --- Format records for frontend ---
         formatted = [{
             "commodity": r.get("commodity", "Unknown"),
@@ -1285,17 +3666,108 @@ def get_market_prices():
 
     except requests.exceptions.Timeout:
         print("❌ Timeout fetching from data.gov.in — returning fallback data.")
-        return jsonify(MOCK_DATA_FALLBACK), 200
+        return market_records_response(MOCK_DATA_FALLBACK, query), 200
 
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
-        return jsonify(MOCK_DATA_FALLBACK), 200
+        return market_records_response(MOCK_DATA_FALLBACK, query), 200
 
 
 
 # ===================================================================
 # 🌿 ROUTE 1: AI-Powered DETAILED RECOMMENDATION
 # ===================================================================
+CROP_RANK_TOP = 6  # crops listed per recommendation
+
+SOIL_HINTS = {
+    "sandy": "low nutrient and water retention; choose short-duration or drought-tolerant crops.",
+    "loamy": "well-balanced soil; supports most cereals, pulses, and vegetables.",
+    "clay": "nutrient-rich but poorly drained; prefer paddy, sugarcane, or wetland crops.",
+    "black": "ideal for cotton, soybean, and cereals.",
+    "red": "needs frequent fertilization; suitable for pulses, millets, groundnut."
+}
+SEASON_HINTS = {
+    "kharif": "monsoon crops sown around June–July; focus on rainfed varieties.",
+    "rabi": "winter crops; irrigation and frost resistance matter.",
+    "summer": "short-season, high-temperature crops perform best."
+}
+
+
+def soil_season_summaries(soil, season):
+    soil_l, season_l = soil.lower(), season.lower()
+    soil_summary = next((hint for key, hint in SOIL_HINTS.items() if key in soil_l), "typical soil profile")
+    season_summary = next((hint for key, hint in SEASON_HINTS.items() if key in season_l), "general cropping season")
+    return soil_summary, season_summary
+
+
+@cache.memoize(timeout=86400, response_filter=bool)  # Cache 24 h; empty (failed) narratives are not cached
+def crop_narrative(soil, season, state, rainfall, temp, crop_labels):
+    """Gemini analysis text for crops already ranked locally, or "" on API error."""
+    soil_summary, season_summary = soil_season_summaries(soil, season)
+    prompt = f"""
+You are an expert Indian agronomist.
+A farmer from {state} has provided:
+
+🌱 Soil Type: {soil} ({soil_summary})
+🌤️ Season: {season} ({season_summary})
+🌧️ Rainfall: {rainfall} mm
+🌡️ Temperature: {temp} °C
+
+These crops were ranked most suitable, best first: {", ".join(crop_labels)}.
+Do not list crops again. Write only this analysis in markdown:
+
+### Detailed Agronomic Analysis
+
+**Environmental Check:** Comment on weather & soil suitability.
+
+**Crop Suitability Reasoning:** One line on why each crop fits the conditions.
+
+**Fertilizer & Nutrient Advisory:** NPK (kg/ha) for the top 2 crops + micronutrients (ZnSO₄, SSP, Gypsum).
+
+**Water Management:** Brief irrigation/drainage advice.
+
+**Market & Yield Outlook:** Typical yield & demand in {state}.
+
+**Management Tips:** 5 practical steps for farmers (intercropping, mulching, pest care).
+"""
+    try:
+        response = generate_content_with_backoff(model, prompt)
+        text = getattr(response, "text", "").strip()
+    except Exception as e:
+        print(f"⚠️ Crop narrative failed: {e}")
+        return ""
+    return "" if not text or "error" in text.lower() else text
+
+
+def local_crop_analysis(ranking, soil, season, state, rainfall, temp, registry):
+    """Markdown analysis assembled from the scoring reasons and registry doses."""
+    soil_summary, season_summary = soil_season_summaries(soil, season)
+    lines = [
+        "### Detailed Agronomic Analysis\n",
+        f"**Environmental Check:** {soil} soil — {soil_summary} {season} — {season_summary} "
+        f"Rainfall {rainfall:g} mm, temperature {temp:g}°C in {state}.\n",
+        "**Crop Suitability Reasoning:**",
+    ]
+    lines += [f"- {r['emoji']} **{r['label']}** ({r['score']}%): {'; '.join(r['reasons'])}." for r in ranking]
+
+    doses = [(r, registry.crops[r["crop"]]) for r in ranking if registry.crops[r["crop"]].npk][:2]
+    if doses:
+        lines.append("\n**Fertilizer & Nutrient Advisory:**")
+        for r, crop in doses:
+            n, p, k = crop.npk
+            lines.append(f"- {crop.label}: {n}-{p}-{k} kg/ha N-P₂O₅-K₂O ≈ {crop.dose['urea_kg']} kg Urea, "
+                         f"{crop.dose['dap_kg']} kg DAP, {crop.dose['mop_kg']} kg MOP.")
+        lines.append("- Add ZnSO₄ @ 25 kg/ha on zinc-deficient soils; confirm doses with a soil test.")
+
+    lines += [
+        "\n**General Tips:**",
+        "- Test your soil at your nearest KVK for precise NPK values",
+        "- Apply compost @ 5 tonnes/ha to improve soil health",
+        "- Use certified seeds of improved varieties",
+        "- Contact your local agricultural extension officer for state-specific advice",
+    ]
+    return "\n".join(lines)
+
 
 @app.route("/detailed-recommendation", methods=["POST"])
 def detailed_recommendation():
@@ -1325,28 +3797,6 @@ def detailed_recommendation():
             print(f"✅ [CropRec] Local DB match: soil={soil}, season={season}, state={state}")
             return jsonify(local_rec), 200
 
-        if not model:
-            # Return a reasonable generic fallback
-            return jsonify({
-                "remarks": ["✅ Using estimated recommendation (AI model not configured)."],
-                "crops": (
-                    "1. 🌾 Rice / Wheat (season-dependent)\n"
-                    "2. 🌽 Maize\n3. 🫘 Legume crops (Soybean/Chickpea)\n"
-                    "4. 🥜 Oilseeds (Groundnut/Mustard)\n5. 🌿 Vegetables"
-                ),
-                "analysis": (
-                    "### General Agronomic Recommendation\n\n"
-                    f"For **{soil} soil** in **{state}** during **{season}** season:\n\n"
-                    f"**Environmental Check:** Rainfall {rainfall}mm and temperature {temp}°C are being analyzed.\n\n"
-                    "**General Tips:**\n"
-                    "- Test your soil at your nearest KVK for precise NPK values\n"
-                    "- Apply compost @ 5 tonnes/ha to improve soil health\n"
-                    "- Use certified seeds of improved varieties\n"
-                    "- Contact your local agricultural extension officer for state-specific advice\n\n"
-                    "*Note: AI model is not configured. For precise recommendations, please set up the Gemini API key.*"
-                )
-            }), 200
-
         # --- Sanity checks ---
         remarks = []
         if temp > 50:
@@ -1361,90 +3811,32 @@ def detailed_recommendation():
         elif rainfall > 3000:
             remarks.append("⚠️ Excess rainfall; drainage essential.")
 
-        # --- Soil & Season Knowledge ---
-        soil_hints = {
-            "sandy": "low nutrient and water retention; choose short-duration or drought-tolerant crops.",
-            "loamy": "well-balanced soil; supports most cereals, pulses, and vegetables.",
-            "clay": "nutrient-rich but poorly drained; prefer paddy, sugarcane, or wetland crops.",
-            "black": "ideal for cotton, soybean, and cereals.",
-            "red": "needs frequent fertilization; suitable for pulses, millets, groundnut."
-        }
-        season_hint = {
-            "kharif": "monsoon crops sown around June–July; focus on rainfed varieties.",
-            "rabi": "winter crops; irrigation and frost resistance matter.",
-            "summer": "short-season, high-temperature crops perform best."
-        }
-
-        soil_summary = soil_hints.get(soil.lower(), "typical soil profile")
-        season_summary = season_hint.get(season.lower(), "general cropping season")
-
-        # --- Build AI Prompt ---
-        prompt = f"""
-You are an expert Indian agronomist.
-A farmer from {state} has provided:
-
-🌱 Soil Type: {soil} ({soil_summary})
-🌤️ Season: {season} ({season_summary})
-🌧️ Rainfall: {rainfall} mm
-🌡️ Temperature: {temp} °C
-Preferred Crop: {crop_pref or "None"}
-
-Please give a detailed agronomic recommendation in this format:
-
-1. **Recommended Crops:** List 4–6 suitable crops (with emojis).
-
----ANALYSIS---
-
-### Detailed Agronomic Analysis
-
-**Environmental Check:** Comment on weather & soil suitability.
-
-**Crop Suitability Reasoning:** Explain why each crop fits the conditions.
-
-**Fertilizer & Nutrient Advisory:** Suggest NPK (kg/ha) for top 2 crops + micronutrients (ZnSO₄, SSP, Gypsum).
-
-**Water Management:** Brief irrigation/drainage advice.
-
-**Market & Yield Outlook:** Typical yield & demand in {state}.
-
-**Management Tips:** 5 practical steps for farmers (intercropping, mulching, pest care).
-"""
-
-        response = generate_content_with_backoff(model, prompt)
-        text = getattr(response, "text", "").strip()
-
-        # ✅ Check for API errors in text response
-        if not text or "error" in text.lower():
-            fallback_text = (
-                "### General Agronomic Recommendation\n\n"
-                f"For **{soil} soil** in **{state}** during **{season}** season:\n\n"
-                f"**Environmental Check:** Rainfall {rainfall}mm and temperature {temp}°C are being analyzed.\n\n"
-                "**General Tips:**\n"
-                "- Test your soil at your nearest KVK for precise NPK values\n"
-                "- Apply compost @ 5 tonnes/ha to improve soil health\n"
-                "- Use certified seeds of improved varieties\n"
-                "- Contact your local agricultural extension officer for state-specific advice"
-            )
-            return jsonify({
-                "remarks": ["⚠️ Using estimated recommendation (Gemini API error)."],
-                "crops": "1. 🌾 Rice / Wheat (season-dependent)\n2. 🌽 Maize\n3. 🫘 Legume crops\n4. 🥜 Oilseeds\n5. 🌿 Vegetables",
-                "analysis": fallback_text
-            }), 200
-
-        crops, analysis = "", ""
-        if "---ANALYSIS---" in text:
-            parts = text.split("---ANALYSIS---", 1)
-            crops, analysis = parts[0].strip(), parts[1].strip()
-        else:
-            crops = text.strip()
-
-        crops = crops.replace("**Recommended Crops:**", "").replace("**", "").strip()
-
-        return jsonify({
-            "remarks": remarks,
-            "crops": crops,
-            "analysis": analysis
-        })
+        # --- Local suitability ranking (no model call) ---
+        registry = crop_registry.current
+        scorer = current_crop_scorer()
+        ranking = scorer.rank(soil, season, state, rainfall, temp, top=CROP_RANK_TOP)
+        crops = "\n".join(f"{i}. {r['emoji']} {r['label']} — {r['score']}% match"
+                           for i, r in enumerate(ranking, 1))
+        result = {"remarks": remarks, "crops": crops, "scores": ranking}
+
+        preferred = registry.resolve(crop_pref) if crop_pref else None
+        if preferred:
+            preference = scorer.score_of(preferred, soil, season, state, rainfall, temp)
+            if preference:
+                result["preference"] = preference
+                if preferred not in (r["crop"] for r in ranking):
+                    remarks.append(f"ℹ️ Your preferred crop {preference['label']} scores "
+                                   f"{preference['score']}% for these conditions.")
+
+        # --- Narrative: Gemini when available, else built from the scores ---
+        analysis = None
+        if model:
+            analysis = crop_narrative(soil, season, state, round(rainfall, -1), round(temp),
+                                      tuple(r["label"] for r in ranking))
+            if not analysis:
+                remarks.append("⚠️ Using local analysis (Gemini API error).")
+        result["analysis"] = analysis or local_crop_analysis(ranking, soil, season, state, rainfall, temp, registry)
+        return jsonify(result)
 
     except Exception as e:
         print(f"💥 Error in /detailed-recommendation: {e}")
@@ -1468,40 +3860,17 @@ def smart_fertilizer():
         if not crop:
             return jsonify({"error": "Crop name is required."}), 400
 
-        # Expanded dataset covering 20+ common crops (reduces Gemini calls)
-        CROP_DATA = {
-            "rice": {"N": 100, "P2O5": 50, "K2O": 50},
-            "paddy": {"N": 100, "P2O5": 50, "K2O": 50},
-            "wheat": {"N": 120, "P2O5": 60, "K2O": 40},
-            "maize": {"N": 150, "P2O5": 75, "K2O": 50},
-            "corn": {"N": 150, "P2O5": 75, "K2O": 50},
-            "sugarcane": {"N": 250, "P2O5": 115, "K2O": 120},
-            "cotton": {"N": 110, "P2O5": 15, "K2O": 35},
-            "potato": {"N": 180, "P2O5": 90, "K2O": 120},
-            "soybean": {"N": 25, "P2O5": 60, "K2O": 40},
-            "groundnut": {"N": 20, "P2O5": 40, "K2O": 20},
-            "mustard": {"N": 80, "P2O5": 40, "K2O": 40},
-            "sunflower": {"N": 90, "P2O5": 60, "K2O": 60},
-            "chickpea": {"N": 20, "P2O5": 50, "K2O": 20},
-            "lentil": {"N": 20, "P2O5": 40, "K2O": 20},
-            "mungbean": {"N": 20, "P2O5": 40, "K2O": 20},
-            "mung": {"N": 20, "P2O5": 40, "K2O": 20},
-            "bajra": {"N": 80, "P2O5": 40, "K2O": 20},
-            "jowar": {"N": 80, "P2O5": 40, "K2O": 40},
-            "tomato": {"N": 100, "P2O5": 60, "K2O": 80},
-            "onion": {"N": 100, "P2O5": 50, "K2O": 50},
-            "brinjal": {"N": 100, "P2O5": 50, "K2O": 50},
-            "banana": {"N": 200, "P2O5": 60, "K2O": 220},
-            "turmeric": {"N": 60, "P2O5": 30, "K2O": 60},
-        }
+        # Crops with a published dose come from the registry (reduces Gemini calls)
+        registry = crop_registry.current
+        known = registry.get(crop)
+        base = dict(zip(("N", "P2O5", "K2O"), known.npk)) if known and known.npk else None
 
         # --- If crop is known: Use your logic directly ---
-        if crop in CROP_DATA:
+        if base:
             has_soil = all(k in data and data[k] is not None for k in ["n", "p", "k"])
 
             if has_soil:
                 n, p, k = float(data.get("n", 0)), float(data.get("p", 0)), float(data.get("k", 0))
-                base = CROP_DATA[crop]
                 n_req, p_req, k_req = base["N"], base["P2O5"], base["K2O"]
 
                 def adjust(value, low, high, name):
@@ -1528,7 +3897,6 @@ def smart_fertilizer():
             else:
                 yield_target = float(re.findall(r"[\d.]+", str(data.get("yield_target", 20)))[0])
                 irrigation = (data.get("irrigation") or "irrigated").lower()
-                base = CROP_DATA[crop]
                 scale = yield_target / 20
                 n_req, p_req, k_req = base["N"] * scale, base["P2O5"] * scale, base["K2O"] * scale
 
@@ -1585,23 +3953,17 @@ def smart_fertilizer():
 
             return jsonify(ai_data), 200
 
-        # --- Convert to fertilizer quantities ---
-        dap_kg = p_req / 0.46
-        dap_n = dap_kg * 0.18
-        urea_kg = max((n_req - dap_n) / 0.46, 0)
-        mop_kg = k_req / 0.60
-        urea_kg, dap_kg, mop_kg = round(urea_kg, 1), round(dap_kg, 1), round(mop_kg, 1)
+        # --- Convert to fertilizer quantities (registry contents and prices) ---
+        dose = fertilizer_dose(n_req, p_req, k_req, registry.fertilizers)
 
-        recs.append(f"Use ~{urea_kg} kg Urea, {dap_kg} kg DAP, {mop_kg} kg MOP per hectare.")
+        recs.append(f"Use ~{dose['urea_kg']} kg Urea, {dose['dap_kg']} kg DAP, {dose['mop_kg']} kg MOP per hectare.")
         recs.append("Consider ZnSO₄ @ 25 kg/ha every 2 years.")
 
-        total_cost = round(urea_kg*6 + dap_kg*25 + mop_kg*20, 0)
-
         return jsonify({
-            "urea_kg": urea_kg,
-            "dap_kg": dap_kg,
-            "mop_kg": mop_kg,
-            "estimated_cost_rs": total_cost,
+            "urea_kg": dose["urea_kg"],
+            "dap_kg": dose["dap_kg"],
+            "mop_kg": dose["mop_kg"],
+            "estimated_cost_rs": dose["cost_rs"],
             "recommendations": recs
         }), 200
 
@@ -1610,100 +3972,73 @@ def smart_fertilizer():
         return jsonify({"error": str(e)}), 500
     
     
-# ---------------- Local Helper Functions (Unchanged) ----------------
-
-# --- Utility: classify nutrients ---
-def analyze_fertility(n, p, k, ph):
-    """Simple soil analysis logic."""
-    levels, recommendations = {}, []
-
-    # pH Level
-    if ph < 5.5:
-        levels["ph_level"] = "Low"
-        recommendations.append("Soil is acidic — apply lime or dolomite to increase pH.")
-    elif ph > 8.0:
-        levels["ph_level"] = "High"
-        recommendations.append("Soil is alkaline — apply gypsum or sulfur-based amendments.")
-    else:
-        levels["ph_level"] = "Medium"
-        recommendations.append("pH is suitable for most crops.")
-
-    # Nitrogen
-    if n < 100:
-        levels["n_level"] = "Low"
-        recommendations.append("Apply Nitrogen fertilizer (e.g. Urea, Ammonium Nitrate).")
-    else:
-        levels["n_level"] = "Medium"
-
-    # Phosphorus
-    if p < 20:
-        levels["p_level"] = "Low"
-        recommendations.append("Apply Phosphorus fertilizer (e.g. DAP, Single Super Phosphate).")
-    else:
-        levels["p_level"] = "Medium"
-
-    # Potassium
-    if k < 100:
-        levels["k_level"] = "Low"
-        recommendations.append("Apply Potassium fertilizer (e.g. MOP or Potassium Nitrate).")
-    else:
-        levels["k_level"] = "Medium"
-
-    return levels, recommendations
-
-
-# --- Utility: fertilizer recommendation for crops ---
-def get_fertilizer_recommendation(n, p, k, crop):
-    CROP_DATA = {
-        "rice": {"N": 120, "P": 60, "K": 60},
-        "wheat": {"N": 150, "P": 60, "K": 40},
-        "maize": {"N": 180, "P": 80, "K": 50},
-        "sugarcane": {"N": 250, "P": 80, "K": 120},
-        "cotton": {"N": 160, "P": 70, "K": 80},
-        "potato": {"N": 180, "P": 100, "K": 120},
-    }
-
-    FERTILIZER_DATA = {
-        "urea": {"N": 0.46, "P": 0, "K": 0},
-        "dap": {"N": 0.18, "P": 0.46, "K": 0},
-        "mop": {"N": 0, "P": 0, "K": 0.60},
-    }
+# ---------------- Soil Fertility Analysis ----------------
+# analyze_fertility() / get_fertilizer_recommendation() and their batch
+# counterparts live in fertility_engine.py (imported at the top).
+
+SOIL_SAMPLE_FIELDS = ("n", "p", "k", "ph", "organic_matter")
+SOIL_SAMPLE_DEFAULTS = {**dict.fromkeys(SOIL_SAMPLE_FIELDS, 0), "crop": "rice"}
+
+
+def analyze_soil_samples(samples, registry):
+    """/analyze-fertility levels, fertilizer plan and advice for each sample, computed column-wise."""
+    rows, values, crops, results = parse_samples(samples, SOIL_SAMPLE_FIELDS, SOIL_SAMPLE_DEFAULTS)
+    n, p, k, ph, organic = values.T
+    fertility = fertility_batch(n, p, k, ph)
+    plans = fertilizer_batch(n, p, k, crops, registry)
+    low_organic = (organic < 1).tolist()
+    for i, (levels, base_recs), fert, low in zip(rows, fertility, plans, low_organic):
+        if "error" in fert:
+            results[i] = fert
+            continue
+        recs = base_recs + fert["recommendations"]
+        if low:
+            recs.append("Organic matter is low; add compost or manure to improve soil structure.")
+        results[i] = {
+            "levels": levels,
+            "fertilizer_plan": {"urea_kg": fert["urea_kg"], "dap_kg": fert["dap_kg"], "mop_kg": fert["mop_kg"]},
+            "recommendations": recs,
+        }
+    return results
 
-    target_crop = CROP_DATA.get(crop.lower())
-    if not target_crop:
-        return {"error": f"Crop '{crop}' not found in database."}
-
-    # Calculate nutrient gaps
-    n_gap = max(0, target_crop["N"] - n)
-    p_gap = max(0, target_crop["P"] - p)
-    k_gap = max(0, target_crop["K"] - k)
-
-    # Calculate fertilizer requirements
-    kg_mop = k_gap / FERTILIZER_DATA["mop"]["K"] if k_gap > 0 else 0
-    kg_dap = p_gap / FERTILIZER_DATA["dap"]["P"] if p_gap > 0 else 0
-    n_from_dap = kg_dap * FERTILIZER_DATA["dap"]["N"]
-    n_still_needed = max(0, n_gap - n_from_dap)
-    kg_urea = n_still_needed / FERTILIZER_DATA["urea"]["N"] if n_still_needed > 0 else 0
-
-    recommendations = [
-        f"For {crop.title()}, you need to add {round(n_gap)} kg/ha N, {round(p_gap)} kg/ha P, {round(k_gap)} kg/ha K.",
-        f"Use approximately {round(kg_urea, 1)} kg Urea, {round(kg_dap, 1)} kg DAP, and {round(kg_mop, 1)} kg MOP.",
-        "Apply fertilizers in split doses following crop growth stages."
-    ]
 
-    return {
-        "urea_kg": round(kg_urea, 1),
-        "dap_kg": round(kg_dap, 1),
-        "mop_kg": round(kg_mop, 1),
-        "recommendations": recommendations,
-    }
+def analyze_fertility_batch(data, samples):
+    """Batch /analyze-fertility: per-sample levels, plan and advice; weather is looked up once for the batch."""
+    started = time.perf_counter()
+    registry = crop_registry.current
+    location = data.get("location", "Unknown")
+    try:
+        w = get_weather(resolve_location(location)["id"])
+        weather = {"temperature": round(w["temperature"], 1), "condition": w["condition"]}
+    except Exception:
+        weather = None
+
+    if data.get("format") == "columns":
+        rows, values, crops, results = parse_samples(samples, SOIL_SAMPLE_FIELDS, SOIL_SAMPLE_DEFAULTS)
+        n, p, k, ph, organic = values.T
+        plan = fertilizer_plan_columns(n, p, k, crops, registry)
+        unknown_crop_errors(rows, crops, plan.pop("known"), results)
+        columns = {**fertility_level_names(n, p, k, ph),
+                   "urea_kg": plan["urea_kg"], "dap_kg": plan["dap_kg"], "mop_kg": plan["mop_kg"],
+                   "organic_matter_low": (organic < 1).tolist()}
+        return soil_batch_response(results, started, columns=columns, rows=rows,
+                                   location=location, weather=weather)
+
+    results = analyze_soil_samples(samples, registry)
+    return soil_batch_response(results, started, location=location, weather=weather)
 
 
 # --- Main Route ---
 @app.route("/analyze-fertility", methods=["POST"])
 def analyze_fertility_route():
+    request.max_content_length = FERTILITY_BATCH_MAX_BYTES
     try:
         data = request.get_json()
+        samples, error = soil_samples_arg(data)
+        if error:
+            return error
+        if samples is not None:
+            return analyze_fertility_batch(data, samples)
         n = float(data.get("n", 0))
         p = float(data.get("p", 0))
         k = float(data.get("k", 0))
@@ -1715,15 +4050,13 @@ def analyze_fertility_route():
         # Step 1: Base nutrient analysis
         levels, base_recs = analyze_fertility(n, p, k, ph)
 
-        # Step 2: Weather info
+        # Step 2: Weather info (shares the canonical weather cache)
         try:
-            city = location.split(",")[0]
-            weather_url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric"
-            res = requests.get(weather_url, timeout=3)
-            w = res.json()
+            place = resolve_location(location)
+            w = get_weather(place["id"])
             weather = {
-                "temperature": round(w["main"]["temp"], 1),
-                "condition": w["weather"][0]["main"],
+                "temperature": round(w["temperature"], 1),
+                "condition": w["condition"],
             }
         except Exception:
             weather = {
@@ -1732,7 +4065,7 @@ def analyze_fertility_route():
             }
 
         # Step 3: Fertilizer recommendation
-        fert = get_fertilizer_recommendation(n, p, k, crop)
+        fert = get_fertilizer_recommendation(n, p, k, crop, crop_registry.current)
 
         # Combine recommendations
         recs = base_recs + fert["recommendations"]
@@ -1755,78 +4088,563 @@ def analyze_fertility_route():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# ---------------- Soil Analysis Jobs ----------------
+# Cooperatives upload CSV / JSONL files of plots; each upload becomes a job in
+# db.soil_jobs, stored on disk and run by a thread pool in this process (no
+# broker). Rows stream through generator stages (read -> chunk -> analyze ->
+# write NDJSON) so memory stays flat, and progress is written to Mongo so any
+# worker can answer polls. A job whose heartbeat stops (worker died) is picked
+# up again by the recover-soil-jobs task and rerun from the start.
+SOIL_JOB_FOLDER = os.path.join(os.getcwd(), "soil_jobs")
+os.makedirs(SOIL_JOB_FOLDER, exist_ok=True)
+SOIL_JOB_MAX_BYTES = 50 * 1024 * 1024  # 50MB per upload
+SOIL_JOB_CHUNK_ROWS = 2000
+SOIL_JOB_WORKERS = int(os.getenv("SOIL_JOB_WORKERS", "2"))
+SOIL_JOB_STALE_AFTER = 120           # seconds without a heartbeat before a job is taken over
+SOIL_JOB_RECOVER_INTERVAL = 60
+SOIL_JOB_RETENTION = timedelta(days=7)
+SOIL_JOB_EVENTS_TIMEOUT = 30         # longest a progress stream holds a request thread; clients reconnect
+SOIL_JOB_REQUIRED_FIELDS = ("n", "p", "k", "ph")  # an uploaded row without these is an error, not defaults
+SOIL_JOB_CSV_COLUMNS = ("row", "plot_id", "ph_level", "n_level", "p_level", "k_level",
+                        "urea_kg", "dap_kg", "mop_kg", "recommendations", "error")
+
+_soil_job_executor = ThreadPoolExecutor(max_workers=SOIL_JOB_WORKERS, thread_name_prefix="soil-job")
+
+
+def soil_job_path(job_id, name):
+    return os.path.join(SOIL_JOB_FOLDER, f"{job_id}.{name}")
+
+
+def format_soil_job(job):
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "filename": job.get("filename"),
+        "rows": job.get("rows", 0),
+        "failed": job.get("failed", 0),
+        "progress": job.get("progress", 0.0),
+        "error": job.get("error"),
+        "createdAt": job["createdAt"].isoformat(),
+        "finishedAt": job["finishedAt"].isoformat() if job.get("finishedAt") else None,
+    }
+
+
+def soil_job_rows(f, fmt):
+    """Stage 1: (row_number, sample or error) from the stored upload; blank CSV cells count as missing."""
+    for row_number, row in iter_bulk_rows(f, fmt):
+        if isinstance(row, dict):
+            row = {k: v for k, v in row.items() if not (isinstance(v, str) and not v.strip()) and v is not None}
+            missing = [field for field in SOIL_JOB_REQUIRED_FIELDS if field not in row]
+            if missing:
+                row = f"Missing {', '.join(missing)}."
+        yield row_number, row
+
+
+def soil_job_chunks(rows, size=SOIL_JOB_CHUNK_ROWS):
+    """Stage 2: lists of up to `size` rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def soil_job_results(chunks, registry):
+    """Stage 3: analyzes each chunk column-wise; yields lists of output records in row order."""
+    for chunk in chunks:
+        samples = [row for _, row in chunk if isinstance(row, dict)]
+        analyzed = iter(analyze_soil_samples(samples, registry))
+        records = []
+        for row_number, row in chunk:
+            record = {"row": row_number}
+            if isinstance(row, dict):
+                plot_id = row.get("plot_id") or row.get("id")
+                if plot_id is not None:
+                    record["plot_id"] = plot_id
+                record.update(next(analyzed))
+            else:
+                record["error"] = str(row)
+            records.append(record)
+        yield records
+
+
+def run_soil_job(job_id):
+    """Claims a queued (or abandoned) job and runs it; returns quietly if another worker holds it."""
+    claim = os.urandom(8).hex()
+    now = datetime.now(timezone.utc)
+    job = db.soil_jobs.find_one_and_update(
+        {"_id": job_id, "$or": [{"status": "queued"},
+                                {"status": "running", "heartbeat": {"$lt": now - timedelta(seconds=SOIL_JOB_STALE_AFTER)}}]},
+        {"$set": {"status": "running", "claim": claim, "heartbeat": now, "rows": 0, "failed": 0, "progress": 0.0}},
+        return_document=pymongo.ReturnDocument.AFTER,
+    )
+    if not job:
+        return
+
+    started = time.perf_counter()
+    registry = crop_registry.current  # one registry version for the whole file
+    mine = {"_id": job_id, "claim": claim, "status": "running"}
+    input_path, output_path = soil_job_path(job_id, job["format"]), soil_job_path(job_id, "ndjson")
+    part_path = soil_job_path(job_id, f"{claim}.part")  # per claim, so a taken-over run never shares a file
+    rows = failed = 0
+    try:
+        size = max(os.path.getsize(input_path), 1)
+        with open(input_path, "rb") as f, open(part_path, "w", encoding="utf-8") as out:
+            for records in soil_job_results(soil_job_chunks(soil_job_rows(f, job["format"])), registry):
+                out.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+                rows += len(records)
+                failed += sum(1 for r in records if "error" in r)
+                # The CSV/JSONL reader closes the file once it hits EOF; read-ahead makes this a slight overestimate
+                progress = 1.0 if f.closed else round(min(f.tell() / size, 1.0), 3)
+                updated = db.soil_jobs.update_one(mine, {"$set": {
+                    "rows": rows, "failed": failed, "progress": progress,
+                    "heartbeat": datetime.now(timezone.utc),
+                }})
+                if updated.matched_count == 0:
+                    print(f"⚠️ Soil job {job_id} cancelled or taken over; stopping.")
+                    return
+        if rows == 0:
+            raise ValueError("No rows found in upload.")
+        if db.soil_jobs.count_documents(mine, limit=1) == 0:
+            print(f"⚠️ Soil job {job_id} cancelled before its results were saved.")
+            return
+        os.replace(part_path, output_path)
+        db.soil_jobs.update_one(mine, {"$set": {
+            "status": "done", "rows": rows, "failed": failed, "progress": 1.0,
+            "registry_version": registry.version, "finishedAt": datetime.now(timezone.utc),
+        }})
+        print(f"🧪 Soil job {job_id}: {rows} rows ({failed} failed) in {time.perf_counter() - started:.2f}s")
+    except UnicodeDecodeError:
+        db.soil_jobs.update_one(mine, {"$set": {"status": "failed", "error": "File must be UTF-8 encoded.",
+                                                "finishedAt": datetime.now(timezone.utc)}})
+    except Exception as e:
+        print(f"❌ Soil job {job_id} failed: {e}")
+        message = str(e) if isinstance(e, ValueError) else "Could not process upload."
+        db.soil_jobs.update_one(mine, {"$set": {"status": "failed", "error": message,
+                                                "finishedAt": datetime.now(timezone.utc)}})
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def remove_soil_job_files(job_id):
+    for path in glob.glob(soil_job_path(job_id, "*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_orphan_soil_job_files(older_than):
+    """Deletes files whose job no longer exists (e.g. results saved just as the job was deleted)."""
+    job_ids = {}
+    for path in glob.glob(os.path.join(SOIL_JOB_FOLDER, "*")):
+        name = os.path.basename(path).split(".", 1)[0]
+        try:
+            if os.path.getmtime(path) < older_than.timestamp():  # uploads are written before their job row
+                job_ids.setdefault(ObjectId(name), []).append(path)
+        except (InvalidId, OSError):
+            continue
+    if not job_ids:
+        return
+    existing = {job["_id"] for job in db.soil_jobs.find({"_id": {"$in": list(job_ids)}}, {"_id": 1})}
+    for job_id in job_ids.keys() - existing:
+        remove_soil_job_files(job_id)
+
+
+def recover_soil_jobs():
+    """Resubmits queued jobs and jobs whose worker stopped heartbeating; expires old jobs and orphaned files."""
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=SOIL_JOB_STALE_AFTER)
+    for job in db.soil_jobs.find({"$or": [{"status": "queued", "createdAt": {"$lt": stale}},
+                                          {"status": "running", "heartbeat": {"$lt": stale}}]}, {"_id": 1}):
+        _soil_job_executor.submit(run_soil_job, job["_id"])
+    for job in db.soil_jobs.find({"createdAt": {"$lt": now - SOIL_JOB_RETENTION}}, {"_id": 1}):
+        remove_soil_job_files(job["_id"])
+        db.soil_jobs.delete_one({"_id": job["_id"]})
+    remove_orphan_soil_job_files(stale)
+
+
+def find_soil_job(job_id, current_user):
+    """(job, error response) for the caller's own job."""
+    try:
+        job = db.soil_jobs.find_one({"_id": ObjectId(job_id), "user_id": current_user["_id"]})
+    except InvalidId:
+        return None, (jsonify({"error": "Invalid job ID."}), 400)
+    if not job:
+        return None, (jsonify({"error": "Job not found."}), 404)
+    return job, None
+
+
+@app.route("/api/soil-jobs", methods=["POST"])
+@token_required
+def create_soil_job(current_user):
+    """
+    Queues a soil-analysis file: a CSV or JSONL upload (multipart field 'file', or a
+    raw text/csv / application/x-ndjson body) with n, p, k, ph, organic_matter, crop
+    and an optional plot_id per row. Returns 202 with the job id; poll
+    /api/soil-jobs/<id> or stream /api/soil-jobs/<id>/events, then download
+    /api/soil-jobs/<id>/results?format=csv|ndjson.
+    """
+    if db is None:
+        return jsonify({"error": "Database not connected"}), 500
+
+    request.max_content_length = SOIL_JOB_MAX_BYTES
+
+    upload = request.files.get("file")
+    if upload:
+        stream, filename = upload.stream, upload.filename
+        fmt = "csv" if filename.lower().endswith(".csv") else "jsonl"
+    elif request.content_type and ("ndjson" in request.content_type or "jsonl" in request.content_type):
+        stream, filename, fmt = request.stream, None, "jsonl"
+    elif request.content_type and "csv" in request.content_type:
+        stream, filename, fmt = request.stream, None, "csv"
+    else:
+        return jsonify({"error": "Upload a .csv or .jsonl file in the 'file' field."}), 400
+
+    job_id = ObjectId()
+    input_path = soil_job_path(job_id, fmt)
+    try:
+        with open(input_path, "wb") as f:
+            while chunk := stream.read(1024 * 1024):
+                f.write(chunk)
+        if os.path.getsize(input_path) == 0:
+            os.remove(input_path)
+            return jsonify({"error": "Upload is empty."}), 400
+
+        db.soil_jobs.insert_one({
+            "_id": job_id,
+            "user_id": current_user["_id"],
+            "status": "queued",
+            "format": fmt,
+            "filename": secure_filename(filename) if filename else None,
+            "size": os.path.getsize(input_path),
+            "rows": 0, "failed": 0, "progress": 0.0,
+            "createdAt": datetime.now(timezone.utc),
+        })
+    except Exception as e:
+        print(f"❌ Soil job upload error: {e}")
+        remove_soil_job_files(job_id)
+        return jsonify({"error": "Could not store upload."}), 500
+
+    _soil_job_executor.submit(run_soil_job, job_id)
+    response = jsonify({"job_id": str(job_id), "status": "queued"})
+    response.headers["Location"] = f"/api/soil-jobs/{job_id}"
+    return response, 202
+
+
+@app.route("/api/soil-jobs", methods=["GET"])
+@token_required
+def list_soil_jobs(current_user):
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    jobs = db.soil_jobs.find({"user_id": current_user["_id"]}).sort("createdAt", -1).limit(50)
+    return jsonify([format_soil_job(job) for job in jobs]), 200
+
+
+@app.route("/api/soil-jobs/<job_id>", methods=["GET"])
+@token_required
+def get_soil_job(current_user, job_id):
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    job, error = find_soil_job(job_id, current_user)
+    if error:
+        return error
+    return jsonify(format_soil_job(job)), 200
+
+
+@app.route("/api/soil-jobs/<job_id>/events", methods=["GET"])
+@token_required
+def soil_job_events(current_user, job_id):
+    """
+    Streams {"section": "progress"} lines (SSE if requested) whenever the job changes, then "done"
+    once it finishes. Streams close after SOIL_JOB_EVENTS_TIMEOUT with a "reconnect" section so a
+    slow job never pins a request thread; reconnect, or poll /api/soil-jobs/<id>.
+    """
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    job, error = find_soil_job(job_id, current_user)
+    if error:
+        return error
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+
+    def generate():
+        last, deadline = None, time.monotonic() + SOIL_JOB_EVENTS_TIMEOUT
+        current = job
+        while current and time.monotonic() < deadline:
+            state = format_soil_job(current)
+            if state != last:
+                yield format_stream_section("progress", state, sse)
+                last = state
+            if state["status"] in ("done", "failed"):
+                break
+            time.sleep(1)
+            current = db.soil_jobs.find_one({"_id": job["_id"]})
+        else:
+            if current:
+                yield format_stream_section("reconnect", {"poll": f"/api/soil-jobs/{job_id}"}, sse)
+                return
+        yield format_stream_section("done", {}, sse)
+
+    return app.response_class(stream_with_context(generate()),
+                              mimetype="text/event-stream" if sse else "application/x-ndjson")
+
+
+@app.route("/api/soil-jobs/<job_id>/results", methods=["GET"])
+@token_required
+def soil_job_results_file(current_user, job_id):
+    """Finished results as NDJSON (default) or CSV (?format=csv, recommendations joined with ' | ')."""
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    job, error = find_soil_job(job_id, current_user)
+    if error:
+        return error
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}.", "status": job["status"]}), 409
+    output_path = soil_job_path(job["_id"], "ndjson")
+    if not os.path.exists(output_path):
+        return jsonify({"error": "Results have expired."}), 410
+
+    if request.args.get("format") != "csv":
+        return send_from_directory(SOIL_JOB_FOLDER, os.path.basename(output_path), mimetype="application/x-ndjson",
+                                   as_attachment=True, download_name=f"soil-job-{job_id}.ndjson")
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=SOIL_JOB_CSV_COLUMNS)
+        writer.writeheader()
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                writer.writerow({
+                    "row": record["row"],
+                    "plot_id": record.get("plot_id"),
+                    **record.get("levels", {}),
+                    **record.get("fertilizer_plan", {}),
+                    "recommendations": " | ".join(record.get("recommendations", [])),
+                    "error": record.get("error"),
+                })
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue()
+
+    response = app.response_class(generate(), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename=soil-job-{job_id}.csv"
+    return response
+
+
+@app.route("/api/soil-jobs/<job_id>", methods=["DELETE"])
+@token_required
+def delete_soil_job(current_user, job_id):
+    """Cancels a queued or running job (the worker stops at its next chunk) and deletes its files."""
+    if db is None: return jsonify({"error": "Database not connected"}), 500
+    job, error = find_soil_job(job_id, current_user)
+    if error:
+        return error
+    db.soil_jobs.delete_one({"_id": job["_id"]})
+    remove_soil_job_files(job["_id"])
+    return jsonify({"message": "Job deleted."}), 200
+
+
+@app.route("/api/crops", methods=["GET"])
+def list_crops():
+    """Crop registry: names, aliases, recommended N-P2O5-K2O and the straight-fertilizer dose for it."""
+    registry = crop_registry.current
+    return jsonify({
+        "version": registry.version,
+        "crops": [{
+            "crop": c.key,
+            "aliases": list(c.aliases),
+            "npk": list(c.npk) if c.npk else None,
+            "dose": dict(c.dose) or None,
+        } for c in registry.crops.values()],
+    })
+
+
+# ---------------- Crop Summaries ----------------
+# Registry crops are answered from data/crops.json. Any other crop is asked
+# of Gemini ONCE cluster-wide: the worker holding the per-crop lease calls
+# the model, validates the JSON and writes it to db.crop_summaries, where
+# every worker finds it by name or alias on the next request.
+CROP_SUMMARY_FIELDS = {"summary": 400, "soil": 80, "duration": 60}  # field -> max length
+CROP_SUMMARY_MARKETS = ("Low", "Medium", "High", "Very High")
+CROP_SUMMARY_MAX_ALIASES = 6
+CROP_SUMMARY_LEASE = 30         # seconds one worker may spend generating a summary
+CROP_SUMMARY_TIMEOUT = 20       # Gemini request timeout; shorter than the lease so it cannot outlive it
+CROP_SUMMARY_WAIT = 8           # seconds other workers wait for that summary to land
+CROP_SUMMARY_MAX_NAME = 60
+CROP_NAME_PATTERN = re.compile(r"[^\W\d_][\w\s().,'-]*")  # starts with a letter; no quotes, braces or markup
+
+
+def crop_name_keys(name):
+    """Lookup keys for a crop name: normalized, and with spaces removed ("dragon fruit" / "dragonfruit")."""
+    key = normalize_crop_name(name)
+    return list(dict.fromkeys([key, key.replace(" ", "")]))
+
+
+def resolve_registry_crop(name, registry):
+    """Registry crop for a name, its alias, or the longest run of its words ("basmati rice" → rice)."""
+    entry = registry.get(name)
+    if entry:
+        return entry
+    words = normalize_crop_name(name).split()
+    for size in range(len(words) - 1, 0, -1):
+        for start in range(len(words) - size + 1):
+            entry = registry.get(" ".join(words[start:start + size]))
+            if entry:
+                return entry
+    return None
+
+
+def validate_crop_summary(result, crop):
+    """Cleans a model-generated summary; returns (summary dict, aliases) or None if unusable or not a crop."""
+    if not isinstance(result, dict) or result.get("is_crop") is not True:
+        return None
+    summary = {}
+    for field, limit in CROP_SUMMARY_FIELDS.items():
+        value = result.get(field)
+        if not isinstance(value, str) or not value.strip() or len(value.strip()) > limit:
+            return None
+        summary[field] = " ".join(value.split())
+    market = next((m for m in CROP_SUMMARY_MARKETS if m.lower() == str(result.get("market", "")).strip().lower()), None)
+    if market is None:
+        return None
+    summary["market"] = market
+
+    aliases = [crop]
+    for alias in result.get("aliases") or []:
+        if isinstance(alias, str) and 0 < len(alias.strip()) <= CROP_SUMMARY_MAX_NAME:
+            aliases.append(alias)
+    keys = [k for name in aliases[:CROP_SUMMARY_MAX_ALIASES + 1] for k in crop_name_keys(name)]
+    return summary, list(dict.fromkeys(keys))
+
+
+def find_crop_summary(crop):
+    if db is None:
+        return None
+    return db.crop_summaries.find_one({"aliases": {"$in": crop_name_keys(crop)}},
+                                      {"_id": 0, "summary": 1, "soil": 1, "duration": 1, "market": 1})
+
+
+def generate_crop_summary(crop, api_key):
+    """Asks Gemini for a crop summary: (summary, aliases), False if the name is not a crop, None if unusable."""
+    genai.configure(api_key=api_key)
+    summary_model = genai.GenerativeModel("gemini-2.0-flash")
+
+    prompt = f"""
+    You are an Indian agricultural expert.
+    Generate a short, structured JSON summary for the crop '{crop}'.
+
+    If '{crop}' is not the name of a crop or cultivated plant, output only {{"is_crop": false}}.
+    Otherwise include exactly these 6 fields:
+    {{
+      "is_crop": true,
+      "summary": "Short 1–2 sentence overview about its ideal climate and practices.",
+      "soil": "Ideal soil type (2–3 words)",
+      "duration": "Growing period (like 90–110 days)",
+      "market": "Market demand (Low / Medium / High / Very High)",
+      "aliases": ["Other common English or Indian names for this crop, at most 5"]
+    }}
+
+    Output only valid JSON, without any explanation.
+    """
+
+    response = summary_model.generate_content(prompt, request_options={"timeout": CROP_SUMMARY_TIMEOUT})
+    text = response.text.strip()
+    print(f"🌿 Raw Gemini output for '{crop}':", text)
+
+    try:
+        match = re.search(r"\{[\s\S]*\}", text)
+        if not match:
+            raise ValueError("No JSON found in Gemini output.")
+        result = json.loads(match.group())
+        if isinstance(result, dict) and result.get("is_crop") is False:
+            return False
+        return validate_crop_summary(result, crop)
+    except Exception as e:
+        print("⚠️ JSON parse error:", e)
+        return None
+
+
+def store_crop_summary(crop, summary, aliases):
+    """Writes a validated summary; names another crop already claims stay with that crop."""
+    key = normalize_crop_name(crop)
+    taken = {a for doc in db.crop_summaries.find({"aliases": {"$in": aliases}, "key": {"$ne": key}}, {"aliases": 1})
+             for a in doc["aliases"]}
+    try:
+        db.crop_summaries.update_one(
+            {"key": key},
+            {"$setOnInsert": {**summary, "key": key, "source": "gemini",
+                              "aliases": [a for a in aliases if a not in taken],
+                              "createdAt": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    except pymongo.errors.DuplicateKeyError:
+        pass  # another worker stored it first
+
+
+def wait_for_crop_summary(crop):
+    deadline = time.monotonic() + CROP_SUMMARY_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.25)
+        stored = find_crop_summary(crop)
+        if stored:
+            return stored
+    return None
+
+
 @app.route("/crop-summary", methods=["POST"])
 def crop_summary():
     try:
         data = request.get_json()
-        crop = data.get("crop", "").strip().lower()
+        crop = normalize_crop_name(data.get("crop", ""))
 
         if not crop:
             return jsonify({"error": "Crop name missing"}), 400
+        if len(crop) > CROP_SUMMARY_MAX_NAME or not CROP_NAME_PATTERN.fullmatch(crop):
+            return jsonify({"error": "Invalid crop name"}), 400
+
+        # ✅ FAST PATH: crop registry by name, alias (paddy → rice) or contained name (basmati rice → rice)
+        entry = resolve_registry_crop(crop, crop_registry.current)
+        if entry and entry.summary:
+            print(f"✅ [CropSummary] Registry hit for: '{crop}' → '{entry.key}'")
+            return jsonify(dict(entry.summary))
+
+        # ✅ Summaries generated earlier by any worker
+        stored = find_crop_summary(crop)
+        if stored:
+            print(f"✅ [CropSummary] Stored summary for: '{crop}'")
+            return jsonify(stored)
+
+        # Generic fallback (never persisted)
+        fallback = {
+            "summary": f"{crop.title()} is an agricultural crop cultivated across various agro-climatic zones of India with good market potential.",
+            "soil": "Loamy, well-drained",
+            "duration": "90–120 days",
+            "market": "High"
+        }
 
-        # ✅ FAST PATH: Check local crop summary database first
-        if crop in CROP_SUMMARY_DB:
-            print(f"✅ [CropSummary] Local DB hit for: '{crop}'")
-            return jsonify(CROP_SUMMARY_DB[crop])
-
-        # Also try partial matches (e.g. 'mung' matches 'mungbean')
-        for db_crop, summary_data in CROP_SUMMARY_DB.items():
-            if crop in db_crop or db_crop in crop:
-                print(f"✅ [CropSummary] Partial match: '{crop}' → '{db_crop}'")
-                return jsonify(summary_data)
-
-        # 🌐 SLOW PATH: Ask Gemini for unknown crops
+        # 🌐 SLOW PATH: Ask Gemini for unknown crops, one worker per crop
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         if not gemini_api_key:
-            # Generic fallback
-            return jsonify({
-                "summary": f"{crop.title()} is an agricultural crop cultivated across various agro-climatic zones of India with good market potential.",
-                "soil": "Loamy, well-drained",
-                "duration": "90–120 days",
-                "market": "High"
-            })
-
-        genai.configure(api_key=gemini_api_key)
-        summary_model = genai.GenerativeModel("gemini-2.0-flash")
-
-        prompt = f"""
-        You are an Indian agricultural expert.
-        Generate a short, structured JSON summary for the crop '{crop}'.
-
-        Include exactly these 4 fields:
-        {{
-          "summary": "Short 1–2 sentence overview about its ideal climate and practices.",
-          "soil": "Ideal soil type (2–3 words)",
-          "duration": "Growing period (like 90–110 days)",
-          "market": "Market demand (Low / Medium / High / Very High)"
-        }}
+            return jsonify(fallback)
 
-        Output only valid JSON, without any explanation.
-        """
-
-        response = summary_model.generate_content(prompt)
-        text = response.text.strip()
-        print(f"🌿 Raw Gemini output for '{crop}':", text)
+        lease = f"crop-summary:{crop}"
+        token = acquire_lease(lease, CROP_SUMMARY_LEASE)
+        if db is not None and not token:
+            return jsonify(wait_for_crop_summary(crop) or fallback)
 
         try:
-            match = re.search(r"\{[\s\S]*\}", text)
-            if not match:
-                raise ValueError("No JSON found in Gemini output.")
-            json_str = match.group()
-            result = json.loads(json_str)
-            for key in ["summary", "soil", "duration", "market"]:
-                if key not in result:
-                    result[key] = "N/A"
-        except Exception as e:
-            print("⚠️ JSON parse error:", e)
-            result = {
-                "summary": f"{crop.title()} grows best in suitable Indian agro-climatic regions with good management.",
-                "soil": "Loamy",
-                "duration": "Approx. 100–120 days",
-                "market": "High"
-            }
-
-        return jsonify(result)
+            generated = generate_crop_summary(crop, gemini_api_key)
+            if generated and db is not None:
+                store_crop_summary(crop, *generated)
+        finally:
+            release_lease(lease, token)
+        # Not stored unless validated as a crop, so junk names never reach other users
+        if generated is False:
+            return jsonify({"error": f"'{crop}' is not a recognised crop."}), 404
+        return jsonify(generated[0] if generated else fallback)
 
     except Exception as e:
         print("❌ /crop-summary Fatal Error:", e)
@@ -1880,6 +4698,83 @@ def auto_detect_soil():
         print(f"⚠️ AI detection failed: {e}")
         return jsonify({"error": "AI auto-detection failed."}), 500
 
+# ---------------- Background Tasks ----------------
+# Daemon threads started once per worker. Tasks marked exclusive take a Mongo
+# lease first, so with several gunicorn workers only one runs each tick.
+BACKGROUND_TASKS_ENABLED = os.getenv("ENABLE_BACKGROUND_TASKS", "1") == "1"
+
+
+def acquire_lease(name, seconds):
+    """
+    Returns a token if the caller now holds the named lease for `seconds`, else None.
+    The token is unique per acquisition (not per process), so release_lease() can
+    never drop a lease that another thread or worker took over after this one expired.
+    """
+    if db is None:
+        return None
+    now = datetime.now(timezone.utc)
+    token = os.urandom(8).hex()
+    try:
+        db.task_leases.find_one_and_update(
+            {"_id": name, "until": {"$lte": now}},
+            {"$set": {"until": now + timedelta(seconds=seconds), "owner": token, "pid": os.getpid()}},
+            upsert=True
+        )
+        return token
+    except pymongo.errors.DuplicateKeyError:
+        return None  # someone else holds an unexpired lease
+    except Exception as e:
+        print(f"⚠️ Lease error for {name}: {e}")
+        return None
+
+
+def release_lease(name, token):
+    if db is not None and token:
+        db.task_leases.delete_one({"_id": name, "owner": token})
+
+
+def run_periodically(name, interval, fn, initial_delay=5, exclusive=True):
+    """Runs `fn` every `interval` seconds on a daemon thread."""
+    def loop():
+        time.sleep(initial_delay)
+        while True:
+            try:
+                if not exclusive or acquire_lease(name, interval * 0.9):
+                    fn()
+            except Exception as e:
+                print(f"⚠️ Background task '{name}' failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
+
+
+if BACKGROUND_TASKS_ENABLED and db is not None:
+    run_periodically("rebuild-product-facets", FACET_REBUILD_INTERVAL, rebuild_product_facets)
+    # One leased warmer fills the shared cache for every worker. A per-process
+    # SimpleCache would need a warmer per worker, multiplying upstream calls and
+    # recorded observations, so warming is off unless the cache is shared.
+    if SHARED_CACHE:
+        run_periodically("warm-weather-caches", WEATHER_WARM_INTERVAL, warm_weather_caches)
+    else:
+        print("ℹ️ Weather cache warming disabled (set CACHE_TYPE=RedisCache to share caches across workers).")
+    run_periodically("rollup-weather-daily", WEATHER_ROLLUP_INTERVAL, rollup_weather_daily)
+    run_periodically("sync-agmarknet", AGMARKNET_SYNC_INTERVAL, sync_agmarknet, initial_delay=30)
+    run_periodically("recover-soil-jobs", SOIL_JOB_RECOVER_INTERVAL, recover_soil_jobs)
+    # Holds expire even when nobody places an order
+    run_periodically("release-expired-reservations", RESERVATION_SWEEP_INTERVAL,
+                     lambda: release_expired_reservations(throttle=False))
+
+
+def reload_crop_registry():
+    if crop_registry.reload_if_changed():
+        print(f"🔄 Crop registry reloaded: v{crop_registry.current.version} ({len(crop_registry.current)} crops).")
+
+
+if BACKGROUND_TASKS_ENABLED:
+    # Every worker holds its own snapshot, so each one watches the file
+    run_periodically("reload-crop-registry", CROP_REGISTRY_RELOAD_INTERVAL, reload_crop_registry, exclusive=False)
+
+
 # ---------------- Run Flask ----------------
 if __name__ == "__main__":
     # Ensure JWT_SECRET is not the default
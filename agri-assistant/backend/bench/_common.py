@@ -0,0 +1,43 @@
+"""
+Shared setup for the benchmark scripts in bench/.
+
+Scripts that need the app import app.py against BENCH_MONGO_URI, a scratch
+MongoDB (they write to its krishimitra_db and remove what they create).
+Never point it at production.
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def load_app():
+    uri = os.getenv("BENCH_MONGO_URI")
+    if not uri:
+        sys.exit("Set BENCH_MONGO_URI to a scratch MongoDB; the benchmark writes to its krishimitra_db.")
+    os.environ["MONGO_URI"] = uri
+    os.environ["ENABLE_BACKGROUND_TASKS"] = "0"
+    import app
+    if app.db is None:
+        sys.exit("Could not connect to BENCH_MONGO_URI.")
+    return app
+
+
+def auth_headers(app, user_id):
+    import jwt
+    token = jwt.encode({"id": str(user_id)}, app.JWT_SECRET, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def timed(fn, repeat=5):
+    """Best-of-`repeat` wall time of fn() in seconds, and its last result."""
+    import time
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
@@ -0,0 +1,95 @@
+"""
+bulk_import.py — POST /api/products/bulk throughput
+====================================================
+Generates --rows product rows (with --invalid of them deliberately broken),
+uploads them once as CSV and once as JSONL through the Flask test client,
+and reports the endpoint's rows/s. For comparison it also posts --single
+rows one at a time to POST /api/products. Everything the bench inserts
+belongs to a throwaway seller and is deleted afterwards.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 python bench/bulk_import.py --rows 100000
+"""
+
+import argparse
+import csv
+import io
+import json
+import random
+import time
+
+from _common import auth_headers, load_app
+
+CATEGORIES = ["Seeds", "Fertilizers", "Pesticides", "Tools", "Irrigation"]
+TAGS = ["organic", "urea", "dap", "fungicide", "insecticide", "drip", "hybrid", "paddy", "cotton", "wheat"]
+FIELDS = ["name", "brand", "description", "price", "category", "tags", "stock"]
+
+
+def generate_rows(count, invalid, rng):
+    rows = []
+    for i in range(count):
+        row = {"name": f"Bench product {i}", "brand": rng.choice(["Acme", "Kisan", "Bharat", ""]),
+               "description": "Generated by bench/bulk_import.py", "price": round(rng.uniform(10, 5000), 2),
+               "category": rng.choice(CATEGORIES), "tags": ",".join(rng.sample(TAGS, rng.randint(0, 4))),
+               "stock": rng.randint(0, 500)}
+        rows.append(row)
+    for i in rng.sample(range(count), invalid):
+        field, value = rng.choice([("name", ""), ("price", "abc"), ("price", -1), ("stock", "1.5")])
+        rows[i][field] = value
+    return rows
+
+
+def as_csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def as_jsonl(rows):
+    return "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--invalid", type=int, default=1000, help="rows to break on purpose")
+    parser.add_argument("--single", type=int, default=2000, help="rows to post one at a time for comparison")
+    args = parser.parse_args()
+
+    app = load_app()
+    db = app.db
+    client = app.app.test_client()
+    seller_id = db.users.insert_one({"username": f"bench-import-{int(time.time())}@bench", "password": None,
+                                     "full_name": "Bench", "default_location": None}).inserted_id
+    headers = auth_headers(app, seller_id)
+    rows = generate_rows(args.rows, args.invalid, random.Random(26))
+    try:
+        for fmt, body, content_type in (("csv", as_csv(rows), "text/csv"),
+                                        ("jsonl", as_jsonl(rows), "application/x-ndjson")):
+            began = time.perf_counter()
+            response = client.post("/api/products/bulk", data=body, headers={**headers, "Content-Type": content_type})
+            wall = time.perf_counter() - began
+            report = response.get_json()
+            assert response.status_code == 201, report.get("error")
+            assert (report["total_rows"], report["failed"]) == (args.rows, args.invalid), "unexpected row counts"
+            print(f"bulk {fmt:5s}: {args.rows} rows ({len(body) / 1e6:.1f} MB), {report['inserted']} inserted, "
+                  f"{report['failed']} rejected in {wall:.2f}s -> {args.rows / wall:,.0f} rows/s "
+                  f"(endpoint reports {report['rows_per_sec']:,.0f})")
+            db.products.delete_many({"seller_id": seller_id})
+
+        if args.single:
+            began = time.perf_counter()
+            for row in rows[:args.single]:
+                client.post("/api/products", json=row, headers=headers)
+            wall = time.perf_counter() - began
+            print(f"single POST: {args.single} rows in {wall:.2f}s -> {args.single / wall:,.0f} rows/s")
+    finally:
+        db.products.delete_many({"seller_id": seller_id})
+        db.users.delete_one({"_id": seller_id})
+        app.rebuild_product_facets()
+        app.bump_catalog_version()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+fertility_batch.py — scalar vs column-wise fertility engine
+============================================================
+Times analyze_fertility() + get_fertilizer_recommendation() in a per-sample
+loop against parse_samples() + fertility_batch() + fertilizer_batch() on the
+same random soil tests, and checks both produce identical output. The
+"columns" line stops at fertility_level_names() / fertilizer_plan_columns(),
+the lists a `"format": "columns"` batch request returns without building a
+dict per sample.
+
+    python bench/fertility_batch.py --samples 100000
+"""
+
+import argparse
+import os
+import random
+
+from _common import BACKEND_DIR, timed
+from crop_registry import CropRegistry
+from fertility_engine import (analyze_fertility, fertility_batch, fertility_level_names, fertilizer_batch,
+                              fertilizer_plan_columns, get_fertilizer_recommendation, parse_samples)
+
+FIELDS = ("n", "p", "k", "ph", "organic_matter")
+DEFAULTS = {**dict.fromkeys(FIELDS, 0), "crop": "rice"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    registry = CropRegistry.from_file(os.path.join(BACKEND_DIR, "data", "crops.json"))
+    rng = random.Random(42)
+    names = [name for crop in registry.crops.values() for name in (crop.key,) + crop.aliases] + ["dragonfruit"]
+    samples = [{"n": rng.uniform(0, 400), "p": rng.uniform(0, 120), "k": rng.uniform(0, 400),
+                "ph": rng.uniform(3, 10), "organic_matter": rng.uniform(0, 5), "crop": rng.choice(names)}
+               for _ in range(args.samples)]
+
+    def scalar():
+        out = []
+        for s in samples:
+            n, p, k, ph = float(s["n"]), float(s["p"]), float(s["k"]), float(s["ph"])
+            out.append((analyze_fertility(n, p, k, ph), get_fertilizer_recommendation(n, p, k, s["crop"], registry)))
+        return out
+
+    def batch():
+        rows, values, crops, _ = parse_samples(samples, FIELDS, DEFAULTS)
+        n, p, k, ph = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+        return list(zip(fertility_batch(n, p, k, ph), fertilizer_batch(n, p, k, crops, registry)))
+
+    def columns():
+        rows, values, crops, _ = parse_samples(samples, FIELDS, DEFAULTS)
+        n, p, k, ph = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+        return fertility_level_names(n, p, k, ph), fertilizer_plan_columns(n, p, k, crops, registry)
+
+    scalar_s, expected = timed(scalar, args.repeat)
+    batch_s, actual = timed(batch, args.repeat)
+    columns_s, _ = timed(columns, args.repeat)
+    assert actual == expected, "batch output differs from the scalar path"
+    print(f"{args.samples} samples (best of {args.repeat}):")
+    print(f"  scalar loop  {scalar_s:7.3f}s  {args.samples / scalar_s:10,.0f} samples/s")
+    print(f"  batch        {batch_s:7.3f}s  {args.samples / batch_s:10,.0f} samples/s  ({scalar_s / batch_s:.1f}x)")
+    print(f"  columns      {columns_s:7.3f}s  {args.samples / columns_s:10,.0f} samples/s  ({scalar_s / columns_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
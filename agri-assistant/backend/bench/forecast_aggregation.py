@@ -0,0 +1,71 @@
+"""
+forecast_aggregation.py — daily forecast reducer, before and after
+===================================================================
+Times aggregate_forecast() against the per-entry loop get_5_day_forecast()
+used before it (copied below unchanged) on the Pune fixture in
+tests/fixtures/. The old loop buckets by the server's local date, so its
+output is only printed for comparison, not asserted equal.
+
+    python bench/forecast_aggregation.py --calls 20000
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+
+from _common import BACKEND_DIR, timed
+from weather_forecast import aggregate_forecast
+
+FIXTURE = os.path.join(BACKEND_DIR, "tests", "fixtures", "owm_forecast_pune.json")
+
+
+def legacy_aggregate(data):
+    daily_forecasts = {}
+    for entry in data["list"]:
+        date_str = datetime.fromtimestamp(entry["dt"]).strftime('%Y-%m-%d')
+        if date_str not in daily_forecasts:
+            daily_forecasts[date_str] = {
+                "day_name": datetime.fromtimestamp(entry["dt"]).strftime('%A'),
+                "min_temp": entry["main"]["temp_min"], "max_temp": entry["main"]["temp_max"],
+                "conditions": [entry["weather"][0]["description"]], "icon": entry["weather"][0]["icon"]
+            }
+        else:
+            # Update min/max temps for the day
+            daily_forecasts[date_str]["min_temp"] = min(daily_forecasts[date_str]["min_temp"], entry["main"]["temp_min"])
+            daily_forecasts[date_str]["max_temp"] = max(daily_forecasts[date_str]["max_temp"], entry["main"]["temp_max"])
+            daily_forecasts[date_str]["conditions"].append(entry["weather"][0]["description"])
+
+    final_forecast = []
+    for date_key in sorted(daily_forecasts.keys())[:5]: # Get up to 5 days
+        day_data = daily_forecasts[date_key]
+        # Find the most common condition for the day
+        most_common_condition = max(set(day_data["conditions"]), key=day_data["conditions"].count)
+        final_forecast.append({
+            "day": day_data["day_name"], "date": date_key,
+            "min_temp": round(day_data["min_temp"]), "max_temp": round(day_data["max_temp"]),
+            "condition": most_common_condition.title(), "icon": day_data["icon"]
+        })
+    return final_forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(FIXTURE, encoding="utf-8") as f:
+        payload = json.load(f)
+
+    legacy_s, legacy = timed(lambda: [legacy_aggregate(payload) for _ in range(args.calls)][-1])
+    new_s, new = timed(lambda: [aggregate_forecast(payload) for _ in range(args.calls)][-1])
+    print(f"{len(payload['list'])}-entry payload, {args.calls} calls (best of 5):")
+    print(f"  legacy loop        {legacy_s / args.calls * 1e6:7.1f} us/call")
+    print(f"  aggregate_forecast {new_s / args.calls * 1e6:7.1f} us/call ({legacy_s / new_s:.1f}x)")
+    for old_day, new_day in zip(legacy, new):
+        print(f"  {old_day['date']} {old_day['condition']:<16} | {new_day['date']} {new_day['condition']:<16}"
+              f" rain {new_day['rain_mm']} mm")
+
+
+if __name__ == "__main__":
+    main()
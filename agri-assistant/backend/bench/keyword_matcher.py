@@ -0,0 +1,60 @@
+"""
+keyword_matcher.py — treatment-text matching as the vocabulary grows
+=====================================================================
+Times KeywordMatcher.find() against a per-term scan (one str.find loop per
+vocabulary term, the approach the automaton replaced) on generated
+vocabularies of increasing size. The automaton's cost should stay roughly
+flat with vocabulary size; the scan grows linearly.
+
+    python bench/keyword_matcher.py --sizes 50 1000 5000 20000
+"""
+
+import argparse
+import random
+
+from _common import timed
+from keyword_matcher import KeywordMatcher, _is_boundary
+
+SYLLABLES = ["ka", "ro", "mi", "zol", "fen", "thi", "am", "ox", "cyp", "per", "neem", "di", "meth", "in", "ate", "pro"]
+FILLER = ["apply", "the", "spray", "at", "per", "litre", "and", "on", "leaves", "dose", "ml", "water"]
+
+
+def scan(terms, text):
+    text = " ".join(text.lower().split())
+    hits = []
+    for term in terms:
+        start = text.find(term)
+        while start != -1:
+            if _is_boundary(text, start - 1) and _is_boundary(text, start + len(term)):
+                hits.append((term, start))
+            start = text.find(term, start + 1)
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 1000, 5000, 20000])
+    parser.add_argument("--words", type=int, default=400, help="words per treatment text")
+    parser.add_argument("--texts", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{args.texts} texts of {args.words} words")
+    for size in args.sizes:
+        terms = set()
+        while len(terms) < size:
+            terms.add(" ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+                               for _ in range(rng.choice([1, 1, 1, 2]))))
+        terms = sorted(terms)
+        texts = [" ".join(rng.choice(terms) if rng.random() < 0.2 else rng.choice(FILLER) for _ in range(args.words))
+                 for _ in range(args.texts)]
+
+        build_s, matcher = timed(lambda: KeywordMatcher(dict.fromkeys(terms, ["tag"])), 1)
+        find_s, _ = timed(lambda: [matcher.find(t) for t in texts], 3)
+        scan_s, _ = timed(lambda: [scan(terms, t) for t in texts], 1)
+        print(f"  {size:6d} terms: build {build_s * 1e3:8.1f} ms | automaton {find_s / args.texts * 1e3:7.3f} ms/text"
+              f" | per-term scan {scan_s / args.texts * 1e3:8.3f} ms/text ({scan_s / find_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+market_table.py — MarketTable vs list-of-dicts
+===============================================
+Generates Agmarknet-shaped records (string prices, dd/mm/yyyy dates, a few
+missing values), then compares the columnar MarketTable with plain Python
+over the same list of dicts:
+
+  memory   tracemalloc peak of json.loads(dump) vs MarketTable.from_records()
+  query    state filter + sort by modal price desc + top 50, as dicts
+  group    per-commodity count / min / max / median of modal price
+
+Results of each pair are asserted equal.
+
+    python bench/market_table.py --records 5000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tracemalloc
+from datetime import date, timedelta
+
+from _common import timed
+from market_cleaning import parse_date, parse_price
+from market_table import MarketTable
+
+STATES = {"Maharashtra": ["Pune", "Nashik", "Nagpur"], "Karnataka": ["Bangalore", "Mysore"],
+          "Punjab": ["Ludhiana", "Amritsar"], "Uttar Pradesh": ["Agra", "Lucknow", "Kanpur"],
+          "Gujarat": ["Rajkot", "Surat"], "Madhya Pradesh": ["Indore", "Bhopal"]}
+COMMODITIES = ["Onion", "Tomato", "Potato", "Wheat", "Paddy(Dhan)(Common)", "Cotton", "Soyabean", "Maize",
+               "Green Chilli", "Banana", "Garlic", "Ginger(Green)", "Tur(Arhar)", "Bengal Gram(Gram)(Whole)"]
+
+
+def generate_records(count, rng):
+    today = date(2025, 7, 14)
+    records = []
+    for _ in range(count):
+        state = rng.choice(list(STATES))
+        district = rng.choice(STATES[state])
+        modal = rng.randint(500, 9000)
+        records.append({
+            "state": state, "district": district, "market": f"{district} APMC",
+            "commodity": rng.choice(COMMODITIES), "variety": rng.choice(["Other", "Local", "Hybrid", "FAQ"]),
+            "arrival_date": (today - timedelta(days=rng.randint(0, 30))).strftime("%d/%m/%Y"),
+            "min_price": str(modal - rng.randint(0, 400)), "max_price": str(modal + rng.randint(0, 400)),
+            "modal_price": "" if rng.random() < 0.02 else str(modal),
+        })
+    return records
+
+
+def dicts_query(records, state, limit):
+    wanted = state.lower()
+    rows = [r for r in records if (r.get("state") or "Unknown").lower() == wanted]
+    priced = [(parse_price(r.get("modal_price")), i) for i, r in enumerate(rows)]
+    present = sorted((p for p in priced if p[0] is not None), key=lambda p: -p[0])
+    missing = [p for p in priced if p[0] is None]
+    out = []
+    for _, i in (present + missing)[:limit]:
+        r = rows[i]
+        day = parse_date(r.get("arrival_date"))
+        out.append({"commodity": r["commodity"], "state": r["state"], "district": r["district"], "market": r["market"],
+                    "variety": r["variety"], "modal_price": r["modal_price"] or "N/A",
+                    "min_price": r["min_price"], "max_price": r["max_price"],
+                    "arrival_date": day.isoformat() if day else "N/A"})
+    return out
+
+
+def dicts_group(records):
+    groups = {}
+    for r in records:
+        price = parse_price(r.get("modal_price"))
+        if price is not None:
+            groups.setdefault(r.get("commodity") or "Unknown", []).append(price)
+    return {k: (len(v), min(v), max(v), statistics.median(v)) for k, v in groups.items()}
+
+
+def traced_peak(fn):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--state", default="maharashtra")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    dump = json.dumps(generate_records(args.records, random.Random(39)))
+    dicts_bytes, records = traced_peak(lambda: json.loads(dump))
+    table_bytes, table = traced_peak(lambda: MarketTable.from_records(records))
+    build_s, _ = timed(lambda: MarketTable.from_records(records))
+
+    fields = ("commodity", "state", "district", "market", "variety", "modal_price", "min_price", "max_price",
+              "arrival_date")
+    dicts_query_s, expected = timed(lambda: dicts_query(records, args.state, args.limit), 20)
+    table_query_s, actual = timed(lambda: table.records(
+        table.select(sort="modal_price", descending=True, stop=args.limit, state=args.state), fields), 20)
+    assert actual == expected, "query results differ"
+
+    dicts_group_s, expected = timed(lambda: dicts_group(records), 20)
+    table_group_s, actual = timed(lambda: table.group_by("commodity"), 20)
+    assert {g["commodity"]: (g["count"], g["min"], g["max"], g["median"]) for g in actual} == expected, \
+        "group-by results differ"
+
+    print(f"{args.records} records (best of 20):")
+    print(f"  memory   list-of-dicts {dicts_bytes / 1e6:6.2f} MB | MarketTable {table_bytes / 1e6:6.2f} MB "
+          f"(column arrays {table.nbytes / 1e3:.0f} KB), built in {build_s * 1e3:.1f} ms")
+    print(f"  query    list-of-dicts {dicts_query_s * 1e3:6.2f} ms | MarketTable {table_query_s * 1e3:6.2f} ms "
+          f"({dicts_query_s / table_query_s:.1f}x)")
+    print(f"  group    list-of-dicts {dicts_group_s * 1e3:6.2f} ms | MarketTable {table_group_s * 1e3:6.2f} ms "
+          f"({dicts_group_s / table_group_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
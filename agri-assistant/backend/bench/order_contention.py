@@ -0,0 +1,72 @@
+"""
+order_contention.py — many buyers racing for one SKU
+=====================================================
+Creates one product with --stock units and --buyers users, releases every
+buyer's POST /api/orders at the same instant from a thread pool, then checks
+the conditional $inc never oversold: final stock >= 0, and reserved quantity
+plus final stock equals the starting stock.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 python bench/order_contention.py --buyers 300 --stock 100
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import auth_headers, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+
+    app = load_app()
+    db = app.db
+    tag = f"bench-contention-{int(time.time())}"
+    user_ids = db.users.insert_many([{"username": f"{tag}-{i}@bench", "password": None, "full_name": "Bench",
+                                      "default_location": None, "bench": tag}
+                                     for i in range(args.buyers)]).inserted_ids
+    product_id = db.products.insert_one({"name": tag, "category": "bench", "tags": [], "price": 10.0,
+                                         "stock": args.stock, "bench": tag}).inserted_id
+    try:
+        gate = threading.Barrier(min(args.threads, args.buyers))
+
+        def buy(user_id):
+            client = app.app.test_client()
+            try:
+                gate.wait(timeout=10)
+            except threading.BrokenBarrierError:
+                pass  # fewer buyers left than threads; go anyway
+            return client.post("/api/orders", headers=auth_headers(app, user_id),
+                               json={"product_id": str(product_id), "quantity": args.quantity}).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            statuses = list(pool.map(buy, user_ids))
+        elapsed = time.perf_counter() - started
+
+        final_stock = db.products.find_one({"_id": product_id})["stock"]
+        reserved = sum(r["quantity"] for r in db.reservations.find({"product_id": product_id, "status": "reserved"}))
+        counts = {code: statuses.count(code) for code in sorted(set(statuses))}
+        print(f"{args.buyers} buyers x {args.quantity} unit(s) for {args.stock} in stock, {args.threads} threads: "
+              f"{elapsed:.2f}s, responses {counts}")
+        print(f"final stock {final_stock}, reserved {reserved}")
+
+        assert final_stock >= 0, "stock went negative"
+        assert reserved + final_stock == args.stock, "reserved units and stock do not add up to the starting stock"
+        assert counts.get(201, 0) * args.quantity == reserved, "201 responses do not match recorded reservations"
+        assert counts.get(201, 0) == min(args.buyers, args.stock // args.quantity), "some available stock was not sold"
+        print("✅ No overselling.")
+    finally:
+        db.reservations.delete_many({"product_id": product_id})
+        db.products.delete_one({"_id": product_id})
+        db.users.delete_many({"bench": tag})
+
+
+if __name__ == "__main__":
+    main()
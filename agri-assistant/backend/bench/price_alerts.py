@@ -0,0 +1,130 @@
+"""
+price_alerts.py — evaluate_price_alerts() against MongoDB
+==========================================================
+Seeds --markets x --commodities price series (market ids prefixed "bench|")
+and --alerts alerts with random thresholds, then runs the real
+evaluate_price_alerts() twice: once to record each series' first price,
+once after every series moves. The second pass is timed and its
+notification count is checked against a brute-force crossing count. With
+--compare the same scenario is repeated after dropping the
+(commodity_key, market_id, direction, threshold) index, which is restored
+afterwards.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 python bench/price_alerts.py --alerts 100000 --compare
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pymongo
+from bson import ObjectId
+
+from _common import load_app
+
+ALERT_INDEX = [("commodity_key", pymongo.ASCENDING), ("market_id", pymongo.ASCENDING),
+               ("direction", pymongo.ASCENDING), ("threshold", pymongo.ASCENDING)]
+
+
+def seed(db, series, alerts_per_series, rng):
+    day = datetime(2025, 7, 14, tzinfo=timezone.utc)
+    first, second = {}, {}
+    for market_id, commodity_key in series:
+        first[(market_id, commodity_key)] = rng.randint(1500, 4000)
+        second[(market_id, commodity_key)] = first[(market_id, commodity_key)] + rng.choice([-1, 1]) * rng.randint(1, 600)
+    alerts = [{"user_id": ObjectId(), "commodity": commodity_key.title(), "commodity_key": commodity_key,
+               "market": market_id.split("|")[-1], "market_id": market_id, "state": "Bench",
+               "direction": rng.choice(["above", "below"]), "threshold": float(rng.randint(1000, 4600)),
+               "createdAt": day}
+              for market_id, commodity_key in series for _ in range(alerts_per_series)]
+    db.price_alerts.insert_many(alerts, ordered=False)
+    return day, first, second, alerts
+
+
+def write_prices(db, prices, day):
+    db.market_prices.insert_many([{
+        "market_id": market_id, "commodity_key": commodity_key, "variety": "Other", "arrival_date": day,
+        "commodity": commodity_key.title(), "state": "Bench", "district": "Bench", "market": market_id.split("|")[-1],
+        "modal_price": float(price), "min_price": float(price), "max_price": float(price), "outlier": False,
+        "updatedAt": datetime.now(timezone.utc),
+    } for (market_id, commodity_key), price in prices.items()], ordered=False)
+
+
+def expected_crossings(alerts, first, second):
+    count = 0
+    for alert in alerts:
+        previous, price = first[(alert["market_id"], alert["commodity_key"])], second[(alert["market_id"], alert["commodity_key"])]
+        if price > previous:
+            count += alert["direction"] == "above" and previous < alert["threshold"] <= price
+        else:
+            count += alert["direction"] == "below" and price <= alert["threshold"] < previous
+    return count
+
+
+def cleanup(db, alerts):
+    alert_ids = [a["_id"] for a in alerts if "_id" in a]
+    db.notifications.delete_many({"alert_id": {"$in": alert_ids}})
+    db.price_alerts.delete_many({"market_id": {"$regex": r"^bench\|"}})
+    db.market_prices.delete_many({"market_id": {"$regex": r"^bench\|"}})
+    db.price_alert_marks.delete_many({"_id": {"$regex": r"^bench\|"}})
+
+
+def run(app, args, label):
+    db = app.db
+    rng = random.Random(44)
+    series = [(f"bench|bench|market {m}", f"bench crop {c}") for m in range(args.markets) for c in range(args.commodities)]
+    day, first, second, alerts = seed(db, series, max(1, args.alerts // len(series)), rng)
+    try:
+        since = datetime.now(timezone.utc) - timedelta(seconds=1)
+        write_prices(db, first, day)
+        app.evaluate_price_alerts(since)  # first observation of every series: marks only
+
+        since = datetime.now(timezone.utc) - timedelta(seconds=1)
+        write_prices(db, second, day + timedelta(days=1))
+        began = time.perf_counter()
+        queued = app.evaluate_price_alerts(since)
+        elapsed = time.perf_counter() - began
+
+        expected = expected_crossings(alerts, first, second)
+        print(f"{label}: {len(series)} series, {len(alerts)} alerts -> {queued} notifications in {elapsed:.2f}s "
+              f"({elapsed / len(series) * 1e3:.2f} ms/series)")
+        assert queued == expected, f"expected {expected} notifications"
+        assert db.notifications.count_documents({"alert_id": {"$in": [a["_id"] for a in alerts]}}) == expected
+        try:
+            plan = db.price_alerts.find({"commodity_key": series[0][1], "market_id": series[0][0],
+                                         "direction": "above", "threshold": {"$gt": 2000, "$lte": 2500}}).explain()
+            stage = plan["queryPlanner"]["winningPlan"]
+            while "inputStage" in stage:
+                stage = stage["inputStage"]
+            print(f"  crossing lookup plan: {stage.get('stage')} {stage.get('indexName', '')}")
+        except Exception:
+            pass  # explain() is not available on every server / driver stand-in
+        return elapsed
+    finally:
+        cleanup(db, alerts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--markets", type=int, default=200)
+    parser.add_argument("--commodities", type=int, default=10)
+    parser.add_argument("--alerts", type=int, default=100_000)
+    parser.add_argument("--compare", action="store_true", help="also run without the crossing index")
+    args = parser.parse_args()
+
+    app = load_app()
+    app.ensure_market_store()
+    indexed = run(app, args, "indexed")
+    if args.compare:
+        index_name = "_".join(f"{field}_{order}" for field, order in ALERT_INDEX)
+        app.db.price_alerts.drop_index(index_name)
+        try:
+            unindexed = run(app, args, "no index")
+        finally:
+            app.db.price_alerts.create_index(ALERT_INDEX)
+        print(f"index speed-up: {unindexed / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
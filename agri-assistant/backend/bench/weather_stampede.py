@@ -0,0 +1,110 @@
+"""
+weather_stampede.py — cold-cache stampede on get_weather
+=========================================================
+Replaces the OpenWeatherMap call with a stub that sleeps --latency seconds
+and counts invocations, then releases --threads concurrent get_weather()
+calls for one cold location in each of --processes worker processes. With
+single-flight working there is one upstream call per worker on SimpleCache,
+and one in total when CACHE_TYPE points every worker at a shared Redis.
+A second round after expiring the entry checks the stale path refreshes
+once in the background.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 CACHE_TYPE=RedisCache CACHE_REDIS_URL=redis://localhost:6379/0 \
+        python bench/weather_stampede.py --threads 200 --processes 4
+"""
+
+import argparse
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import load_app
+
+PAYLOAD = {"cod": 200, "id": 1, "name": "Bench", "dt": 1700000000, "main": {"temp": 30.2, "humidity": 60},
+           "wind": {"speed": 2.5}, "weather": [{"description": "clear sky", "icon": "01d"}]}
+
+
+class StubResponse:
+    def json(self):
+        return PAYLOAD
+
+
+def stub_upstream(app, calls, latency):
+    def fake_get(url, timeout=None):
+        with calls.get_lock():
+            calls.value += 1
+        time.sleep(latency)
+        return StubResponse()
+
+    app.requests.get = fake_get
+    app.WEATHER_API_KEY = "bench"
+
+
+def hammer(app, location_id, threads):
+    gate = threading.Barrier(threads)
+
+    def one(_):
+        gate.wait()
+        return app.get_weather(location_id)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, range(threads)))
+    assert all(r.get("temperature") == PAYLOAD["main"]["temp"] for r in results), results[:3]
+
+
+def worker(location_id, threads, latency, calls, started):
+    app = load_app()
+    stub_upstream(app, calls, latency)
+    started.wait()
+    hammer(app, location_id, threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub upstream latency in seconds")
+    args = parser.parse_args()
+
+    app = load_app()
+    location_id = f"geo:bench-{time.time_ns()},0"
+    key = f"swr:get_weather:{location_id}"
+    calls = multiprocessing.Value("i", 0)
+    started = multiprocessing.Event()
+    try:
+        procs = [multiprocessing.Process(target=worker, args=(location_id, args.threads, args.latency, calls, started))
+                 for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        time.sleep(1)  # let every worker import the app before the gate opens
+        began = time.perf_counter()
+        started.set()
+        for proc in procs:
+            proc.join()
+        assert all(proc.exitcode == 0 for proc in procs), "a worker failed"
+        print(f"cold: {args.processes} worker(s) x {args.threads} threads -> {calls.value} upstream call(s) "
+              f"in {time.perf_counter() - began:.2f}s ({app.app.config['CACHE_TYPE']})")
+        limit = 1 if app.SHARED_CACHE else args.processes
+        assert calls.value <= limit, f"expected at most {limit} upstream call(s)"
+
+        # Stale round, in this process: expire the entry and hammer it again
+        stub_upstream(app, calls, args.latency)
+        entry = app.cache.get(key) or {"value": app.get_weather(location_id)}  # SimpleCache is per process
+        app.cache.set(key, {"value": entry["value"], "fresh_until": time.time() - 1}, timeout=60)
+        calls.value = 0
+        began = time.perf_counter()
+        hammer(app, location_id, args.threads)
+        served = time.perf_counter() - began
+        time.sleep(args.latency + 0.5)
+        print(f"stale: {args.threads} threads served in {served:.2f}s -> {calls.value} background refresh(es)")
+        assert calls.value == 1, "expected exactly one background refresh"
+        print("✅ One upstream call per flight.")
+    finally:
+        app.cache.delete(key)
+        app.db.weather_observations.delete_many({"meta.location": location_id})
+        app.db.weather_locations.delete_one({"_id": location_id})
+
+
+if __name__ == "__main__":
+    main()
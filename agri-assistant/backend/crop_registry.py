@@ -0,0 +1,119 @@
+"""
+crop_registry.py — Krishi-Mithra Crop Registry
+===============================================
+One immutable snapshot of data/crops.json shared by every agronomy route:
+recommended N-P₂O₅-K₂O doses, straight-fertilizer nutrient contents and
+prices, crop summaries, growing requirements, and alias resolution
+(paddy → rice). Derived values
+(the urea / DAP / MOP dose for each crop, a target matrix for the batch
+fertility engine) are computed once per load. ReloadingRegistry swaps in a
+new snapshot when the file changes, so edits need no worker restart.
+"""
+
+import json
+import os
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Crop(NamedTuple):
+    key: str                        # canonical lowercase name
+    label: str                      # display name, e.g. "Rice (Paddy)"
+    emoji: str
+    aliases: tuple
+    npk: tuple | None               # recommended kg/ha (N, P₂O₅, K₂O); None when no dose is published
+    dose: MappingProxyType          # urea_kg / dap_kg / mop_kg / cost_rs at the recommended dose
+    summary: MappingProxyType       # summary / soil / duration / market
+    requirements: MappingProxyType  # soils / seasons / rainfall_mm / temperature_c / states (crop scoring)
+
+
+def normalize(name) -> str:
+    return " ".join(str(name or "").lower().split())
+
+
+def fertilizer_dose(n_req, p_req, k_req, fertilizers) -> dict:
+    """Straight-fertilizer kg/ha for an N-P-K requirement: P from DAP (crediting its N), rest of N from urea, K from MOP."""
+    dap_kg = p_req / fertilizers["dap"]["P"]
+    urea_kg = max((n_req - dap_kg * fertilizers["dap"]["N"]) / fertilizers["urea"]["N"], 0)
+    mop_kg = k_req / fertilizers["mop"]["K"]
+    urea_kg, dap_kg, mop_kg = round(urea_kg, 1), round(dap_kg, 1), round(mop_kg, 1)
+    cost = round(sum(kg * fertilizers[name]["price_per_kg"]
+                     for name, kg in (("urea", urea_kg), ("dap", dap_kg), ("mop", mop_kg))), 0)
+    return {"urea_kg": urea_kg, "dap_kg": dap_kg, "mop_kg": mop_kg, "cost_rs": cost}
+
+
+class CropRegistry:
+    """Read-only crop lookups over one version of the registry file."""
+
+    def __init__(self, document: dict):
+        self.version = document.get("version")
+        self.fertilizers = MappingProxyType({
+            name: MappingProxyType(dict(content)) for name, content in document["fertilizers"].items()
+        })
+
+        crops, lookup = {}, {}
+        for key, entry in document["crops"].items():
+            key = normalize(key)
+            npk = tuple(entry["npk"]) if entry.get("npk") else None
+            crops[key] = Crop(
+                key=key,
+                label=entry.get("label") or key.title(),
+                emoji=entry.get("emoji", "🌱"),
+                aliases=tuple(normalize(a) for a in entry.get("aliases", [])),
+                npk=npk,
+                dose=MappingProxyType(fertilizer_dose(*npk, self.fertilizers) if npk else {}),
+                summary=MappingProxyType(dict(entry.get("summary") or {})),
+                requirements=MappingProxyType(dict(entry.get("requirements") or {})),
+            )
+            for name in (key,) + crops[key].aliases:
+                lookup.setdefault(name, key)
+                lookup.setdefault(name.replace(" ", ""), key)  # "green gram" / "greengram"
+        self.crops = MappingProxyType(crops)
+        self._lookup = lookup
+
+        # Batch engine: crop row -> (N, P, K) targets, NaN rows for crops without a dose
+        self.rows = MappingProxyType({key: i for i, key in enumerate(crops)})
+        self.targets = np.array([c.npk or (np.nan,) * 3 for c in crops.values()], dtype=np.float64).reshape(-1, 3)
+        self.targets.flags.writeable = False
+
+    @classmethod
+    def from_file(cls, path: str) -> "CropRegistry":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.crops)
+
+    def resolve(self, name) -> str | None:
+        """Canonical crop key for a name or alias (case / spacing insensitive), else None."""
+        name = normalize(name)
+        return self._lookup.get(name) or self._lookup.get(name.replace(" ", ""))
+
+    def get(self, name) -> Crop | None:
+        key = self.resolve(name)
+        return self.crops[key] if key else None
+
+
+class ReloadingRegistry:
+    """Holds the current CropRegistry and replaces it when the file's mtime changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(path)
+        self.current = CropRegistry.from_file(path)
+
+    def reload_if_changed(self) -> bool:
+        """Loads a new snapshot if the file changed; a bad edit keeps the old one and raises."""
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime  # a broken file is retried on its next edit, not every tick
+            self.current = CropRegistry.from_file(self.path)  # readers see the old or the new snapshot
+        return True
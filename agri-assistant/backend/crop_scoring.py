@@ -0,0 +1,170 @@
+"""
+crop_scoring.py — Krishi-Mithra Crop Suitability Scoring
+=========================================================
+Ranks every crop in a CropRegistry snapshot for a (soil, season, state,
+rainfall, temperature) query. Crop requirements are compiled once into
+NumPy arrays — one-hot soil / season / state / agro-climatic-zone matrices
+and rainfall / temperature range vectors — so scoring a query is a handful
+of vectorized operations over all crops (tens of microseconds), with no
+model call.
+
+score = season gate × (0.30 soil + 0.25 rainfall + 0.25 temperature + 0.20 state)
+"""
+
+import numpy as np
+
+SOIL_TYPES = ("loamy", "clay", "sandy", "black", "red", "alluvial", "laterite")
+SOIL_ALIASES = {"loam": "loamy", "regur": "black", "vertisol": "black", "cotton": "black",
+                "silt": "alluvial", "gangetic": "alluvial", "lateritic": "laterite"}
+SEASONS = ("kharif", "rabi", "summer")
+SEASON_ALIASES = {"zaid": "summer", "monsoon": "kharif", "winter": "rabi"}
+
+WEIGHTS = {"soil": 0.30, "rainfall": 0.25, "temperature": 0.25, "state": 0.20}
+OFF_SEASON_FACTOR = 0.4      # crops not sown in the requested season keep 40% of their score
+UNKNOWN_FIT = 0.5            # soil / state the engine cannot place score as neutral
+SAME_ZONE_FIT = 0.6          # crop is grown in the state's agro-climatic zone, not the state itself
+RAINFALL_TOLERANCE = 0.5     # rainfall this fraction outside the range scores 0
+TEMPERATURE_TOLERANCE = 8.0  # °C outside the range at which temperature scores 0
+EDGE_PENALTY = 0.15          # in-range fit eases from 1 at the midpoint to 0.85 at the edges (breaks ties)
+OPEN_RANGES = {"rainfall_mm": (0, 10000), "temperature_c": (-50, 60)}  # crops without a stated range
+
+
+def range_fit(low, high, value, tolerance) -> np.ndarray:
+    """Per-crop fit of `value` to [low, high]: near 1 in range, falling to 0 at `tolerance` outside it."""
+    half = np.maximum((high - low) / 2, 1e-9)
+    inside = 1 - EDGE_PENALTY * np.minimum(np.abs(value - (low + high) / 2) / half, 1) ** 2
+    distance = np.maximum(low - value, 0) + np.maximum(value - high, 0)
+    outside = (1 - EDGE_PENALTY) * np.clip(1 - distance / tolerance, 0, 1)
+    return np.where(distance > 0, outside, inside)
+
+
+def normalize_state(state) -> str:
+    return " ".join(str(state or "").lower().replace("&", "and").split())
+
+
+def match_soils(soil) -> list:
+    """Soil vocabulary terms named in free text ("Black cotton", "sandy loam")."""
+    words = str(soil or "").lower().replace("-", " ").split()
+    found = []
+    for word in words:
+        term = word if word in SOIL_TYPES else SOIL_ALIASES.get(word)
+        if term and term not in found:
+            found.append(term)
+    return found
+
+
+def match_season(season) -> str | None:
+    text = str(season or "").lower()
+    for name in SEASONS:
+        if name in text:
+            return name
+    for alias, name in SEASON_ALIASES.items():
+        if alias in text:
+            return name
+    return None
+
+
+class CropScorer:
+    """Suitability ranking over one registry snapshot (crops without requirements are skipped)."""
+
+    def __init__(self, registry, zones: dict | None = None):
+        self.zones = {normalize_state(s): z for s, z in (zones or {}).items()}
+        self.crops = [c for c in registry.crops.values() if c.requirements]
+        reqs = [c.requirements for c in self.crops]
+
+        def one_hot(values, vocabulary):
+            index = {v: i for i, v in enumerate(vocabulary)}
+            matrix = np.zeros((len(values), len(vocabulary)), dtype=bool)
+            for row, items in enumerate(values):
+                matrix[row, [index[i] for i in items if i in index]] = True
+            return matrix
+
+        states = [[normalize_state(s) for s in r.get("states", [])] for r in reqs]
+        self.state_names = sorted({s for row in states for s in row} | set(self.zones))
+        self.zone_names = sorted(set(self.zones.values()))
+        self.soil = one_hot([r.get("soils", []) for r in reqs], SOIL_TYPES)
+        self.season = one_hot([r.get("seasons", []) for r in reqs], SEASONS)
+        self.state = one_hot(states, self.state_names)
+        self.zone = one_hot([[self.zones[s] for s in row if s in self.zones] for row in states], self.zone_names)
+        self.rainfall, self.temperature = (
+            np.array([r.get(key, OPEN_RANGES[key]) for r in reqs], dtype=np.float64).reshape(-1, 2)
+            for key in ("rainfall_mm", "temperature_c"))
+        self._state_index = {s: i for i, s in enumerate(self.state_names)}
+        self._zone_index = {z: i for i, z in enumerate(self.zone_names)}
+
+    def __len__(self):
+        return len(self.crops)
+
+    # ---------- component fits (all crops at once) ----------
+    def fits(self, soil, season, state, rainfall, temperature) -> dict:
+        n = len(self.crops)
+        soils = [SOIL_TYPES.index(s) for s in match_soils(soil)]
+        soil_fit = self.soil[:, soils].any(axis=1).astype(np.float64) if soils else np.full(n, UNKNOWN_FIT)
+
+        season_name = match_season(season)
+        in_season = self.season[:, SEASONS.index(season_name)] if season_name else np.ones(n, dtype=bool)
+
+        state = normalize_state(state)
+        state_fit = np.full(n, UNKNOWN_FIT)
+        zone = self.zones.get(state)
+        if zone is not None:
+            state_fit = np.where(self.zone[:, self._zone_index[zone]], SAME_ZONE_FIT, 0.0)
+        if state in self._state_index:
+            state_fit = np.where(self.state[:, self._state_index[state]], 1.0, state_fit if zone else 0.0)
+
+        # Rainfall tolerance scales with the range bound it misses, temperature's is absolute
+        low, high = self.rainfall[:, 0], self.rainfall[:, 1]
+        rain_fit = range_fit(low, high, rainfall, RAINFALL_TOLERANCE * np.maximum(np.where(rainfall < low, low, high), 1))
+        temp_fit = range_fit(self.temperature[:, 0], self.temperature[:, 1], temperature, TEMPERATURE_TOLERANCE)
+
+        return {"soil": soil_fit, "season": in_season, "state": state_fit,
+                "rainfall": rain_fit, "temperature": temp_fit, "season_name": season_name}
+
+    @staticmethod
+    def _total(f) -> np.ndarray:
+        return sum(WEIGHTS[k] * f[k] for k in WEIGHTS) * np.where(f["season"], 1.0, OFF_SEASON_FACTOR)
+
+    def scores(self, soil, season, state, rainfall, temperature) -> np.ndarray:
+        """0–1 suitability of every crop, in self.crops order."""
+        return self._total(self.fits(soil, season, state, rainfall, temperature))
+
+    # ---------- ranking ----------
+    def rank(self, soil, season, state, rainfall, temperature, top: int = 5) -> list:
+        """Best `top` crops as dicts: crop, label, emoji, score (0–100) and the reasons behind it."""
+        f = self.fits(soil, season, state, rainfall, temperature)
+        total = self._total(f)
+        order = np.argsort(-total, kind="stable")[:top]
+        return [self._explain(i, total[i], f, soil, state, rainfall, temperature) for i in order.tolist()]
+
+    def score_of(self, crop_key, soil, season, state, rainfall, temperature) -> dict | None:
+        """The same breakdown for one named crop (e.g. the farmer's preference), or None if unscored."""
+        for i, crop in enumerate(self.crops):
+            if crop.key == crop_key:
+                f = self.fits(soil, season, state, rainfall, temperature)
+                return self._explain(i, self._total(f)[i], f, soil, state, rainfall, temperature)
+        return None
+
+    def _explain(self, i, total, f, soil, state, rainfall, temperature) -> dict:
+        crop, req = self.crops[i], self.crops[i].requirements
+        reasons = []
+        if f["soil"][i] == 1:
+            reasons.append(f"suits {soil.strip().lower()} soil")
+        elif f["soil"][i] == 0:
+            reasons.append(f"prefers {', '.join(req.get('soils', []))} soil")
+        if f["season_name"]:
+            reasons.append(f"{f['season_name']} crop" if f["season"][i]
+                           else f"usually sown in {' / '.join(req.get('seasons', []))}")
+        if "rainfall_mm" in req:
+            low, high = req["rainfall_mm"]
+            fit = "within" if low <= rainfall <= high else "outside"
+            reasons.append(f"rainfall {rainfall:g} mm {fit} its {low:g}–{high:g} mm range")
+        if "temperature_c" in req:
+            low, high = req["temperature_c"]
+            fit = "within" if low <= temperature <= high else "outside"
+            reasons.append(f"{temperature:g}°C {fit} its {low:g}–{high:g}°C range")
+        if f["state"][i] == 1 and state:
+            reasons.append(f"major crop of {state.strip().title()}")
+        elif f["state"][i] == SAME_ZONE_FIT:
+            reasons.append("grown in the same agro-climatic zone")
+        return {"crop": crop.key, "label": crop.label, "emoji": crop.emoji,
+                "score": round(float(total) * 100), "reasons": reasons}
@@ -0,0 +1,243 @@
+"""
+fertility_engine.py — Krishi-Mithra Soil Fertility & Fertilizer Engine
+=======================================================================
+Soil-test classification (pH / N / P / K levels) and the urea-DAP-MOP plan
+for a target crop. The scalar functions serve single requests; the batch
+functions run the same arithmetic over NumPy columns so a Soil Health Card
+drive's worth of samples is one pass, and produce identical results. Crop
+targets and fertilizer contents come from a CropRegistry snapshot.
+"""
+
+import numpy as np
+
+PH_ACIDIC, PH_ALKALINE = 5.5, 8.0
+NUTRIENT_LOW = {"n": 100, "p": 20, "k": 100}  # below these a nutrient is "Low", else "Medium"
+
+PH_MESSAGES = {
+    "Low": "Soil is acidic — apply lime or dolomite to increase pH.",
+    "High": "Soil is alkaline — apply gypsum or sulfur-based amendments.",
+    "Medium": "pH is suitable for most crops.",
+}
+NUTRIENT_MESSAGES = {
+    "n": "Apply Nitrogen fertilizer (e.g. Urea, Ammonium Nitrate).",
+    "p": "Apply Phosphorus fertilizer (e.g. DAP, Single Super Phosphate).",
+    "k": "Apply Potassium fertilizer (e.g. MOP or Potassium Nitrate).",
+}
+SPLIT_DOSE_MESSAGE = "Apply fertilizers in split doses following crop growth stages."
+LEVEL_NAMES = ("Low", "Medium", "High")
+
+
+# ---------- scalar ----------
+def analyze_fertility(n, p, k, ph):
+    """Simple soil analysis logic."""
+    levels, recommendations = {}, []
+
+    if ph < PH_ACIDIC:
+        levels["ph_level"] = "Low"
+    elif ph > PH_ALKALINE:
+        levels["ph_level"] = "High"
+    else:
+        levels["ph_level"] = "Medium"
+    recommendations.append(PH_MESSAGES[levels["ph_level"]])
+
+    for nutrient, value in (("n", n), ("p", p), ("k", k)):
+        if value < NUTRIENT_LOW[nutrient]:
+            levels[f"{nutrient}_level"] = "Low"
+            recommendations.append(NUTRIENT_MESSAGES[nutrient])
+        else:
+            levels[f"{nutrient}_level"] = "Medium"
+
+    return levels, recommendations
+
+
+def get_fertilizer_recommendation(n, p, k, crop, registry):
+    target_crop = registry.get(crop)
+    if not target_crop or not target_crop.npk:
+        return {"error": f"Crop '{crop}' not found in database."}
+    n_target, p_target, k_target = target_crop.npk
+    fertilizers = registry.fertilizers
+
+    # Calculate nutrient gaps
+    n_gap = max(0, n_target - n)
+    p_gap = max(0, p_target - p)
+    k_gap = max(0, k_target - k)
+
+    # Calculate fertilizer requirements
+    kg_mop = k_gap / fertilizers["mop"]["K"] if k_gap > 0 else 0
+    kg_dap = p_gap / fertilizers["dap"]["P"] if p_gap > 0 else 0
+    n_from_dap = kg_dap * fertilizers["dap"]["N"]
+    n_still_needed = max(0, n_gap - n_from_dap)
+    kg_urea = n_still_needed / fertilizers["urea"]["N"] if n_still_needed > 0 else 0
+
+    return fertilizer_plan(crop.title(), round(n_gap), round(p_gap), round(k_gap),
+                           round(kg_urea, 1), round(kg_dap, 1), round(kg_mop, 1))
+
+
+def fertilizer_plan(crop_title, n_add, p_add, k_add, urea, dap, mop) -> dict:
+    """Response dict for one sample from rounded values; shared by the scalar and batch paths."""
+    return {
+        "urea_kg": urea,
+        "dap_kg": dap,
+        "mop_kg": mop,
+        "recommendations": [
+            f"For {crop_title}, you need to add {n_add} kg/ha N, {p_add} kg/ha P, {k_add} kg/ha K.",
+            f"Use approximately {urea} kg Urea, {dap} kg DAP, and {mop} kg MOP.",
+            SPLIT_DOSE_MESSAGE,
+        ],
+    }
+
+
+# ---------- batch ----------
+def parse_samples(samples: list, fields: tuple, defaults: dict | None = None) -> tuple:
+    """
+    Splits a list of soil-test dicts into a float64 matrix (one column per field) and a crop list.
+    Without `defaults` every field and the crop must be present and non-zero, as /calculate-fertilizer
+    requires; with them, missing keys fall back like /analyze-fertility. Returns
+    (rows, values, crops, results): `rows` are the positions of usable samples and `results` is the
+    per-sample output list with an {"error"} already filled in for every other position.
+    """
+    rows, values, crops, results = [], [], [], [None] * len(samples)
+    for i, sample in enumerate(samples):
+        if not isinstance(sample, dict):
+            results[i] = {"error": "Sample must be an object."}
+            continue
+        if defaults is None:
+            if not all(sample.get(f) for f in fields + ("crop",)):
+                results[i] = {"error": "Missing N, P, K, or crop."}
+                continue
+            raw, crop = [sample[f] for f in fields], sample["crop"]
+        else:
+            raw, crop = [sample.get(f, defaults[f]) for f in fields], sample.get("crop", defaults["crop"])
+        try:
+            numbers = [float(v) for v in raw]
+        except (TypeError, ValueError):
+            results[i] = {"error": f"{', '.join(fields)} must be numbers."}
+            continue
+        if not isinstance(crop, str):
+            results[i] = {"error": "crop must be a string."}
+            continue
+        rows.append(i)
+        values.append(numbers)
+        crops.append(crop)
+
+    values = np.array(values, dtype=np.float64).reshape(-1, len(fields))
+    finite = np.isfinite(values).all(axis=1)
+    if not finite.all():
+        for i in np.flatnonzero(~finite).tolist():
+            results[rows[i]] = {"error": f"{', '.join(fields)} must be finite numbers."}
+        rows = [r for r, ok in zip(rows, finite.tolist()) if ok]
+        crops = [c for c, ok in zip(crops, finite.tolist()) if ok]
+        values = values[finite]
+    return rows, values, crops, results
+
+
+def crop_target_columns(crops: list, registry) -> tuple:
+    """(known mask, N, P, K target arrays) for a list of crop names; each distinct name is resolved once."""
+    rows = {}
+    for crop in crops:
+        if crop not in rows:
+            rows[crop] = registry.rows.get(registry.resolve(crop), -1)
+    index = np.fromiter((rows[crop] for crop in crops), dtype=np.int64, count=len(crops))
+    # Row -1 (unknown crop) reads a NaN row appended after the registry's targets
+    table = np.vstack([registry.targets, np.full((1, 3), np.nan)])[index]
+    return ~np.isnan(table[:, 0]), table[:, 0], table[:, 1], table[:, 2]
+
+
+def fertilizer_columns(n, p, k, crops, registry) -> dict:
+    """
+    Nutrient gaps and urea / DAP / MOP kg/ha for arrays of samples, unrounded.
+    Unknown crops come back with known=False and NaN quantities.
+    """
+    n, p, k = (np.asarray(a, dtype=np.float64) for a in (n, p, k))
+    known, n_target, p_target, k_target = crop_target_columns(crops, registry)
+    fertilizers = registry.fertilizers
+
+    n_gap = np.maximum(0, n_target - n)
+    p_gap = np.maximum(0, p_target - p)
+    k_gap = np.maximum(0, k_target - k)
+
+    kg_mop = np.where(k_gap > 0, k_gap / fertilizers["mop"]["K"], 0)
+    kg_dap = np.where(p_gap > 0, p_gap / fertilizers["dap"]["P"], 0)
+    n_still_needed = np.maximum(0, n_gap - kg_dap * fertilizers["dap"]["N"])
+    kg_urea = np.where(n_still_needed > 0, n_still_needed / fertilizers["urea"]["N"], 0)
+
+    return {"known": known, "n_gap": n_gap, "p_gap": p_gap, "k_gap": k_gap,
+            "urea_kg": kg_urea, "dap_kg": kg_dap, "mop_kg": kg_mop}
+
+
+def fertility_level_columns(n, p, k, ph) -> dict:
+    """Level codes (0 Low, 1 Medium, 2 High — index into LEVEL_NAMES) per sample."""
+    ph = np.asarray(ph, dtype=np.float64)
+    levels = {"ph_level": np.where(ph < PH_ACIDIC, 0, np.where(ph > PH_ALKALINE, 2, 1))}
+    for nutrient, values in (("n", n), ("p", p), ("k", k)):
+        levels[f"{nutrient}_level"] = np.where(np.asarray(values, dtype=np.float64) < NUTRIENT_LOW[nutrient], 0, 1)
+    return levels
+
+
+def round_like_python(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    np.round(values, digits) matching Python's round() exactly. np.round scales by 10**digits first,
+    which can land on the wrong side of a tie, so near-tie elements are re-rounded in Python.
+    """
+    rounded = np.round(values, digits)
+    if digits:
+        scaled = values * 10 ** digits
+        for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6).tolist():
+            rounded[i] = round(float(values[i]), digits)
+    return rounded
+
+
+def fertilizer_plan_columns(n, p, k, crops, registry) -> dict:
+    """
+    Rounded plan columns as lists, valued exactly as the scalar path returns them: whole kg/ha gaps
+    (n_add / p_add / k_add) and one-decimal urea / DAP / MOP kg. Unknown crops are None throughout.
+    """
+    cols = fertilizer_columns(n, p, k, crops, registry)
+    known = cols["known"].tolist()
+    plan = {"known": known}
+    for name, column in (("n_add", "n_gap"), ("p_add", "p_gap"), ("k_add", "k_gap")):
+        values = np.where(cols["known"], np.rint(cols[column]), 0).astype(np.int64).tolist()
+        plan[name] = [v if ok else None for v, ok in zip(values, known)]
+    for column in ("urea_kg", "dap_kg", "mop_kg"):
+        # The scalar path leaves a quantity as int 0 when nothing is needed, so mirror that
+        rounded, zero = round_like_python(cols[column], 1).tolist(), (cols[column] == 0).tolist()
+        plan[column] = [None if not ok else 0 if z else q for q, z, ok in zip(rounded, zero, known)]
+    return plan
+
+
+def fertilizer_batch(n, p, k, crops, registry) -> list:
+    """get_fertilizer_recommendation() for every sample, computed column-wise."""
+    plan = fertilizer_plan_columns(n, p, k, crops, registry)
+    titles, results = {}, []
+    for crop, ok, *values in zip(crops, *(plan[c] for c in ("known", "n_add", "p_add", "k_add",
+                                                            "urea_kg", "dap_kg", "mop_kg"))):
+        if not ok:
+            results.append({"error": f"Crop '{crop}' not found in database."})
+            continue
+        title = titles.get(crop)
+        if title is None:
+            title = titles[crop] = crop.title()
+        results.append(fertilizer_plan(title, *values))
+    return results
+
+
+def fertility_level_names(n, p, k, ph) -> dict:
+    """Level name columns (lists of "Low" / "Medium" / "High") for every sample."""
+    return {key: [LEVEL_NAMES[c] for c in codes.tolist()]
+            for key, codes in fertility_level_columns(n, p, k, ph).items()}
+
+
+def fertility_batch(n, p, k, ph) -> list:
+    """analyze_fertility() for every sample as [(levels, recommendations)], computed column-wise."""
+    codes = fertility_level_columns(n, p, k, ph)
+    # Eight possible N/P/K low combinations: build each recommendation tail once
+    tails = [[NUTRIENT_MESSAGES[x] for x, low in zip("npk", (n_low, p_low, k_low)) if low]
+             for n_low in (False, True) for p_low in (False, True) for k_low in (False, True)]
+    combo = ((codes["n_level"] == 0) * 4 + (codes["p_level"] == 0) * 2 + (codes["k_level"] == 0)).tolist()
+    return [
+        ({"ph_level": LEVEL_NAMES[ph_code], "n_level": LEVEL_NAMES[n_code],
+          "p_level": LEVEL_NAMES[p_code], "k_level": LEVEL_NAMES[k_code]},
+         [PH_MESSAGES[LEVEL_NAMES[ph_code]]] + tails[c])
+        for ph_code, n_code, p_code, k_code, c in zip(
+            *(codes[key].tolist() for key in ("ph_level", "n_level", "p_level", "k_level")), combo)
+    ]
@@ -0,0 +1,128 @@
+"""
+keyword_matcher.py — Krishi-Mithra Treatment Keyword Extractor
+===============================================================
+Compiles the agri-input vocabulary (active ingredients, brand names, pests,
+diseases, fertilizers) into an Aho-Corasick automaton so AI treatment text can
+be mapped to marketplace product tags in a single pass.
+"""
+
+import json
+from collections import Counter, deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over a {term: [tags]} vocabulary."""
+
+    def __init__(self, term_tags: dict):
+        self.term_tags = {}
+        for term, tags in term_tags.items():
+            term = " ".join(term.lower().split())
+            if term:
+                self.term_tags[term] = list(tags)
+        self._terms = list(self.term_tags)
+        self._build()
+
+    # ---------- construction ----------
+    def _build(self):
+        goto = [{}]      # state -> {char: next_state}
+        outputs = [[]]   # state -> [term ids ending here]
+        for term_id, term in enumerate(self._terms):
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(term_id)
+
+        # Breadth-first pass to wire failure links and merge outputs
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+
+        self._goto, self._fail, self._outputs = goto, fail, outputs
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordMatcher":
+        """Builds a matcher from a vocabulary JSON file (see data/agri_keywords.json)."""
+        with open(path, encoding="utf-8") as f:
+            return cls(expand_vocabulary(json.load(f)))
+
+    # ---------- matching ----------
+    def find(self, text: str) -> list:
+        """Returns [(term, start)] for whole-word matches, leftmost-longest, non-overlapping."""
+        text = " ".join((text or "").lower().split())
+        goto, fail, outputs, terms = self._goto, self._fail, self._outputs, self._terms
+        raw, state = [], 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for term_id in outputs[state]:
+                term = terms[term_id]
+                start = i - len(term) + 1
+                if _is_boundary(text, start - 1) and _is_boundary(text, i + 1):
+                    raw.append((start, len(term), term))
+
+        raw.sort(key=lambda m: (m[0], -m[1]))
+        matches, covered_until = [], 0
+        for start, length, term in raw:
+            if start >= covered_until:
+                matches.append((term, start))
+                covered_until = start + length
+        return matches
+
+    def term_counts(self, text: str) -> Counter:
+        return Counter(term for term, _ in self.find(text))
+
+    def tag_counts(self, text: str) -> Counter:
+        """Product tags mentioned in `text`, weighted by how often they were matched."""
+        counts = Counter()
+        for term, hits in self.term_counts(text).items():
+            for tag in self.term_tags[term]:
+                counts[tag] += hits
+        return counts
+
+
+def _is_boundary(text: str, i: int) -> bool:
+    return i < 0 or i >= len(text) or not text[i].isalnum()
+
+
+def expand_vocabulary(vocab: dict) -> dict:
+    """
+    Flattens the grouped vocabulary file into {term: [tags]}.
+    - ingredients: {class: [ingredient]}   -> [class, ingredient]
+    - keywords:    {tag: [term]}           -> [tag]
+    - brands:      {brand: ingredient}     -> tags of that ingredient
+    - fertilizers: {term: [tags]}          -> explicit tags
+    """
+    term_tags = {}
+
+    def add(term, tags):
+        existing = term_tags.setdefault(term.lower(), [])
+        for tag in tags:
+            if tag not in existing:
+                existing.append(tag)
+
+    for cls_tag, ingredients in vocab.get("ingredients", {}).items():
+        for ingredient in ingredients:
+            add(ingredient, [cls_tag, ingredient.lower()])
+    for tag, terms in vocab.get("keywords", {}).items():
+        for term in terms:
+            add(term, [tag])
+    for term, tags in vocab.get("fertilizers", {}).items():
+        add(term, tags)
+    for brand, ingredient in vocab.get("brands", {}).items():
+        add(brand, term_tags.get(ingredient.lower(), [ingredient.lower()]))
+    return term_tags
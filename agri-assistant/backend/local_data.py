@@ -315,144 +315,9 @@ def find_local_answer(query: str) -> str | None:
 
 
 # ============================================================
-# 2. CROP SUMMARY DATABASE (20+ crops)
+# 2. CROP SUMMARY DATABASE — moved to data/crops.json (crop_registry.py)
 # ============================================================
 
-CROP_SUMMARY_DB = {
-    "rice": {
-        "summary": "Rice thrives in flooded or well-irrigated conditions with warm, humid climate (25–35°C). It is the staple food of over half of India's population.",
-        "soil": "Clay or loamy clay",
-        "duration": "90–150 days (variety-dependent)",
-        "market": "Very High"
-    },
-    "wheat": {
-        "summary": "Wheat is India's primary rabi crop, requiring cool temperatures (15–20°C) during growth and warm, dry weather at maturity.",
-        "soil": "Loamy, well-drained",
-        "duration": "110–120 days",
-        "market": "Very High"
-    },
-    "maize": {
-        "summary": "Maize (corn) is a versatile kharif crop used for food, fodder, and industrial purposes. Requires warm temperatures and moderate rainfall.",
-        "soil": "Loamy, well-drained",
-        "duration": "80–95 days",
-        "market": "High"
-    },
-    "cotton": {
-        "summary": "Cotton is a key cash crop of India requiring long, hot summers with moderate rainfall. Ideal for black cotton (regur) soils of central India.",
-        "soil": "Black cotton / Vertisol",
-        "duration": "170–200 days",
-        "market": "Very High"
-    },
-    "sugarcane": {
-        "summary": "Sugarcane requires a tropical climate, abundant water, and rich fertile soils. India is the world's second-largest producer.",
-        "soil": "Deep loamy, rich",
-        "duration": "10–18 months",
-        "market": "Very High"
-    },
-    "soybean": {
-        "summary": "Soybean is a high-protein legume crop grown mainly in Madhya Pradesh and Maharashtra. It fixes atmospheric nitrogen naturally.",
-        "soil": "Well-drained loamy",
-        "duration": "90–100 days",
-        "market": "High"
-    },
-    "groundnut": {
-        "summary": "Groundnut (peanut) thrives in sandy loam soils with good drainage and 500–1250 mm rainfall. A major oilseed crop of India.",
-        "soil": "Sandy loam",
-        "duration": "90–130 days",
-        "market": "High"
-    },
-    "potato": {
-        "summary": "Potato requires cool temperatures (15–20°C) and well-drained fertile soils. India is the world's third-largest potato producer.",
-        "soil": "Loamy / Sandy loam",
-        "duration": "70–120 days",
-        "market": "High"
-    },
-    "tomato": {
-        "summary": "Tomato is India's most widely grown vegetable, suitable for warm conditions (20–27°C). Requires well-drained, fertile soils.",
-        "soil": "Loamy, fertile",
-        "duration": "60–90 days",
-        "market": "Very High"
-    },
-    "onion": {
-        "summary": "Onion requires cool weather during bulb formation and dry conditions at maturity. Maharashtra and Karnataka are major producers.",
-        "soil": "Sandy loam to clay loam",
-        "duration": "90–150 days",
-        "market": "High"
-    },
-    "mustard": {
-        "summary": "Mustard is a cold-season oilseed crop, mainly grown in Rajasthan and UP during the rabi season. Very drought-tolerant.",
-        "soil": "Sandy loam to loam",
-        "duration": "110–140 days",
-        "market": "High"
-    },
-    "sunflower": {
-        "summary": "Sunflower is adaptable to varied climates and soils, making it ideal for crop rotation. Grown in Karnataka, Andhra Pradesh, and Haryana.",
-        "soil": "Well-drained loam",
-        "duration": "85–105 days",
-        "market": "Medium"
-    },
-    "chickpea": {
-        "summary": "Chickpea (gram) is India's most important pulse crop, grown in rabi season across semi-arid regions. Very drought tolerant.",
-        "soil": "Sandy loam to clay",
-        "duration": "90–120 days",
-        "market": "High"
-    },
-    "lentil": {
-        "summary": "Lentil (masoor) is a cool-season pulse crop rich in protein. Grown extensively in Madhya Pradesh and Uttar Pradesh.",
-        "soil": "Loam to clay loam",
-        "duration": "80–110 days",
-        "market": "High"
-    },
-    "mungbean": {
-        "summary": "Mung bean (green gram) is a short-duration summer crop with high protein content. Excellent for crop rotation with rice-wheat.",
-        "soil": "Sandy loam",
-        "duration": "55–70 days",
-        "market": "High"
-    },
-    "bajra": {
-        "summary": "Pearl millet (bajra) is highly drought tolerant and thrives in arid/semi-arid regions of Rajasthan and Gujarat.",
-        "soil": "Sandy loam, low fertility",
-        "duration": "75–90 days",
-        "market": "Medium"
-    },
-    "jowar": {
-        "summary": "Sorghum (jowar) is a highly versatile, drought-resistant crop used for food, fodder and ethanol. Grown in Karnataka and Maharashtra.",
-        "soil": "Medium-deep black soil",
-        "duration": "90–120 days",
-        "market": "Medium"
-    },
-    "turmeric": {
-        "summary": "Turmeric requires warm, humid conditions and rich, well-drained soils. India produces 80% of the world's turmeric.",
-        "soil": "Rich loamy / clay loam",
-        "duration": "7–9 months",
-        "market": "Very High"
-    },
-    "banana": {
-        "summary": "Banana thrives in tropical conditions with high rainfall or irrigation. Tamil Nadu, Maharashtra, and AP are major producers.",
-        "soil": "Rich, well-drained loam",
-        "duration": "12–15 months",
-        "market": "Very High"
-    },
-    "mango": {
-        "summary": "Mango, the king of fruits, requires a tropical/sub-tropical climate with a distinct dry season for flowering induction.",
-        "soil": "Deep loamy, well-drained",
-        "duration": "4–5 years (perennial)",
-        "market": "Very High"
-    },
-    "papaya": {
-        "summary": "Papaya is a fast-growing, high-value fruit crop that starts bearing in 6–9 months. Sensitive to waterlogging.",
-        "soil": "Sandy loam, well-drained",
-        "duration": "9–10 months (first harvest)",
-        "market": "High"
-    },
-    "brinjal": {
-        "summary": "Brinjal (eggplant) is a warm-season vegetable grown throughout India. Highly productive with proper irrigation.",
-        "soil": "Sandy loam to clay",
-        "duration": "70–95 days",
-        "market": "Medium"
-    },
-}
-
 
 # ============================================================
 # 3. SEASONAL DASHBOARD ADVICE (instant, no API needed)
@@ -912,3 +777,65 @@ MOCK_MARKET_DATA = [
     {"commodity": "Banana", "state": "Tamil Nadu", "district": "Thanjavur", "market": "Thanjavur Mandi", "modal_price": "1800", "arrival_date": "2025-12-14"},
     {"commodity": "Apple", "state": "Himachal Pradesh", "district": "Shimla", "market": "Shimla Fruit Mandi", "modal_price": "8500", "arrival_date": "2025-12-13"},
 ]
+
+
+# ============================================================
+# 7. AGRO-CLIMATIC ZONES (Planning Commission, state-level)
+#    Used to group weather advice across neighbouring cities.
+# ============================================================
+
+AGRO_CLIMATIC_ZONES = {
+    "jammu and kashmir": "Western Himalayan", "ladakh": "Western Himalayan",
+    "himachal pradesh": "Western Himalayan", "uttarakhand": "Western Himalayan",
+    "sikkim": "Eastern Himalayan", "arunachal pradesh": "Eastern Himalayan", "assam": "Eastern Himalayan",
+    "meghalaya": "Eastern Himalayan", "nagaland": "Eastern Himalayan", "manipur": "Eastern Himalayan",
+    "mizoram": "Eastern Himalayan", "tripura": "Eastern Himalayan",
+    "west bengal": "Lower Gangetic Plains",
+    "bihar": "Middle Gangetic Plains",
+    "uttar pradesh": "Upper Gangetic Plains",
+    "punjab": "Trans-Gangetic Plains", "haryana": "Trans-Gangetic Plains", "delhi": "Trans-Gangetic Plains",
+    "chandigarh": "Trans-Gangetic Plains",
+    "jharkhand": "Eastern Plateau and Hills", "chhattisgarh": "Eastern Plateau and Hills", "odisha": "East Coast Plains and Hills",
+    "madhya pradesh": "Central Plateau and Hills",
+    "maharashtra": "Western Plateau and Hills",
+    "karnataka": "Southern Plateau and Hills", "telangana": "Southern Plateau and Hills",
+    "andhra pradesh": "East Coast Plains and Hills", "tamil nadu": "East Coast Plains and Hills",
+    "puducherry": "East Coast Plains and Hills",
+    "kerala": "West Coast Plains and Ghats", "goa": "West Coast Plains and Ghats",
+    "gujarat": "Gujarat Plains and Hills", "dadra and nagar haveli and daman and diu": "Gujarat Plains and Hills",
+    "rajasthan": "Western Dry Region",
+    "andaman and nicobar islands": "Islands", "lakshadweep": "Islands",
+}
+
+
+def get_agro_climatic_zone(state: str | None) -> str | None:
+    """Maps an Indian state/UT name to its agro-climatic zone, or None if unknown."""
+    if not state:
+        return None
+    state_l = " ".join(state.lower().replace("&", "and").split())
+    if state_l.startswith("national capital territory") or state_l == "nct of delhi":
+        state_l = "delhi"
+    return AGRO_CLIMATIC_ZONES.get(state_l)
+
+
+# ============================================================
+# 8. MANDI COORDINATES (lat, lon) for the mock markets above
+#    Lets nearest-mandi lookups work offline; other markets are
+#    located through the district geocode.
+# ============================================================
+
+MANDI_COORDINATES = {
+    "ludhiana mandi": (30.90, 75.85), "karnal mandi": (29.69, 76.99),
+    "bhimavaram mandi": (16.54, 81.52), "katwa mandi": (23.65, 88.13),
+    "rajkot mandi": (22.30, 70.80), "amravati mandi": (20.93, 77.75),
+    "indore mandi": (22.72, 75.86), "davangere mandi": (14.46, 75.92),
+    "kurnool mandi": (15.83, 78.04), "alwar mandi": (27.55, 76.60),
+    "lasalgaon mandi": (20.15, 74.23), "agra mandi": (27.18, 78.01),
+    "kolar mandi": (13.14, 78.13), "muzaffarnagar mill": (29.47, 77.70),
+    "kolhapur mill": (16.70, 74.24), "nizamabad mandi": (18.67, 78.09),
+    "vidisha mandi": (23.52, 77.81), "sagar mandi": (23.84, 78.74),
+    "bijapur mandi": (16.83, 75.71), "jodhpur mandi": (26.24, 73.02),
+    "haveri mandi": (14.79, 75.40), "latur mandi": (18.40, 76.56),
+    "guntur mandi": (16.31, 80.44), "thanjavur mandi": (10.79, 79.14),
+    "shimla fruit mandi": (31.10, 77.17),
+}
@@ -0,0 +1,183 @@
+"""
+market_cleaning.py — Krishi-Mithra Agmarknet Cleaning Stage
+============================================================
+Cleans one ingest batch (an API page) of raw Agmarknet records column-wise:
+names are canonicalized through an alias table, prices and dates are parsed
+once per distinct string, invalid rows and duplicates are dropped, and modal
+prices far from their commodity's batch median (robust z-score on the MAD)
+are flagged as outliers rather than silently averaged in downstream.
+
+parse_price / parse_date are the one copy of Agmarknet value parsing; the
+store (app.py) and MarketTable use them too.
+"""
+
+import hashlib
+import json
+import re
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+NAME_COLUMNS = ("commodity", "state", "district", "market", "variety")
+PRICE_COLUMNS = ("modal_price", "min_price", "max_price")
+MISSING = {"", "n/a", "na", "nan", "null", "none", "-", "--"}
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d")
+WORD = re.compile(r"[^\W\d_]+")  # letter runs: the words str.title() would capitalize
+
+OUTLIER_LIMIT = 5.0        # robust z-score beyond which a modal price is flagged
+OUTLIER_MIN_GROUP = 5      # commodities with fewer prices in a batch are never flagged
+MAD_SCALE = 1.4826         # MAD -> standard deviation for normally distributed prices
+MAD_FLOOR = 0.10           # spread floor as a fraction of the median (MAD of 0 is common): flags ±50% moves
+
+
+def parse_price(value) -> float | None:
+    """'2,150' / '₹ 2150' / 2150 -> float, or None if missing or unparseable."""
+    try:
+        return float(str(value).replace(",", "").replace("₹", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value) -> date | None:
+    """'dd/mm/yyyy', ISO 'yyyy-mm-dd[...]' or a datetime -> date, or None if unparseable."""
+    if isinstance(value, datetime):  # rows read back from Mongo
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or "").strip()[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+class MarketCleaner:
+    """Vectorized cleaning of Agmarknet record batches."""
+
+    def __init__(self, aliases: dict | None = None):
+        aliases = aliases or {}
+        self.aliases = {
+            column: {" ".join(k.lower().split()): v for k, v in aliases.get(column, {}).items()}
+            for column in NAME_COLUMNS
+        }
+        self.acronyms = frozenset(a.lower() for a in aliases.get("acronyms", []))  # "APMC", "FAQ", "UP"
+        # Changes whenever the alias table does, so stored keys can be migrated once per edit
+        self.fingerprint = hashlib.sha1(json.dumps({**self.aliases, "acronyms": sorted(self.acronyms)},
+                                                   sort_keys=True).encode()).hexdigest()[:16]
+
+    @classmethod
+    def from_file(cls, path: str) -> "MarketCleaner":
+        """Builds a cleaner from an alias JSON file (see data/market_aliases.json)."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    # ---------- scalar helpers (run once per distinct value) ----------
+    def canonical_name(self, column: str, value: str) -> str:
+        text = " ".join(value.split())
+        if text.lower() in MISSING:
+            return ""
+        alias = self.aliases[column].get(text.lower())
+        if alias:
+            return alias
+        # SHOUTING or all-lowercase names get title case; mixed case is kept as sent.
+        # Listed acronyms are upper case either way ("PUNE APMC" / "Pune Apmc" -> "Pune APMC")
+        if text.isupper() or text.islower():
+            return WORD.sub(self._title_word, text)
+        return WORD.sub(self._acronym_word, text) if self.acronyms else text
+
+    def _title_word(self, match) -> str:
+        word = match.group()
+        return word.upper() if word.lower() in self.acronyms else word.capitalize()
+
+    def _acronym_word(self, match) -> str:
+        word = match.group()
+        return word.upper() if word.lower() in self.acronyms else word
+
+    def name_key(self, column: str, value) -> str:
+        """Lowercase canonical name, as the store keys it ("Paddy(Dhan)(Common)" -> "rice")."""
+        return self.canonical_name(column, str(value or "")).lower()
+
+    @staticmethod
+    def _factorize(records, column):
+        """(distinct raw strings, row -> distinct index) for one column."""
+        raw = np.array(["" if r.get(column) is None else str(r.get(column)) for r in records], dtype=str)
+        return np.unique(raw, return_inverse=True)
+
+    def _parse(self, records, column, fn, dtype):
+        """Applies `fn` once per distinct string in a column and scatters the results back to rows (None -> NaN / NaT)."""
+        distinct, inverse = self._factorize(records, column)
+        return np.array([fn(v) for v in distinct.tolist()], dtype=dtype)[inverse]
+
+    # ---------- batch cleaning ----------
+    def clean(self, records: list) -> tuple:
+        """Returns (clean rows, report). Rows carry float prices, UTC datetimes and an `outlier` flag."""
+        n = len(records)
+        report = {"input": n, "invalid": 0, "duplicates": 0, "outliers": 0, "kept": 0}
+        if not n:
+            return [], report
+
+        names, codes = {}, {}
+        for column in NAME_COLUMNS:
+            distinct, inverse = self._factorize(records, column)
+            canonical = np.array([self.canonical_name(column, v) for v in distinct.tolist()], dtype=object)
+            _, canonical_codes = np.unique(canonical.astype(str), return_inverse=True)  # aliases merge codes
+            names[column], codes[column] = canonical[inverse], canonical_codes[inverse]
+        prices = {column: self._parse(records, column, parse_price, np.float64) for column in PRICE_COLUMNS}
+        dates = self._parse(records, "arrival_date", parse_date, "datetime64[D]")
+
+        modal = prices["modal_price"]
+        valid = ((modal > 0) & ~np.isnat(dates)
+                 & (names["commodity"] != "") & (names["market"] != ""))
+        report["invalid"] = int(n - valid.sum())
+        rows = np.flatnonzero(valid)
+
+        # Dedupe on (commodity, state, district, market, variety, date); the last copy wins
+        keys = np.column_stack([codes[c][rows] for c in NAME_COLUMNS] + [dates[rows].astype(np.int64)])
+        _, last = np.unique(keys[::-1], axis=0, return_index=True)
+        rows = np.sort(rows[len(rows) - 1 - last])
+        report["duplicates"] = int(valid.sum() - len(rows))
+        if not len(rows):
+            return [], report
+
+        modal = modal[rows]
+        low = np.fmin(np.where(np.isnan(prices["min_price"][rows]), modal, prices["min_price"][rows]), modal)
+        high = np.fmax(np.where(np.isnan(prices["max_price"][rows]), modal, prices["max_price"][rows]), modal)
+        outlier = self._outliers(codes["commodity"][rows], modal)
+        report["outliers"] = int(outlier.sum())
+        report["kept"] = len(rows)
+
+        days = dates[rows].astype("datetime64[s]").tolist()
+        columns = [names[c][rows].tolist() for c in NAME_COLUMNS]
+        return [{
+            "commodity": commodity, "state": state or None, "district": district or None,
+            "market": market, "variety": variety or "Other",
+            "modal_price": m, "min_price": lo, "max_price": hi,
+            "arrival_date": day.replace(tzinfo=timezone.utc),
+            "outlier": flag,
+        } for commodity, state, district, market, variety, m, lo, hi, day, flag in zip(
+            *columns, modal.tolist(), low.tolist(), high.tolist(), days, outlier.tolist()
+        )], report
+
+    @staticmethod
+    def _outliers(groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Flags |value - group median| / (1.4826 * group MAD) > OUTLIER_LIMIT, per group, in two sorts."""
+        order = np.lexsort((values, groups))
+        sorted_groups, sorted_values = groups[order], values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        counts = np.diff(np.r_[starts, len(values)])
+
+        def group_medians(v):
+            return (v[starts + (counts - 1) // 2] + v[starts + counts // 2]) / 2
+
+        group_of_row = np.repeat(np.arange(len(starts)), counts)
+        medians = group_medians(sorted_values)
+        deviations = np.abs(sorted_values - medians[group_of_row])
+        mads = group_medians(deviations[np.lexsort((deviations, group_of_row))])
+        scale = np.maximum(MAD_SCALE * mads, MAD_FLOOR * medians)[group_of_row]
+        flagged_sorted = (counts[group_of_row] >= OUTLIER_MIN_GROUP) & (deviations > OUTLIER_LIMIT * scale)
+
+        flagged = np.empty(len(values), dtype=bool)
+        flagged[order] = flagged_sorted
+        return flagged
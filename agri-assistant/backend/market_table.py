@@ -0,0 +1,194 @@
+"""
+market_table.py — Krishi-Mithra Columnar Market Price Table
+============================================================
+Agmarknet records arrive as lists of string dicts. MarketTable stores them
+column-wise instead: commodity / state / district / market / variety are
+dictionary-encoded into int32 code arrays, prices are float64 (NaN = missing)
+and arrival dates are datetime64[D], so filter, sort and group-by run as
+vectorized NumPy operations and dicts are only built for the rows returned.
+"""
+
+import numpy as np
+
+from market_cleaning import parse_date, parse_price
+
+CATEGORICAL_COLUMNS = ("commodity", "state", "district", "market", "variety")
+PRICE_COLUMNS = ("modal_price", "min_price", "max_price")
+RECORD_FIELDS = CATEGORICAL_COLUMNS + PRICE_COLUMNS + ("arrival_date",)
+NAT = np.datetime64("NaT", "D")
+
+
+def _parse_date(value, _memo={}):
+    if not isinstance(value, str):  # datetimes read back from Mongo
+        day = parse_date(value)
+        return NAT if day is None else np.datetime64(day, "D")
+    # Dates repeat heavily across a dump, so parse each distinct string once
+    parsed = _memo.get(value)
+    if parsed is None:
+        day = parse_date(value)
+        parsed = NAT if day is None else np.datetime64(day, "D")
+        if len(_memo) < 10000:
+            _memo[value] = parsed
+    return parsed
+
+
+def _format_price(value: float) -> str:
+    if value != value:  # NaN
+        return "N/A"
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+class MarketTable:
+    """Column-oriented market price records with dictionary-encoded categoricals."""
+
+    def __init__(self, codes: dict, dictionaries: dict, prices: dict, arrival_date: np.ndarray):
+        self.codes = codes                # column -> int32 array of indexes into dictionaries[column]
+        self.dictionaries = dictionaries  # column -> list of distinct values (shared between slices)
+        self.prices = prices              # column -> float64 array
+        self.arrival_date = arrival_date  # datetime64[D] array
+        self._lower = {}                  # column -> lowercase dictionary, built on first filter
+
+    # ---------- construction ----------
+    @classmethod
+    def from_records(cls, records: list) -> "MarketTable":
+        n = len(records)
+        codes, dictionaries = {}, {}
+        for column in CATEGORICAL_COLUMNS:
+            lookup, values = {}, []
+            column_codes = np.empty(n, dtype=np.int32)
+            for i, r in enumerate(records):
+                value = r.get(column) or "Unknown"
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(values)
+                    values.append(value)
+                column_codes[i] = code
+            codes[column], dictionaries[column] = column_codes, values
+
+        prices = {column: np.array([parse_price(r.get(column)) for r in records], dtype=np.float64)
+                  for column in PRICE_COLUMNS}
+        dates = np.array([_parse_date(r.get("arrival_date")) for r in records], dtype="datetime64[D]")
+        return cls(codes, dictionaries, prices, dates)
+
+    def __len__(self):
+        return len(self.arrival_date)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays (dictionaries excluded; they are shared and small)."""
+        return (sum(a.nbytes for a in self.codes.values()) + sum(a.nbytes for a in self.prices.values())
+                + self.arrival_date.nbytes)
+
+    def take(self, index) -> "MarketTable":
+        """Rows at `index` (int array or boolean mask); dictionaries are shared, not copied."""
+        table = MarketTable({c: a[index] for c, a in self.codes.items()}, self.dictionaries,
+                            {c: a[index] for c, a in self.prices.items()}, self.arrival_date[index])
+        table._lower = self._lower
+        return table
+
+    # ---------- filter ----------
+    def mask(self, **equals) -> np.ndarray:
+        """Boolean row mask for case-insensitive equality on categorical columns; None values are ignored."""
+        mask = np.ones(len(self), dtype=bool)
+        for column, wanted in equals.items():
+            if wanted is None:
+                continue
+            lower = self._lower.get(column)
+            if lower is None:
+                lower = self._lower[column] = [v.lower() for v in self.dictionaries[column]]
+            wanted = str(wanted).strip().lower()
+            matching = [code for code, value in enumerate(lower) if value == wanted]
+            if len(matching) == 1:
+                mask &= self.codes[column] == matching[0]
+            else:
+                mask &= np.isin(self.codes[column], matching)
+        return mask
+
+    def where(self, **equals) -> "MarketTable":
+        return self.take(self.mask(**equals))
+
+    # ---------- sort ----------
+    def _sort_keys(self, by: str, index=None) -> np.ndarray:
+        if by == "arrival_date":
+            dates = self.arrival_date if index is None else self.arrival_date[index]
+            keys = dates.astype(np.int64).astype(np.float64)
+            keys[np.isnat(dates)] = np.nan
+            return keys
+        if by in self.prices:
+            return self.prices[by] if index is None else self.prices[by][index]
+        if by in self.codes:
+            # Rank dictionary values once, then sort codes by rank
+            ranks = np.empty(len(self.dictionaries[by]), dtype=np.float64)
+            ranks[np.argsort(np.array(self.dictionaries[by], dtype=object))] = np.arange(len(ranks))
+            return ranks[self.codes[by] if index is None else self.codes[by][index]]
+        raise KeyError(f"Unknown sort column: {by}")
+
+    def sort_index(self, by: str = "arrival_date", descending: bool = False, index=None) -> np.ndarray:
+        """
+        Stable row order by a price, date or categorical column; missing values always last.
+        With `index`, orders just those rows and returns them reordered.
+        """
+        keys = self._sort_keys(by, index)
+        order = np.argsort(-keys if descending else keys, kind="stable")  # NaN sorts last either way
+        return order if index is None else index[order]
+
+    def sort(self, by: str = "arrival_date", descending: bool = False) -> "MarketTable":
+        return self.take(self.sort_index(by, descending))
+
+    def select(self, sort: str | None = None, descending: bool = False,
+               start: int = 0, stop: int | None = None, **equals) -> np.ndarray:
+        """Filter -> sort -> slice in one pass over row indexes; only the selected rows are ever gathered."""
+        index = np.flatnonzero(self.mask(**equals))
+        if sort:
+            index = self.sort_index(sort, descending, index)
+        return index[start:stop]
+
+    # ---------- group-by ----------
+    def group_by(self, column: str, value: str = "modal_price") -> list:
+        """Per-group count / min / max / mean / median of a price column (rows with missing prices skipped)."""
+        values = self.prices[value]
+        present = ~np.isnan(values)
+        codes, values = self.codes[column][present], values[present]
+        if not len(values):
+            return []
+
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+        counts = ends - starts
+        sums = np.add.reduceat(values, starts)
+        mid = starts + (counts - 1) // 2
+        medians = (values[mid] + values[starts + counts // 2]) / 2
+
+        dictionary = self.dictionaries[column]
+        return [{
+            column: dictionary[codes[s]],
+            "count": int(c),
+            "min": float(values[s]),
+            "max": float(values[e - 1]),
+            "mean": round(float(total / c), 2),
+            "median": float(median),
+        } for s, e, c, total, median in zip(starts, ends, counts, sums, medians)]
+
+    # ---------- output ----------
+    def to_records(self, start: int = 0, stop: int | None = None) -> list:
+        """Rows [start:stop] as API-format dicts (prices as strings, ISO dates)."""
+        return self.records(np.arange(len(self))[start:stop])
+
+    def records(self, index, fields=None) -> list:
+        """API-format dicts for the rows at `index`, in that order; `fields` limits the columns built."""
+        fields = tuple(fields or RECORD_FIELDS)
+        columns = []
+        for field in fields:
+            if field in self.codes:
+                dictionary = self.dictionaries[field]
+                columns.append([dictionary[code] for code in self.codes[field][index].tolist()])
+            elif field in self.prices:
+                columns.append([_format_price(v) for v in self.prices[field][index].tolist()])
+            elif field == "arrival_date":
+                dates = np.datetime_as_string(self.arrival_date[index]).tolist()
+                columns.append(["N/A" if d == "NaT" else d for d in dates])
+            else:
+                raise KeyError(f"Unknown field: {field}")
+        return [dict(zip(fields, row)) for row in zip(*columns)]
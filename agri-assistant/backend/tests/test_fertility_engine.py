@@ -0,0 +1,76 @@
+"""The batch fertility engine must return exactly what the scalar functions return, sample for sample."""
+
+import os
+import random
+
+import pytest
+
+from crop_registry import CropRegistry
+from fertility_engine import (analyze_fertility, fertility_batch, fertilizer_batch, get_fertilizer_recommendation,
+                              parse_samples)
+
+REGISTRY = CropRegistry.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "crops.json"))
+FIELDS = ("n", "p", "k", "ph", "organic_matter")
+DEFAULTS = {**dict.fromkeys(FIELDS, 0), "crop": "rice"}
+UNKNOWN_CROPS = ["dragonfruit", "", "  ", "Rice Paddy Extra", "123"]
+
+
+def crop_names(registry):
+    names = []
+    for crop in registry.crops.values():
+        names += [crop.key, crop.key.upper(), f"  {crop.key.title()} "] + list(crop.aliases)
+    return names
+
+
+def random_sample(rng, names):
+    sample = {
+        "n": rng.choice([rng.uniform(0, 400), rng.randint(0, 400), 100, 99.99, 0]),
+        "p": rng.choice([rng.uniform(0, 120), rng.randint(0, 120), 20, 19.95]),
+        "k": rng.choice([rng.uniform(0, 400), rng.randint(0, 400), 100]),
+        "ph": rng.choice([rng.uniform(3, 10), 5.5, 8.0, 8.01]),
+        "organic_matter": rng.uniform(0, 5),
+        "crop": rng.choice(names + UNKNOWN_CROPS),
+    }
+    for field in list(sample):
+        if rng.random() < 0.1:
+            del sample[field]
+    return sample
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_scalar(seed):
+    rng = random.Random(seed)
+    names = crop_names(REGISTRY)
+    samples = [random_sample(rng, names) for _ in range(2000)]
+
+    rows, values, crops, results = parse_samples(samples, FIELDS, DEFAULTS)
+    assert len(rows) == len(samples)
+    n, p, k, ph = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+    levels = fertility_batch(n, p, k, ph)
+    plans = fertilizer_batch(n, p, k, crops, REGISTRY)
+
+    for i, sample in enumerate(samples):
+        s = {**DEFAULTS, **sample}
+        assert levels[i] == analyze_fertility(float(s["n"]), float(s["p"]), float(s["k"]), float(s["ph"])), sample
+        expected = get_fertilizer_recommendation(float(s["n"]), float(s["p"]), float(s["k"]), s["crop"], REGISTRY)
+        assert plans[i] == expected, sample
+        assert [type(plans[i].get(q)) for q in ("urea_kg", "dap_kg", "mop_kg")] == \
+               [type(expected.get(q)) for q in ("urea_kg", "dap_kg", "mop_kg")], sample
+
+
+def test_unknown_crops_report_errors():
+    plans = fertilizer_batch([50.0] * len(UNKNOWN_CROPS), [10.0] * len(UNKNOWN_CROPS), [50.0] * len(UNKNOWN_CROPS),
+                             UNKNOWN_CROPS, REGISTRY)
+    assert plans == [{"error": f"Crop '{crop}' not found in database."} for crop in UNKNOWN_CROPS]
+
+
+def test_strict_parse_rejects_missing_and_bad_fields():
+    samples = [{"n": 1, "p": 1, "k": 1, "crop": "rice"}, {"n": 1, "p": 1, "crop": "rice"},
+               {"n": 1, "p": 1, "k": 1}, {"n": "x", "p": 1, "k": 1, "crop": "rice"},
+               {"n": float("nan"), "p": 1, "k": 1, "crop": "rice"}, "not a dict"]
+    rows, values, crops, results = parse_samples(samples, ("n", "p", "k"))
+    assert rows == [0] and crops == ["rice"] and values.shape == (1, 3)
+    assert results[1] == results[2] == {"error": "Missing N, P, K, or crop."}
+    assert results[3] == {"error": "n, p, k must be numbers."}
+    assert results[4] == {"error": "n, p, k must be finite numbers."}
+    assert results[5] == {"error": "Sample must be an object."}
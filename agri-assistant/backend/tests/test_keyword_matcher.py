@@ -0,0 +1,85 @@
+"""KeywordMatcher against a brute-force reference on a generated vocabulary of a few thousand terms."""
+
+import os
+import random
+
+import pytest
+
+from keyword_matcher import KeywordMatcher, _is_boundary
+
+SYLLABLES = ["ka", "ro", "mi", "zol", "fen", "thi", "am", "ox", "cyp", "per", "neem", "di", "meth", "in", "ate", "pro"]
+FILLER = ["apply", "the", "spray", "at", "per", "litre", "and", "or", "on", "leaves", "dose", "ml", "water", "kg"]
+
+
+def generated_vocabulary(rng, size):
+    terms = set()
+    while len(terms) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+        shape = rng.random()
+        if shape < 0.2:
+            word = f"{word} {''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))}"  # "neem oil"
+        elif shape < 0.25:
+            word = f"{rng.randint(1, 99)},{rng.randint(1, 9)}-{word}"  # "2,4-d"
+        elif shape < 0.3:
+            word = f"{word} {rng.randint(1, 80)}% ec"  # "chlorpyrifos 20% ec"
+        terms.add(word)
+    terms = sorted(terms)
+    # Prefix chains like "neem" / "neem oil" / "neem oil extract" exercise leftmost-longest
+    for term in rng.sample(terms, size // 20):
+        terms.append(f"{term} {rng.choice(SYLLABLES)}")
+    return {term: [f"tag{i % 97}"] for i, term in enumerate(terms)}
+
+
+def random_text(rng, terms, words):
+    parts = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < 0.3:
+            parts.append(rng.choice(terms).upper() if rng.random() < 0.2 else rng.choice(terms))
+        elif roll < 0.35:
+            parts.append(rng.choice("x2") + rng.choice(terms))  # embedded in a longer word: no match
+        else:
+            parts.append(rng.choice(FILLER))
+        parts.append(rng.choice([" ", "  ", ", ", ". ", "\n", " (", ") "]))
+    return "".join(parts)
+
+
+def brute_force_find(term_tags, text):
+    text = " ".join(text.lower().split())
+    raw = []
+    for term in term_tags:
+        start = text.find(term)
+        while start != -1:
+            if _is_boundary(text, start - 1) and _is_boundary(text, start + len(term)):
+                raw.append((start, len(term), term))
+            start = text.find(term, start + 1)
+    raw.sort(key=lambda m: (m[0], -m[1]))
+    matches, covered_until = [], 0
+    for start, length, term in raw:
+        if start >= covered_until:
+            matches.append((term, start))
+            covered_until = start + length
+    return matches
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_generated_vocabulary_matches_brute_force(seed):
+    rng = random.Random(seed)
+    vocab = generated_vocabulary(rng, 4000)
+    matcher = KeywordMatcher(vocab)
+    terms = list(matcher.term_tags)
+    for _ in range(40):
+        text = random_text(rng, terms, 120)
+        assert matcher.find(text) == brute_force_find(matcher.term_tags, text)
+
+
+def test_tag_counts_follow_matches():
+    matcher = KeywordMatcher({"neem": ["organic"], "neem oil": ["organic", "oil"], "oil": ["oil"]})
+    assert matcher.find("Spray NEEM  oil, then neem; foil and neemoil do not count") == [("neem oil", 6), ("neem", 21)]
+    assert matcher.tag_counts("neem oil and neem") == {"organic": 2, "oil": 1}
+
+
+def test_shipped_vocabulary_loads():
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "agri_keywords.json")
+    matcher = KeywordMatcher.from_file(path)
+    assert matcher.term_tags and matcher.find("") == []
@@ -0,0 +1,32 @@
+"""MarketCleaner name canonicalization with the shipped alias table."""
+
+import os
+
+import pytest
+
+from market_cleaning import MarketCleaner
+
+CLEANER = MarketCleaner.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "market_aliases.json"))
+
+
+@pytest.mark.parametrize("column, raw, canonical", [
+    ("market", "PUNE APMC", "Pune APMC"),
+    ("market", "pune apmc", "Pune APMC"),
+    ("market", "Pune Apmc", "Pune APMC"),        # stored before the acronym list existed
+    ("market", "VASHI(APMC)", "Vashi(APMC)"),
+    ("state", "KA", "KA"),
+    ("variety", "FAQ", "FAQ"),
+    ("market", "NASHIK", "Nashik"),
+    ("market", "Lasalgaon Vinchur", "Lasalgaon Vinchur"),
+    ("commodity", "PADDY(DHAN)(COMMON)", "Rice"),  # aliases win over casing
+    ("state", "nct of delhi", "Delhi"),
+    ("market", "  n/a ", ""),
+])
+def test_canonical_name(column, raw, canonical):
+    assert CLEANER.canonical_name(column, raw) == canonical
+
+
+def test_acronyms_change_the_fingerprint():
+    aliases = {"commodity": {"paddy": "Rice"}}
+    assert MarketCleaner(aliases).fingerprint != MarketCleaner({**aliases, "acronyms": ["APMC"]}).fingerprint
+    assert MarketCleaner(aliases).canonical_name("market", "PUNE APMC") == "Pune Apmc"
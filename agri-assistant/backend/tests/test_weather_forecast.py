@@ -0,0 +1,67 @@
+"""aggregate_forecast on an OpenWeatherMap 5-day / 3-hour payload for Pune (city.timezone = +05:30)."""
+
+import copy
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import pytest
+
+from weather_forecast import aggregate_forecast
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "owm_forecast_pune.json"), encoding="utf-8") as f:
+    PAYLOAD = json.load(f)
+
+
+def local_days(payload):
+    """Reference grouping: entries by calendar date at the city's UTC offset."""
+    offset = (payload.get("city") or {}).get("timezone", 0) or 0
+    days = defaultdict(list)
+    for entry in payload["list"]:
+        days[datetime.fromtimestamp(entry["dt"] + offset, timezone.utc).strftime("%Y-%m-%d")].append(entry)
+    return dict(sorted(days.items()))
+
+
+def with_offset(seconds):
+    payload = copy.deepcopy(PAYLOAD)
+    if seconds is None:
+        del payload["city"]
+    else:
+        payload["city"]["timezone"] = seconds
+    return payload
+
+
+@pytest.mark.parametrize("offset", [19800, 0, -18000, 34200, None])
+def test_buckets_by_city_local_day(offset):
+    payload = with_offset(offset)
+    expected = local_days(payload)
+    forecast = aggregate_forecast(payload, days=10)
+
+    assert [d["date"] for d in forecast] == list(expected)
+    for day, (date, entries) in zip(forecast, expected.items()):
+        conditions = Counter(e["weather"][0]["description"] for e in entries)
+        dominant = conditions.most_common(1)[0][0]
+        assert day["day"] == datetime.strptime(date, "%Y-%m-%d").strftime("%A")
+        assert day["min_temp"] == round(min(e["main"]["temp_min"] for e in entries))
+        assert day["max_temp"] == round(max(e["main"]["temp_max"] for e in entries))
+        assert day["condition"] == dominant.title()
+        assert day["icon"] == next(e["weather"][0]["icon"] for e in entries if e["weather"][0]["description"] == dominant)
+        assert day["rain_mm"] == pytest.approx(round(sum((e.get("rain") or {}).get("3h", 0) for e in entries), 1))
+
+
+def test_ist_evening_entry_starts_the_next_local_day():
+    # 21:00 UTC is 02:30 the next morning in Pune, so that entry belongs to the next IST day
+    after_midnight = next(e for e in PAYLOAD["list"] if e["dt_txt"].endswith("21:00:00"))
+    forecast = aggregate_forecast(PAYLOAD, days=10)
+    utc_date = after_midnight["dt_txt"][:10]
+    ist_date = datetime.fromtimestamp(after_midnight["dt"] + 19800, timezone.utc).strftime("%Y-%m-%d")
+    assert ist_date > utc_date
+    assert ist_date in [d["date"] for d in forecast]
+    assert aggregate_forecast(PAYLOAD, days=10) != aggregate_forecast(with_offset(0), days=10)
+
+
+def test_limits_to_requested_days():
+    assert len(aggregate_forecast(PAYLOAD)) == 5
+    assert len(aggregate_forecast(PAYLOAD, days=2)) == 2
+    assert aggregate_forecast({"list": []}) == []
@@ -0,0 +1,51 @@
+"""
+weather_forecast.py — Krishi-Mithra Daily Forecast Reducer
+===========================================================
+Folds OpenWeatherMap's 5-day / 3-hour forecast payload into one row per
+local calendar day of the forecast city (min / max temperature, dominant
+condition and its icon, rain total) in a single pass over the list.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def aggregate_forecast(data, days=5):
+    """
+    Single-pass reducer over OpenWeatherMap's 3-hourly forecast list.
+    Buckets entries by the city's local day (using city.timezone, in seconds
+    from UTC) and returns per-day min/max temp, dominant condition and rain total.
+    """
+    tz_offset = (data.get("city") or {}).get("timezone", 0) or 0
+    buckets = {}  # local day number -> running aggregate
+    for entry in data.get("list", []):
+        day_number = (entry["dt"] + tz_offset) // 86400
+        main, weather = entry["main"], entry["weather"][0]
+        description = weather["description"]
+        bucket = buckets.get(day_number)
+        if bucket is None:
+            bucket = buckets[day_number] = {
+                "min_temp": main["temp_min"], "max_temp": main["temp_max"],
+                "conditions": Counter(), "icons": {}, "rain": 0.0,
+            }
+        else:
+            if main["temp_min"] < bucket["min_temp"]:
+                bucket["min_temp"] = main["temp_min"]
+            if main["temp_max"] > bucket["max_temp"]:
+                bucket["max_temp"] = main["temp_max"]
+        bucket["conditions"][description] += 1
+        bucket["icons"].setdefault(description, weather["icon"])
+        bucket["rain"] += (entry.get("rain") or {}).get("3h", 0)
+
+    final_forecast = []
+    for day_number in sorted(buckets)[:days]:
+        bucket = buckets[day_number]
+        day = datetime.fromtimestamp(day_number * 86400, timezone.utc)
+        condition = bucket["conditions"].most_common(1)[0][0]
+        final_forecast.append({
+            "day": day.strftime('%A'), "date": day.strftime('%Y-%m-%d'),
+            "min_temp": round(bucket["min_temp"]), "max_temp": round(bucket["max_temp"]),
+            "condition": condition.title(), "icon": bucket["icons"][condition],
+            "rain_mm": round(bucket["rain"], 1),
+        })
+    return final_forecast